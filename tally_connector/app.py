@@ -1,16 +1,25 @@
 import re
 import io
-import pdfplumber
-import pandas as pd
 from datetime import datetime
-import tkinter as tk
-from tkinter import filedialog, messagebox
 import sys
 import os
 import traceback
+import hashlib
+
+from lazy_import import LazyModule
+
+# Heavy dependencies are imported on first use, so importing this module
+# (e.g. from flask_server) stays cheap.
+pdfplumber = LazyModule("pdfplumber")
+pd = LazyModule("pandas")
+tk = LazyModule("tkinter")
+filedialog = LazyModule("tkinter.filedialog")
+messagebox = LazyModule("tkinter.messagebox")
 
 # For more flexible date parsing (handles many formats)
-from dateutil import parser as dateparser
+dateparser = LazyModule("dateutil.parser")
+
+from exporter import export_transactions, statement_rows, STATEMENT_COLUMNS
 
 ###############################################################################
 #                             PATTERNS & CONSTANTS
@@ -29,6 +38,116 @@ OPENING_BALANCE_PATTERNS = [
     re.compile(r'^\s*balance brought forward\s*$', re.IGNORECASE),
 ]
 
+# Bump whenever parsing output changes, so cached statements are re-parsed
+PARSER_VERSION = "1"
+
+# Column separator for text lines: runs of 2+ spaces
+COLUMN_SPLIT_RE = re.compile(r'\s{2,}')
+
+LINE_FOOTER = "footer"
+LINE_OPENING_BALANCE = "opening_balance"
+
+# Inline global flags such as "(?i)" are only valid at the very start of a
+# regex, so they are lifted off each pattern and re-applied as a scoped group
+_GLOBAL_FLAGS_RE = re.compile(r'^\(\?[aiLmsux]+\)')
+# Numbered backreferences would point at the wrong group once combined
+_BACKREFERENCE_RE = re.compile(r'\\[1-9]|\(\?P=|\\g<\d')
+_SCOPED_FLAGS = ((re.ASCII, "a"), (re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"), (re.VERBOSE, "x"))
+
+class LineClassifier:
+    """
+    Classifies a line as footer / opening balance (or any registered kind) in
+    a single regex pass. All patterns are combined into one compiled
+    alternation with a named group per pattern; the matching group's name
+    tells which kind the line is. Earlier registered patterns win. Patterns
+    that cannot be combined (named groups clashing, backreferences) are
+    matched one by one instead.
+    """
+    def __init__(self):
+        self._patterns = []  # (kind, compiled pattern)
+        self._group_kinds = {}
+        self._combined = None
+        self._separate = None
+        self.signature = ""
+
+    def register(self, kind: str, pattern):
+        """
+        Register a pattern (string or compiled) for the given line kind.
+        Matching ignores case. Raises re.error for an invalid pattern.
+        """
+        if isinstance(pattern, re.Pattern):
+            pattern = re.compile(pattern.pattern, pattern.flags | re.IGNORECASE)
+        else:
+            pattern = re.compile(pattern, re.IGNORECASE)
+        self._patterns.append((kind, pattern))
+        self._combined = None
+
+    @staticmethod
+    def _scoped_source(pattern):
+        """pattern's source with its flags as a scoped (?flags:...) group."""
+        source = pattern.pattern
+        while True:
+            m = _GLOBAL_FLAGS_RE.match(source)
+            if m is None:
+                break
+            source = source[m.end():]
+        letters = "".join(letter for flag, letter in _SCOPED_FLAGS if pattern.flags & flag)
+        return f"(?{letters}:{source})" if letters else f"(?:{source})"
+
+    def _compile(self):
+        self._group_kinds = {}
+        self._separate = None
+        self.signature = hashlib.sha1(
+            "\n".join(f"{k}:{p.flags}:{p.pattern}" for k, p in self._patterns).encode("utf-8")
+        ).hexdigest()[:12]
+        parts = []
+        for idx, (kind, pattern) in enumerate(self._patterns):
+            if _BACKREFERENCE_RE.search(pattern.pattern):
+                break
+            group = f"p{idx}"
+            self._group_kinds[group] = kind
+            parts.append(f"(?P<{group}>{self._scoped_source(pattern)})")
+        else:
+            try:
+                self._combined = re.compile("|".join(parts) or r"(?!)")
+                return
+            except re.error:
+                pass
+        self._combined = False
+        self._separate = list(self._patterns)
+
+    def classify(self, line: str):
+        """Return the kind of the first matching pattern, or None."""
+        if self._combined is None:
+            self._compile()
+        if self._separate is not None:
+            for kind, pattern in self._separate:
+                if pattern.match(line):
+                    return kind
+            return None
+        m = self._combined.match(line)
+        if m is None:
+            return None
+        return self._group_kinds[m.lastgroup]
+
+LINE_CLASSIFIER = LineClassifier()
+for _pat in FOOTER_PATTERNS:
+    LINE_CLASSIFIER.register(LINE_FOOTER, _pat)
+for _pat in OPENING_BALANCE_PATTERNS:
+    LINE_CLASSIFIER.register(LINE_OPENING_BALANCE, _pat)
+
+def register_line_pattern(kind: str, pattern):
+    """
+    Register a bank-specific pattern, e.g.
+    register_line_pattern(LINE_FOOTER, r'.*this is a computer generated advice.*')
+    """
+    LINE_CLASSIFIER.register(kind, pattern)
+
+def parser_version() -> str:
+    """PARSER_VERSION plus a fingerprint of the registered line patterns."""
+    LINE_CLASSIFIER.classify("")  # make sure the signature is current
+    return f"{PARSER_VERSION}-{LINE_CLASSIFIER.signature}"
+
 # Possible synonyms for "Debit" or "Credit" columns
 DEBIT_SYNONYMS = ["debit", "dr", "withdrawal"]
 CREDIT_SYNONYMS = ["credit", "cr", "deposit", "receipt", "payment"]
@@ -123,7 +242,7 @@ def attempt_line_extraction_space_splitting(pdf_path: str) -> list[list[str]]:
                     ln = ln.strip()
                     if ln and not is_footer_line(ln):
                         # split on 2+ spaces
-                        cols = re.split(r'\s{2,}', ln)
+                        cols = COLUMN_SPLIT_RE.split(ln)
                         cleaned = [c.strip() for c in cols if c.strip()]
                         if cleaned:
                             rows.append(cleaned)
@@ -132,11 +251,7 @@ def attempt_line_extraction_space_splitting(pdf_path: str) -> list[list[str]]:
     return rows
 
 def is_footer_line(line: str) -> bool:
-    low = line.lower().strip()
-    for pat in FOOTER_PATTERNS:
-        if pat.match(low):
-            return True
-    return False
+    return LINE_CLASSIFIER.classify(line) == LINE_FOOTER
 
 def extract_pdf_data(pdf_path: str) -> list[list[str]]:
     """
@@ -178,11 +293,7 @@ def parse_date_or_none(text: str):
 
 def looks_like_strict_opening_balance(line_text: str) -> bool:
     # For skipping entire row if it EXACTLY matches
-    low = line_text.lower().strip()
-    for pat in OPENING_BALANCE_PATTERNS:
-        if pat.match(low):
-            return True
-    return False
+    return LINE_CLASSIFIER.classify(line_text) == LINE_OPENING_BALANCE
 
 def identify_columns(rows: list[list[str]]) -> dict:
     """
@@ -326,7 +437,7 @@ def parse_rows_into_transactions(rows: list[list[str]], col_map: dict) -> list[d
     bal_col = col_map.get("balance_col")
 
     for row in rows:
-        joined_line = " ".join(row).strip().lower()
+        joined_line = " ".join(row)
         if looks_like_strict_opening_balance(joined_line):
             # skip entire row
             continue
@@ -498,102 +609,165 @@ def running_balance_and_type(transactions: list[dict]):
 ###############################################################################
 #            STEP 6: EXPORT TO EXCEL
 ###############################################################################
-def export_to_excel(transactions: list[dict], output_file="output.xlsx"):
-    for i, txn in enumerate(transactions, start=1):
-        txn["Sr No"] = i
-
-    df = pd.DataFrame(transactions)
-
-    col_order = ["Sr No", "Date", "Description", "Type", "Amount", "Balance"]
-    for c in col_order:
-        if c not in df.columns:
-            df[c] = None
-
-    df = df[col_order]
+def transactions_to_dataframe(transactions: list[dict]) -> "pd.DataFrame":
+    """
+    Build the export DataFrame (Sr No, Date, Description, Type, Amount, Balance)
+    from parsed transactions. The transactions are not modified.
+    """
+    return pd.DataFrame(list(statement_rows(transactions)), columns=STATEMENT_COLUMNS)
 
-    # Convert Date => date only
-    if not pd.api.types.is_datetime64_any_dtype(df["Date"]):
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-    df["Date"] = df["Date"].dt.date
+def export_to_excel(transactions: list[dict], output_file="output.xlsx", fmt=None):
+    """
+    Export transactions through the streaming export layer. The format follows
+    the file extension (.xlsx, .csv, .parquet) unless fmt is given.
+    """
+    return export_transactions(transactions, output_file, fmt)
 
-    df.to_excel(output_file, index=False)
-    return output_file
+def transactions_to_records(transactions: list[dict]) -> list[dict]:
+    """
+    Convert parsed transactions into the row format expected by
+    LocalDbConnector.upload_excel_local (transaction_date, transaction_type,
+    description, amount), so they can be stored without an Excel round trip.
+    """
+    records = []
+    for txn in transactions:
+        txn_date = txn.get("Date")
+        txn_type = txn.get("Type")
+        records.append({
+            "transaction_date": txn_date.isoformat() if txn_date else None,
+            "transaction_type": txn_type.lower() if txn_type else None,
+            "description": txn.get("Description", ""),
+            "amount": txn.get("Amount"),
+            "balance": txn.get("Balance"),
+        })
+    return records
 
 ###############################################################################
 #                        MAIN PIPELINE
 ###############################################################################
-def process_pdf_file(pdf_path: str):
-    """Processing PDF with optimized performance"""
-    suppress_ui = "flask_server.py" in sys.argv[0]
-    try:
-        print(f"[DEBUG] Processing PDF: {pdf_path}")
+class StatementParseError(Exception):
+    """Raised when a PDF statement cannot be turned into transactions."""
+    def __init__(self, title, message):
+        super().__init__(message)
+        self.title = title
 
-        if not os.path.exists(pdf_path):
-            print("[❌ Error] PDF file not found:", pdf_path)
-            if not suppress_ui:
-                messagebox.showerror("Parsing Error", "PDF file not found.")
-            return
+def extract_statement_rows(pdf_path: str) -> list[list[str]]:
+    """
+    Extract raw rows from the PDF: tables where a page has them, otherwise
+    text lines split on runs of 2+ spaces.
+    """
+    # Extract data with optimized settings
+    with pdfplumber.open(pdf_path) as pdf:
+        # Process pages in chunks for better memory usage
+        rows = []
+        for page in pdf.pages:
+            # Try table extraction first (fastest)
+            tables = page.extract_tables()
+            if tables:
+                for table in tables:
+                    if table and any(cell for cell in table[0] if cell):  # Check if table has content
+                        rows.extend([[(cell or "").strip() for cell in row] for row in table])
+                continue  # Skip to next page if we found tables
+
+            # If no tables, try line extraction (faster than bounding box)
+            text = page.extract_text()
+            if text:
+                for line in text.split("\n"):
+                    line = line.strip()
+                    if line and not is_footer_line(line):
+                        cols = COLUMN_SPLIT_RE.split(line)
+                        cleaned = [c.strip() for c in cols if c.strip()]
+                        if cleaned:
+                            rows.append(cleaned)
+    return rows
 
-        # Extract data with optimized settings
-        with pdfplumber.open(pdf_path) as pdf:
-            # Process pages in chunks for better memory usage
-            rows = []
-            for page in pdf.pages:
-                # Try table extraction first (fastest)
-                tables = page.extract_tables()
-                if tables:
-                    for table in tables:
-                        if table and any(cell for cell in table[0] if cell):  # Check if table has content
-                            rows.extend([[(cell or "").strip() for cell in row] for row in table])
-                    continue  # Skip to next page if we found tables
+_statement_cache = None
 
-                # If no tables, try line extraction (faster than bounding box)
-                text = page.extract_text()
-                if text:
-                    for line in text.split("\n"):
-                        line = line.strip()
-                        if line and not is_footer_line(line):
-                            cols = re.split(r'\s{2,}', line)
-                            cleaned = [c.strip() for c in cols if c.strip()]
-                            if cleaned:
-                                rows.append(cleaned)
-
-        if not rows:
-            print("[❌ Error] No rows extracted.")
-            if not suppress_ui:
-                messagebox.showerror("Parsing Error", "No data could be extracted from PDF.")
-            return
+def get_statement_cache():
+    """Process-wide StatementCache, created on first use."""
+    global _statement_cache
+    if _statement_cache is None:
+        from statement_cache import StatementCache
+        _statement_cache = StatementCache()
+    return _statement_cache
 
-        # Process extracted data
-        col_map = identify_columns(rows)
-        if not col_map:
-            print("[❌ Error] Failed to identify columns.")
-            if not suppress_ui:
-                messagebox.showerror("Column Error", "Failed to identify columns.")
-            return
+def parse_pdf_transactions(pdf_path: str, use_cache=True) -> list[dict]:
+    """
+    Run the full parsing pipeline and return the transactions in memory.
+    Results are cached by the PDF's content hash and parser_version(), so an
+    identical file is returned from a single cache lookup.
+    Raises StatementParseError if the statement cannot be parsed.
+    """
+    if not os.path.exists(pdf_path):
+        raise StatementParseError("Parsing Error", "PDF file not found.")
+
+    cache = get_statement_cache() if use_cache else None
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(pdf_path, parser_version())
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print(f"[DEBUG] Statement cache hit: {pdf_path}")
+            return cached[2]
+
+    rows = extract_statement_rows(pdf_path)
+    if not rows:
+        raise StatementParseError("Parsing Error", "No data could be extracted from PDF.")
 
-        transactions = parse_rows_into_transactions(rows, col_map)
-        if not transactions:
-            print("[❌ Error] No transactions found.")
-            if not suppress_ui:
-                messagebox.showerror("No Transactions", "No valid transactions found.")
-            return
+    # Process extracted data
+    col_map = identify_columns(rows)
+    if not col_map:
+        raise StatementParseError("Column Error", "Failed to identify columns.")
 
-        # Order and balance processing
-        fix_order_if_reversed(transactions)
-        running_balance_and_type(transactions)
+    transactions = parse_rows_into_transactions(rows, col_map)
+    if not transactions:
+        raise StatementParseError("No Transactions", "No valid transactions found.")
 
-        # Export to Excel
-        out_file = export_to_excel(transactions, "output.xlsx")
-        print(f"[✓] Data exported to {out_file}")
-        if not suppress_ui:
-            messagebox.showinfo("Success", f"Data exported to {out_file}")
+    # Order and balance processing
+    fix_order_if_reversed(transactions)
+    running_balance_and_type(transactions)
 
+    if cache is not None:
+        cache.put(cache_key, rows, col_map, transactions)
+    return transactions
+
+def import_pdf_to_local_db(local_db, email, company, bank_account, pdf_path: str) -> str:
+    """
+    Parse a PDF statement and store its transactions straight into the local
+    temporary_transactions table. Returns the upload_id.
+    """
+    transactions = parse_pdf_transactions(pdf_path)
+    records = transactions_to_records(transactions)
+    return local_db.upload_excel_local(email, company, bank_account, records, os.path.basename(pdf_path))
+
+def process_pdf_file(pdf_path: str, output_file="output.xlsx"):
+    """
+    Processing PDF with optimized performance.
+    Returns the parsed transactions (or None on failure). Pass
+    output_file=None to skip the Excel export.
+    """
+    suppress_ui = "flask_server.py" in sys.argv[0]
+    try:
+        print(f"[DEBUG] Processing PDF: {pdf_path}")
+        transactions = parse_pdf_transactions(pdf_path)
+
+        if output_file:
+            out_file = export_to_excel(transactions, output_file)
+            print(f"[✓] Data exported to {out_file}")
+            if not suppress_ui:
+                messagebox.showinfo("Success", f"Data exported to {out_file}")
+        return transactions
+
+    except StatementParseError as e:
+        print(f"[❌ Error] {e}")
+        if not suppress_ui:
+            messagebox.showerror(e.title, str(e))
     except Exception as e:
         print(f"[❌ Critical Error in PDF Processing]: {e}")
         traceback.print_exc()
         if not suppress_ui:
             messagebox.showerror("Error", f"Failed to process PDF: {str(e)}")
+    return None
 
 ###############################################################################
 #                         TKINTER UI (Optional)
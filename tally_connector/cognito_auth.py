@@ -6,8 +6,9 @@ from botocore.exceptions import ClientError
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 class CognitoAuth:
-    def __init__(self, user_pool_id, client_id, region):
-        self.client = boto3.client('cognito-idp', region_name=region)
+    def __init__(self, user_pool_id, client_id, region, client=None):
+        # client can be injected (e.g. a local stub) instead of the boto3 client
+        self.client = client or boto3.client('cognito-idp', region_name=region)
         self.user_pool_id = user_pool_id
         self.client_id = client_id
 
@@ -26,6 +27,21 @@ class CognitoAuth:
             logging.error("Cognito sign in error: %s", e.response['Error']['Message'])
             return False, None
 
+    def refresh(self, refresh_token):
+        """Get new ID/access tokens with REFRESH_TOKEN_AUTH (no password needed)."""
+        try:
+            response = self.client.initiate_auth(
+                ClientId=self.client_id,
+                AuthFlow='REFRESH_TOKEN_AUTH',
+                AuthParameters={
+                    'REFRESH_TOKEN': refresh_token
+                }
+            )
+            return True, response
+        except ClientError as e:
+            logging.error("Cognito refresh error: %s", e.response['Error']['Message'])
+            return False, None
+
     def sign_up(self, username, password):
         try:
             response = self.client.sign_up(
@@ -10,7 +10,20 @@ AWS_DB_URL = os.getenv("AWS_DB_URL")  # e.g., "postgresql+psycopg2://user:passwo
 if not AWS_DB_URL:
     raise ValueError("AWS_DB_URL environment variable not set")
 
+# Connection pool settings for the AWS database (see db_connector.get_engine)
+AWS_DB_POOL_SIZE = int(os.getenv("AWS_DB_POOL_SIZE", "5"))
+AWS_DB_MAX_OVERFLOW = int(os.getenv("AWS_DB_MAX_OVERFLOW", "5"))
+AWS_DB_POOL_RECYCLE = int(os.getenv("AWS_DB_POOL_RECYCLE", "1800"))  # seconds
+AWS_DB_POOL_PRE_PING = os.getenv("AWS_DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+AWS_DB_STATEMENT_TIMEOUT_MS = int(os.getenv("AWS_DB_STATEMENT_TIMEOUT_MS", "30000"))
+# "always" runs create_all on every connector, "once" skips it after the schema
+# has been verified for this database, "never" skips it entirely.
+AWS_DB_SCHEMA_CHECK = os.getenv("AWS_DB_SCHEMA_CHECK", "once").lower()
+
 TALLY_URL = os.getenv("TALLY_URL", "http://localhost:9000")
+# Tally instances for the multi-company export, as comma separated
+# "url=max concurrent requests" pairs, e.g. "http://localhost:9000=1,http://10.0.0.5:9000=2"
+TALLY_ENDPOINTS = os.getenv("TALLY_ENDPOINTS", f"{TALLY_URL}=1")
 
 COGNITO_USER_POOL_ID = os.getenv("COGNITO_USER_POOL_ID")
 COGNITO_CLIENT_ID = os.getenv("COGNITO_CLIENT_ID")
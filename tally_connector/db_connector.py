@@ -1,26 +1,212 @@
 import datetime
+import hashlib
 import logging
-from sqlalchemy import create_engine, Table, Column, Integer, String, MetaData, DateTime, JSON, select, update
+import os
+import sys
+import argparse
+import threading
+from sqlalchemy import create_engine, inspect, Table, Column, Integer, String, MetaData, DateTime, JSON, Index, select, update, text
 from sqlalchemy.exc import SQLAlchemyError
-from config import AWS_DB_URL, get_company_table_name
+from lookup_cache import lookup_cache
+from telemetry import instrument_engine
+from tally_records import as_ledger_table, format_amount
+from config import (
+    AWS_DB_URL, get_company_table_name,
+    AWS_DB_POOL_SIZE, AWS_DB_MAX_OVERFLOW, AWS_DB_POOL_RECYCLE, AWS_DB_POOL_PRE_PING,
+    AWS_DB_STATEMENT_TIMEOUT_MS, AWS_DB_SCHEMA_CHECK
+)
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+SCHEMA_MARKER_FILE = os.getenv("AWS_DB_SCHEMA_MARKER", ".aws_schema_verified")
+
+# One engine (and connection pool) per database URL and pool settings, shared
+# by every AwsDbConnector in the process.
+_engines = {}
+_engines_lock = threading.Lock()
+# Schema fingerprints already verified in this process
+_verified_schemas = set()
+# (db_url, company_id) and (db_url, user_email, company_id) known to exist, so
+# repeated syncs skip the database entirely
+_known_companies = set()
+_known_mappings = set()
+# Database URLs whose user_companies table still lacks the unique index
+_unindexed_mappings = set()
+
+# Unique index backing the ON CONFLICT upsert of user-company mappings. A
+# database created before it needs the duplicates left by the old
+# select-then-insert code removed first. That deletes shared data, so it is a
+# one-off admin step (python db_connector.py --migrate-user-companies), never
+# something a client does on start.
+USER_COMPANIES_UNIQUE_INDEX = "uq_user_companies_user_company"
+USER_COMPANIES_DEDUPLICATE = (
+    "DELETE FROM user_companies WHERE id NOT IN "
+    "(SELECT MIN(id) FROM user_companies GROUP BY user_email, company_id)"
+)
+USER_COMPANIES_CREATE_INDEX = (
+    f"CREATE UNIQUE INDEX IF NOT EXISTS {USER_COMPANIES_UNIQUE_INDEX} "
+    "ON user_companies (user_email, company_id)"
+)
+
+# One round trip license check for Postgres: ensures the user row exists,
+# registers the hardware on first use, records a mismatching machine in
+# detectedhardwareid, and reports the outcome. Data-modifying CTEs all see the
+# snapshot taken before the statement, so "existing" is the pre-check state.
+LICENSE_CHECK_SQL = """
+WITH new_user AS (
+    INSERT INTO users (cognitoid, username, email, password, "createdAt", "updatedAt")
+    VALUES (:email, :email, :email, 'test', :now, :now)
+    ON CONFLICT (email) DO NOTHING
+),
+existing AS (
+    SELECT id, "hardwareId", "validTill", status FROM licenses
+    WHERE "userId" = :email ORDER BY id LIMIT 1
+),
+created AS (
+    INSERT INTO licenses ("licenseKey", "userId", "validTill", status, "hardwareId",
+                          detectedhardwareid, "createdAt", "updatedAt")
+    SELECT 'default_key', :email, :valid_till, 'active', :hwid, NULL, :now, :now
+    WHERE NOT EXISTS (SELECT 1 FROM existing)
+    RETURNING "validTill", status
+),
+claimed AS (
+    UPDATE licenses SET "hardwareId" = :hwid, "updatedAt" = :now
+    WHERE id IN (SELECT id FROM existing WHERE COALESCE(TRIM("hardwareId"), '') = '')
+    RETURNING id
+),
+mismatch AS (
+    UPDATE licenses SET detectedhardwareid = :hwid, "updatedAt" = :now
+    WHERE "userId" = :email AND EXISTS (
+        SELECT 1 FROM existing
+        WHERE COALESCE(TRIM("hardwareId"), '') <> '' AND "hardwareId" <> :hwid
+    )
+    RETURNING id
+)
+SELECT
+    CASE
+        WHEN EXISTS (SELECT 1 FROM created) OR EXISTS (SELECT 1 FROM claimed) THEN 'registered'
+        WHEN EXISTS (SELECT 1 FROM mismatch) THEN 'mismatch'
+        ELSE 'ok'
+    END AS result,
+    COALESCE((SELECT "validTill" FROM created), (SELECT "validTill" FROM existing)) AS valid_till,
+    COALESCE((SELECT status FROM created), (SELECT status FROM existing)) AS status
+"""
+
+def insert_ignore(engine, table, conflict_columns):
+    """INSERT ... ON CONFLICT (conflict_columns) DO NOTHING for Postgres or SQLite."""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table).on_conflict_do_nothing(index_elements=conflict_columns)
+
+def get_engine(db_url, pool_size=AWS_DB_POOL_SIZE, max_overflow=AWS_DB_MAX_OVERFLOW,
+               pool_recycle=AWS_DB_POOL_RECYCLE, pool_pre_ping=AWS_DB_POOL_PRE_PING,
+               statement_timeout_ms=AWS_DB_STATEMENT_TIMEOUT_MS):
+    """Return the process-wide engine for db_url, creating it on first use."""
+    key = (db_url, pool_size, max_overflow, pool_recycle, pool_pre_ping, statement_timeout_ms)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            kwargs = {"pool_pre_ping": pool_pre_ping, "pool_recycle": pool_recycle}
+            if not db_url.startswith("sqlite"):
+                kwargs["pool_size"] = pool_size
+                kwargs["max_overflow"] = max_overflow
+            if statement_timeout_ms and db_url.startswith("postgresql"):
+                kwargs["connect_args"] = {"options": f"-c statement_timeout={int(statement_timeout_ms)}"}
+            engine = instrument_engine(create_engine(db_url, **kwargs), "aws")
+            _engines[key] = engine
+            logging.info("Created database engine (pool_size=%s, max_overflow=%s).", pool_size, max_overflow)
+        return engine
+
+def dispose_engines():
+    """Close every pooled connection, e.g. before the process exits."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+def has_user_companies_index(engine):
+    """Whether user_companies has the unique (user_email, company_id) index."""
+    return any(index["name"] == USER_COMPANIES_UNIQUE_INDEX for index in inspect(engine).get_indexes("user_companies"))
+
+def migrate_user_companies(engine):
+    """
+    Remove duplicate user-company mappings and build the unique index. Does
+    nothing once the index exists. Returns True if the migration ran.
+    """
+    if has_user_companies_index(engine):
+        return False
+    with engine.begin() as connection:
+        removed = connection.execute(text(USER_COMPANIES_DEDUPLICATE)).rowcount
+        connection.execute(text(USER_COMPANIES_CREATE_INDEX))
+    logging.info("Indexed user_companies (removed %d duplicate mappings).", removed)
+    return True
+
+def _schema_fingerprint(db_url, metadata):
+    parts = [db_url]
+    for table in sorted(metadata.tables.values(), key=lambda t: t.name):
+        parts.append(table.name + ":" + ",".join(f"{c.name} {c.type}" for c in table.columns))
+        parts.append(table.name + " indexes:" + ",".join(sorted(i.name for i in table.indexes)))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+def _read_schema_markers():
+    try:
+        with open(SCHEMA_MARKER_FILE, "r", encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+    except OSError:
+        return set()
+
+def _write_schema_marker(fingerprint):
+    try:
+        with open(SCHEMA_MARKER_FILE, "a", encoding="utf-8") as f:
+            f.write(fingerprint + "\n")
+    except OSError as e:
+        logging.warning("Could not record schema verification: %s", e)
+
 class AwsDbConnector:
     """
     Handles connection to the AWS PostgreSQL database using SQLAlchemy,
     and stores data according to our multi-tenant architecture.
     """
-    def __init__(self, db_url=None):
+    def __init__(self, db_url=None, schema_check=None, **pool_options):
         self.db_url = db_url or AWS_DB_URL
         if not self.db_url:
             raise ValueError("Database URL not set")
-        self.engine = create_engine(self.db_url)
+        self.engine = get_engine(self.db_url, **pool_options)
         self.metadata = MetaData()
         self.define_tables()
-        self.metadata.create_all(self.engine)
+        self.ensure_schema(schema_check or AWS_DB_SCHEMA_CHECK)
         logging.info("AWS database connector initialized.")
 
+    def ensure_schema(self, mode="once"):
+        """
+        Create missing tables. In "once" mode the DDL is skipped when this
+        schema has already been verified for the database, in this process or
+        (via the marker file) in an earlier one. A database still waiting for
+        the user_companies migration is not marked verified, so it is checked
+        again on the next start.
+        """
+        if mode == "never":
+            return
+        fingerprint = _schema_fingerprint(self.db_url, self.metadata)
+        if mode == "once":
+            if fingerprint in _verified_schemas:
+                return
+            if fingerprint in _read_schema_markers():
+                _verified_schemas.add(fingerprint)
+                return
+        self.metadata.create_all(self.engine)
+        if not has_user_companies_index(self.engine):
+            _unindexed_mappings.add(self.db_url)
+            logging.warning("user_companies has no unique index; mappings are added without an upsert until "
+                            "'python db_connector.py --migrate-user-companies' has been run once.")
+            return
+        _unindexed_mappings.discard(self.db_url)
+        if fingerprint not in _verified_schemas:
+            _verified_schemas.add(fingerprint)
+            _write_schema_marker(fingerprint)
+
     def define_tables(self):
         # Companies table
         self.companies_table = Table(
@@ -36,7 +222,8 @@ class AwsDbConnector:
             Column('id', Integer, primary_key=True, autoincrement=True),
             Column('user_email', String(255), nullable=False),
             Column('company_id', String, nullable=False),
-            Column('role', String(50), nullable=True)
+            Column('role', String(50), nullable=True),
+            Index(USER_COMPANIES_UNIQUE_INDEX, 'user_email', 'company_id', unique=True)
         )
         # Updated Ledgers table with an extra JSON column for dynamic extra fields
         self.ledger_table = Table(
@@ -78,18 +265,18 @@ class AwsDbConnector:
 
     def create_user_if_not_exists(self, user_email):
         stmt = select(self.users_table.c.email).where(self.users_table.c.email == user_email)
-        with self.engine.connect() as connection:
+        # Select and insert on one pooled connection
+        with self.engine.begin() as connection:
             result = connection.execute(stmt).fetchone()
-        if not result:
-            ins = self.users_table.insert().values(
-                email=user_email,
-                username=user_email,   # Use the email as the username (or provide another value)
-                cognitoid=user_email,
-                password="test"   # or your actual cognito id value
-            )
-            with self.engine.begin() as connection:
+            if not result:
+                ins = self.users_table.insert().values(
+                    email=user_email,
+                    username=user_email,   # Use the email as the username (or provide another value)
+                    cognitoid=user_email,
+                    password="test"   # or your actual cognito id value
+                )
                 connection.execute(ins)
-            logging.info("Created new user record for %s", user_email)
+                logging.info("Created new user record for %s", user_email)
 
 
 
@@ -153,84 +340,175 @@ class AwsDbConnector:
         logging.info("Created new license record for user %s with hardware id %s", user_email, hardware_id)
 
 
+    def check_license(self, user_email, hardware_id):
+        """
+        Ensure the user exists and check their license against hardware_id.
+        Returns (result, valid_till, status) where result is "ok",
+        "registered" (first use, hardware recorded) or "mismatch" (the new
+        hardware was recorded in detectedhardwareid). On Postgres this is a
+        single statement; other databases fall back to the individual helpers
+        inside one call.
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if self.engine.dialect.name == "postgresql":
+            with self.engine.begin() as connection:
+                row = connection.execute(text(LICENSE_CHECK_SQL), {
+                    "email": user_email,
+                    "hwid": hardware_id,
+                    "now": now,
+                    "valid_till": now + datetime.timedelta(days=365),
+                }).fetchone()
+            return row.result, row.valid_till, row.status
+
+        # Same steps as LICENSE_CHECK_SQL: the user's first licence row is
+        # claimed if it has no hardware yet; a row is only created if none exists
+        self.create_user_if_not_exists(user_email)
+        tbl = self.licenses_table
+        with self.engine.begin() as connection:
+            existing = connection.execute(
+                select(tbl.c.id, tbl.c.hardwareId, tbl.c.validTill, tbl.c.status)
+                .where(tbl.c.userId == user_email).order_by(tbl.c.id).limit(1)
+            ).fetchone()
+            if existing is None:
+                valid_till = now + datetime.timedelta(days=365)
+                connection.execute(tbl.insert().values(
+                    licenseKey="default_key", userId=user_email, validTill=valid_till, status="active",
+                    hardwareId=hardware_id, detectedhardwareid=None, createdAt=now, updatedAt=now
+                ))
+                logging.info("Created new license record for user %s with hardware id %s", user_email, hardware_id)
+                return "registered", valid_till, "active"
+            if (existing.hardwareId or "").strip() == "":
+                connection.execute(
+                    update(tbl).where(tbl.c.id == existing.id).values(hardwareId=hardware_id, updatedAt=now)
+                )
+                logging.info("License hardware registered for user %s", user_email)
+                return "registered", existing.validTill, existing.status
+            if existing.hardwareId != hardware_id:
+                connection.execute(
+                    update(tbl).where(tbl.c.userId == user_email).values(detectedhardwareid=hardware_id, updatedAt=now)
+                )
+                logging.info("Detected hardware updated for user %s", user_email)
+                return "mismatch", existing.validTill, existing.status
+        return "ok", existing.validTill, existing.status
+
     def get_or_create_company(self, username, company_name):
         """
-        Check if a company record exists; if not, create it.
+        Create the company record if it does not exist, in a single
+        INSERT ... ON CONFLICT DO NOTHING round trip. Known companies are
+        memoized per process and skip the database.
         """
         company_id = get_company_table_name(username, company_name)
-        with self.engine.connect() as connection:
-            stmt = select(self.companies_table.c.company_id).where(self.companies_table.c.company_id == company_id)
-            result = connection.execute(stmt).fetchone()
-        if result:
-            logging.info("Company '%s' already exists.", company_id)
+        if (self.db_url, company_id) in _known_companies:
             return company_id
-        ins = self.companies_table.insert().values(
+        ins = insert_ignore(self.engine, self.companies_table, ["company_id"]).values(
             company_id=company_id,
             company_name=company_name,
             created_by=username,
             created_at=datetime.datetime.now(datetime.timezone.utc)
-        )
+        ).returning(self.companies_table.c.company_id)
         with self.engine.begin() as connection:
-            connection.execute(ins)
-        logging.info("Created new company '%s' for user '%s'.", company_name, username)
+            created = connection.execute(ins).fetchone()
+        if created:
+            logging.info("Created new company '%s' for user '%s'.", company_name, username)
+        else:
+            logging.info("Company '%s' already exists.", company_id)
+        _known_companies.add((self.db_url, company_id))
         return company_id
 
     def add_user_company_mapping(self, user_email, company_id, role='admin'):
         """
-        Add an entry to the user_companies table if not already present.
+        Add an entry to the user_companies table if not already present, in a
+        single upsert against the (user_email, company_id) unique index.
         """
-        with self.engine.connect() as connection:
-            stmt = select(self.user_companies_table).where(
-                self.user_companies_table.c.user_email == user_email,
-                self.user_companies_table.c.company_id == company_id
-            )
-            result = connection.execute(stmt).fetchone()
-        if result:
-            logging.info("User-company mapping for '%s' and '%s' exists.", user_email, company_id)
+        key = (self.db_url, user_email, company_id)
+        if key in _known_mappings:
             return
-        ins = self.user_companies_table.insert().values(
+        if self.db_url in _unindexed_mappings:
+            # No index for ON CONFLICT to use yet
+            tbl = self.user_companies_table
+            with self.engine.begin() as connection:
+                exists = connection.execute(
+                    select(tbl.c.id).where(tbl.c.user_email == user_email, tbl.c.company_id == company_id)
+                ).fetchone()
+                if not exists:
+                    connection.execute(tbl.insert().values(user_email=user_email, company_id=company_id, role=role))
+                    logging.info("Created user-company mapping for '%s' and '%s'.", user_email, company_id)
+            _known_mappings.add(key)
+            return
+        ins = insert_ignore(self.engine, self.user_companies_table, ["user_email", "company_id"]).values(
             user_email=user_email,
             company_id=company_id,
             role=role
-        )
+        ).returning(self.user_companies_table.c.id)
         with self.engine.begin() as connection:
-            connection.execute(ins)
-        logging.info("Created user-company mapping for '%s' and '%s'.", user_email, company_id)
+            created = connection.execute(ins).fetchone()
+        if created:
+            logging.info("Created user-company mapping for '%s' and '%s'.", user_email, company_id)
+        else:
+            logging.info("User-company mapping for '%s' and '%s' exists.", user_email, company_id)
+        _known_mappings.add(key)
 
-    def upload_ledgers(self, username, company_name, ledgers):
+    def upload_ledgers(self, username, company_name, ledgers, raise_errors=False, batch_size=1000):
         """
         Insert ledger data into the centralized ledgers table for the specified company.
+        Rows are sent in executemany batches. With raise_errors=True a database
+        error is re-raised instead of logged, so callers (e.g. the cloud upload
+        queue) can retry.
         """
         try:
             company_id = self.get_or_create_company(username, company_name)
             self.add_user_company_mapping(username, company_id, role='admin')
+            # Typed records; dicts (e.g. from the upload queue) are parsed once here
+            ledgers = as_ledger_table(ledgers)
+            now = datetime.datetime.now(datetime.timezone.utc)
             with self.engine.begin() as connection:
+                batch = []
                 for ledger in ledgers:
-                    # Map standard fields
-                    ledger_name = ledger.get("Name", ledger.get("LEDGERNAME", "N/A"))
-                    closing_balance = ledger.get("ClosingBalance", ledger.get("CLOSINGBALANCE", "N/A"))
-                    
-                    # Collect any additional/dynamic fields
-                    standard_keys = {"Name", "LEDGERNAME", "ClosingBalance", "CLOSINGBALANCE"}
-                    extra_fields = {k: v for k, v in ledger.items() if k not in standard_keys}
-                    
-                    ins = self.ledger_table.insert().values(
-                        company_id=company_id,
-                        description=ledger_name,
-                        closing_balance=closing_balance,
-                        timestamp=datetime.datetime.now(datetime.timezone.utc),
-                        extra_data=extra_fields  # Save extra dynamic fields here
-                    )
-                    connection.execute(ins)
+                    batch.append({
+                        "company_id": company_id,
+                        "description": ledger.name,
+                        "closing_balance": format_amount(ledger.closing_balance),
+                        "timestamp": now,
+                        "extra_data": ledger.extra_fields()  # Save extra dynamic fields here
+                    })
+                    if len(batch) >= batch_size:
+                        connection.execute(self.ledger_table.insert(), batch)
+                        batch = []
+                if batch:
+                    connection.execute(self.ledger_table.insert(), batch)
             logging.info("Uploaded %d ledger records for user '%s' and company '%s' into ledgers table.", len(ledgers), username, company_name)
+            lookup_cache.invalidate("aws_company_names")
         except SQLAlchemyError as e:
             logging.error("Database insertion error: %s", e)
+            if raise_errors:
+                raise
 
     def get_company_name_by_id(self, company_id):
-        """Fetch the exact company name from companies table given the company_id."""
+        """Fetch the exact company name from companies table given the company_id (cached)."""
+        return lookup_cache.get_or_load(
+            "aws_company_names", (self.db_url, company_id),
+            lambda: self._load_company_name_by_id(company_id)
+        )
+
+    def _load_company_name_by_id(self, company_id):
         stmt = select(self.companies_table.c.company_name).where(
             self.companies_table.c.company_id == company_id
         )
         with self.engine.connect() as connection:
             result = connection.execute(stmt).fetchone()
         return result[0] if result else None
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Maintenance of the AWS database.")
+    arg_parser.add_argument("--migrate-user-companies", action="store_true", required=True,
+                            help="Remove duplicate user-company mappings and add their unique index (one-off)")
+    arg_parser.add_argument("--db-url", help="Database URL (defaults to AWS_DB_URL)")
+    args = arg_parser.parse_args(argv)
+
+    engine = get_engine(args.db_url or AWS_DB_URL)
+    if not migrate_user_companies(engine):
+        logging.info("user_companies is already indexed; nothing to do.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
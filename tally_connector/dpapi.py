@@ -0,0 +1,40 @@
+# dpapi.py
+"""
+Encryption at rest for the files kept in SESSION_DIR. On Windows the bytes
+are encrypted for the current user with DPAPI and base64 encoded; elsewhere
+they are stored as they are and protected only by the file's permissions.
+"""
+import sys
+import base64
+
+def dpapi(data, protect):
+    """Encrypt/decrypt bytes for the current Windows user with DPAPI."""
+    import ctypes
+    from ctypes import wintypes
+
+    class DATA_BLOB(ctypes.Structure):
+        _fields_ = [("cbData", wintypes.DWORD), ("pbData", ctypes.POINTER(ctypes.c_char))]
+
+    buffer = ctypes.create_string_buffer(data, len(data))
+    blob_in = DATA_BLOB(len(data), ctypes.cast(buffer, ctypes.POINTER(ctypes.c_char)))
+    blob_out = DATA_BLOB()
+    crypt32 = ctypes.windll.crypt32
+    func = crypt32.CryptProtectData if protect else crypt32.CryptUnprotectData
+    if not func(ctypes.byref(blob_in), None, None, None, None, 0, ctypes.byref(blob_out)):
+        raise OSError("DPAPI call failed")
+    try:
+        return ctypes.string_at(blob_out.pbData, blob_out.cbData)
+    finally:
+        ctypes.windll.kernel32.LocalFree(blob_out.pbData)
+
+def protect(data):
+    """Bytes to write to disk for data."""
+    if sys.platform == "win32":
+        return base64.b64encode(dpapi(data, protect=True))
+    return data
+
+def unprotect(raw):
+    """The data protect() turned into raw."""
+    if sys.platform == "win32":
+        return dpapi(base64.b64decode(raw), protect=False)
+    return raw
@@ -0,0 +1,182 @@
+# exporter.py
+import os
+import csv
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+STATEMENT_COLUMNS = ["Sr No", "Date", "Description", "Type", "Amount", "Balance"]
+LINE_COLUMNS = ["Page #", "Line #", "Content"]
+
+SUPPORTED_FORMATS = ("xlsx", "csv", "parquet")
+
+# Parquet types of the known columns. Inferring them from the first batch
+# would type a column that happens to be all None there (e.g. Balance) as
+# null, and the first later value would not fit the file's schema.
+PARQUET_TYPES = {
+    "Sr No": "int64", "Date": "date32", "Description": "string", "Type": "string",
+    "Amount": "float64", "Balance": "float64",
+    "Page #": "int64", "Line #": "int64", "Content": "string",
+}
+
+def detect_format(output_path, fmt=None):
+    """Pick the output format from the explicit fmt or the file extension."""
+    if fmt:
+        fmt = fmt.lower().lstrip(".")
+    else:
+        fmt = os.path.splitext(output_path)[1].lower().lstrip(".") or "xlsx"
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return fmt
+
+def statement_rows(transactions):
+    """
+    Yield statement rows in STATEMENT_COLUMNS order. Sr No is generated here,
+    so the transactions themselves are never modified.
+    """
+    for i, txn in enumerate(transactions, start=1):
+        txn_date = txn.get("Date")
+        if hasattr(txn_date, "date"):
+            txn_date = txn_date.date()
+        yield (
+            i,
+            txn_date,
+            txn.get("Description"),
+            txn.get("Type"),
+            txn.get("Amount"),
+            txn.get("Balance"),
+        )
+
+def _write_xlsx(rows, columns, output_path):
+    """
+    Stream rows into an xlsx file in constant memory. Uses xlsxwriter's
+    constant_memory mode if installed, otherwise openpyxl's write-only mode.
+    """
+    try:
+        import xlsxwriter
+    except ImportError:
+        xlsxwriter = None
+
+    count = 0
+    if xlsxwriter is not None:
+        workbook = xlsxwriter.Workbook(output_path, {"constant_memory": True})
+        try:
+            sheet = workbook.add_worksheet()
+            date_format = workbook.add_format({"num_format": "yyyy-mm-dd"})
+            sheet.write_row(0, 0, columns)
+            for row_idx, row in enumerate(rows, start=1):
+                for col_idx, value in enumerate(row):
+                    if value is None:
+                        continue
+                    if hasattr(value, "isoformat") and not isinstance(value, str):
+                        sheet.write_datetime(row_idx, col_idx, value, date_format)
+                    else:
+                        sheet.write(row_idx, col_idx, value)
+                count += 1
+        finally:
+            workbook.close()
+        return count
+
+    from openpyxl import Workbook  # Requires: pip install openpyxl
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(columns)
+    for row in rows:
+        sheet.append(list(row))
+        count += 1
+    workbook.save(output_path)
+    return count
+
+def _write_csv(rows, columns, output_path):
+    count = 0
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(["" if v is None else v for v in row])
+            count += 1
+    return count
+
+def _parquet_schema(pa, columns, first_batch):
+    """
+    Schema from PARQUET_TYPES, other columns inferred from first_batch.
+    Returns (schema, indexes of columns that fell back to string).
+    """
+    inferred = [pa.array(list(values)).type for values in zip(*first_batch)] if first_batch else []
+    fields = []
+    stringify = []
+    for i, column in enumerate(columns):
+        type_name = PARQUET_TYPES.get(column)
+        if type_name is not None:
+            field_type = getattr(pa, type_name)()
+        else:
+            field_type = inferred[i] if i < len(inferred) else pa.null()
+            if pa.types.is_null(field_type):
+                # Nothing to infer from; strings hold whatever comes later
+                field_type = pa.string()
+                stringify.append(i)
+        fields.append(pa.field(column, field_type))
+    return pa.schema(fields), stringify
+
+def _parquet_table(pa, batch, schema, stringify):
+    values = [list(column) for column in zip(*batch)] if batch else [[] for _ in schema]
+    for i in stringify:
+        values[i] = [None if v is None else str(v) for v in values[i]]
+    return pa.Table.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(values, schema)], schema=schema
+    )
+
+def _write_parquet(rows, columns, output_path, batch_size=50000):
+    """
+    Write rows to Parquet in record batches (requires pyarrow). Every batch
+    is converted to one schema, fixed before the first write.
+    """
+    import pyarrow as pa  # Requires: pip install pyarrow
+    import pyarrow.parquet as pq
+
+    count = 0
+    writer = None
+    schema = stringify = None
+    batch = []
+
+    def flush():
+        nonlocal writer, schema, stringify, count
+        if writer is None:
+            schema, stringify = _parquet_schema(pa, columns, batch)
+            writer = pq.ParquetWriter(output_path, schema)
+        writer.write_table(_parquet_table(pa, batch, schema, stringify))
+        count += len(batch)
+        batch.clear()
+
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush()
+        if batch or writer is None:
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+def export_rows(rows, columns, output_path, fmt=None):
+    """
+    Write an iterable of row tuples to output_path as xlsx, csv or parquet.
+    Rows are consumed lazily, so generators are written without being
+    materialised. Returns the number of data rows written.
+    """
+    fmt = detect_format(output_path, fmt)
+    if fmt == "csv":
+        count = _write_csv(rows, columns, output_path)
+    elif fmt == "parquet":
+        count = _write_parquet(rows, columns, output_path)
+    else:
+        count = _write_xlsx(rows, columns, output_path)
+    logging.info("Exported %d rows to %s (%s)", count, output_path, fmt)
+    return count
+
+def export_transactions(transactions, output_path="output.xlsx", fmt=None):
+    """Export parsed statement transactions without mutating them."""
+    export_rows(statement_rows(transactions), STATEMENT_COLUMNS, output_path, fmt)
+    return output_path
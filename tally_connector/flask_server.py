@@ -1,19 +1,29 @@
 # flask_server.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 import xml.etree.ElementTree as ET
 import requests
 import logging
 import os
 import time
+import tempfile
 from dotenv import load_dotenv
 from datetime import datetime
-import json
-from db_connector import AwsDbConnector
-# Import your websocket server
-from websocket_server import start_websocket_server
 from collections import defaultdict
+# db_connector (SQLAlchemy), websocket_server (websockets) and app (pdfplumber)
+# are imported on first use so the server starts listening quickly.
+from app import StatementParseError
+from telemetry import metrics, log_payload
+
+db_connector = None
+
+def get_db_connector():
+    """Create the AwsDbConnector on first use instead of at import time."""
+    global db_connector
+    if db_connector is None:
+        from db_connector import AwsDbConnector
+        db_connector = AwsDbConnector()
+    return db_connector
 
-db_connector = AwsDbConnector()
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -23,14 +33,44 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 load_dotenv()
 TALLY_URL = os.getenv("TALLY_URL", "http://localhost:9000")
+# /api/parseStatement only reads statements from here (or uploaded with the request)
+STATEMENT_UPLOAD_DIR = os.path.realpath(os.getenv(
+    "STATEMENT_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "tally_connector_statements")
+))
 
 app = Flask(__name__)
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        metrics.observe("http_request_seconds", time.perf_counter() - start,
+                        endpoint=request.endpoint or "unknown", status=response.status_code)
+    return response
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    """Readiness probe used by the GUI at startup."""
+    return jsonify({"status": "ok", "message": "Flask server is running"})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Timers and counters of this process in Prometheus text format."""
+    return Response(metrics.render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_json():
+    return jsonify(metrics.snapshot())
+
 @app.route('/api/tallyConnector', methods=['POST'])
 def tally_connector():
     try:
         data = request.get_json()
-        logger.info(f"Received full JSON data: {json.dumps(data, indent=2)}")
+        log_payload(logger, "Received JSON data", data)
         company_id = data.get("company")
         logger.info(f"Company ID from JSON: '{company_id}'")
         if not company_id:
@@ -38,7 +78,7 @@ def tally_connector():
             return jsonify({"error": "Company ID missing"}), 400
 
         # Dynamically fetch the exact company_name using your AwsDbConnector
-        real_company_name = db_connector.get_company_name_by_id(company_id)
+        real_company_name = get_db_connector().get_company_name_by_id(company_id)
         logger.info(f"Fetched company name from DB: '{real_company_name}' for company_id '{company_id}'")
         if not real_company_name:
             logger.error(f"Company '{company_id}' not found in database.")
@@ -62,17 +102,18 @@ def tally_connector():
             return jsonify({"error": "Missing required data"}), 400
 
         xml_str = xml_payload.decode('utf-8')
-        logger.info(f"XML Payload to Tally:\n{xml_str}")
-        print("XML Payload to Tally:\n", xml_str)
+        log_payload(logger, "XML Payload to Tally", xml_str)
 
-        response = requests.post(
-            TALLY_URL,
-            data=xml_payload,
-            headers={"Content-Type": "text/xml"},
-            timeout=10
-        )
+        with metrics.timer("tally_http_seconds", request="import"):
+            response = requests.post(
+                TALLY_URL,
+                data=xml_payload,
+                headers={"Content-Type": "text/xml"},
+                timeout=10
+            )
+        metrics.inc("tally_records_imported_total", len(transactions))
 
-        logger.info(f"Tally Response: {response.text}")
+        log_payload(logger, "Tally Response", response.text)
         if "LINEERROR" in response.text:
             return jsonify({"error": "Tally error", "details": response.text}), 400
 
@@ -115,6 +156,79 @@ def tally_connector():
         return jsonify({"error": "Server error", "details": str(e)}), 500
 
 
+def statement_path(pdf_path):
+    """pdf_path resolved inside STATEMENT_UPLOAD_DIR, or None if it points anywhere else."""
+    resolved = os.path.realpath(os.path.join(STATEMENT_UPLOAD_DIR, pdf_path))
+    if os.path.commonpath([resolved, STATEMENT_UPLOAD_DIR]) != STATEMENT_UPLOAD_DIR:
+        return None
+    return resolved
+
+@app.route('/api/parseStatement', methods=['POST'])
+def parse_statement():
+    """
+    Parse a PDF bank statement and return its transactions as JSON records.
+    The PDF is either uploaded as the multipart field "file" (other fields as
+    form fields) or named by pdf_path in a JSON body, relative to
+    STATEMENT_UPLOAD_DIR; paths outside that directory are refused.
+    If user_email, company_id and bank_account are supplied, the records are
+    stored directly in the local temporary_transactions table instead.
+    """
+    uploaded_path = None
+    try:
+        upload = request.files.get("file")
+        if upload is not None:
+            data = request.form.to_dict()
+            os.makedirs(STATEMENT_UPLOAD_DIR, exist_ok=True)
+            fd, uploaded_path = tempfile.mkstemp(suffix=".pdf", dir=STATEMENT_UPLOAD_DIR)
+            with os.fdopen(fd, "wb") as f:
+                upload.save(f)
+            pdf_path = uploaded_path
+            file_name = os.path.basename(upload.filename or "") or "statement.pdf"
+        else:
+            data = request.get_json(silent=True) or {}
+            if not data.get("pdf_path"):
+                return jsonify({"error": "file or pdf_path missing"}), 400
+            pdf_path = statement_path(data["pdf_path"])
+            if pdf_path is None:
+                return jsonify({"error": "pdf_path must be inside the statement upload directory"}), 403
+            file_name = os.path.basename(pdf_path)
+
+        from app import parse_pdf_transactions, transactions_to_records
+        transactions = parse_pdf_transactions(pdf_path)
+        records = transactions_to_records(transactions)
+
+        user_email = data.get("user_email")
+        company_id = data.get("company_id")
+        bank_account = data.get("bank_account")
+        if user_email and company_id and bank_account:
+            from websocket_server import get_local_db
+            upload_id = get_local_db().upload_excel_local(
+                user_email, company_id, bank_account, records, file_name
+            )
+            return jsonify({
+                "message": "Statement stored",
+                "table": upload_id,
+                "transactionsProcessed": len(records),
+                "duplicates": get_local_db().get_duplicate_count(upload_id)
+            })
+
+        return jsonify({"data": records, "transactionsProcessed": len(records)})
+
+    except StatementParseError as e:
+        logger.error(f"Statement parse error: {str(e)}")
+        return jsonify({"error": e.title, "details": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Server error: {str(e)}")
+        return jsonify({"error": "Server error", "details": str(e)}), 500
+    finally:
+        if uploaded_path is not None:
+            try:
+                os.remove(uploaded_path)
+            except OSError:
+                pass
+
+
+@metrics.timed("xml_build_seconds", kind="vouchers")
 def process_ledgers_to_xml(real_company_name, transactions):
     try:
         envelope = ET.Element("ENVELOPE")
@@ -159,6 +273,7 @@ def process_ledgers_to_xml(real_company_name, transactions):
         logger.error(f"Error in process_ledgers_to_xml: {str(e)}")
         raise
 
+@metrics.timed("xml_build_seconds", kind="journals")
 def process_journals_to_xml(real_company_name, transactions):
     envelope = ET.Element("ENVELOPE")
 
@@ -221,6 +336,7 @@ def process_journals_to_xml(real_company_name, transactions):
     return xml_bytes
 
 
+@metrics.timed("xml_build_seconds", kind="ledger_masters")
 def process_Excelledgers_to_xml(real_company_name, ledger_data):
     try:
         envelope = ET.Element("ENVELOPE")
@@ -291,7 +407,7 @@ def process_Excelledgers_to_xml(real_company_name, ledger_data):
 if __name__ == "__main__":
     # Start the WebSocket server in a separate thread
     from threading import Thread
+    from websocket_server import start_websocket_server
     ws_thread = Thread(target=start_websocket_server, daemon=True)
     ws_thread.start()
-    time.sleep(1)
     app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
@@ -1,18 +1,22 @@
 import os
 import threading
 import logging
-import jwt  # Requires: pip install pyjwt
+import datetime
+from array import array
     
 import webbrowser
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
-    QLineEdit, QPushButton, QStackedWidget, QTableWidget, QTableWidgetItem, QMessageBox
+    QLineEdit, QPushButton, QStackedWidget, QTableView, QHeaderView, QMessageBox
 )
 from PyQt6.QtGui import QPainter, QBrush, QColor, QFont
-from PyQt6.QtCore import Qt, pyqtSignal, QTimer, QUrl
-from PyQt6.QtWebSockets import QWebSocket
+from PyQt6.QtCore import (
+    Qt, pyqtSignal, QTimer, QUrl, QAbstractTableModel, QModelIndex, QSortFilterProxyModel
+)
 from dotenv import load_dotenv
 from hardware import get_hardware_id
+from session_store import CognitoSession
+from license_service import LicenseService
 
 
 # from db_connector import get_license_hardware
@@ -21,14 +25,13 @@ from hardware import get_hardware_id
 # Load environment variables
 load_dotenv()
 
-# Import backend modules
-from tally_api import TallyAPI
-from db_connector import AwsDbConnector  # Existing AWS connector
-from cognito_auth import CognitoAuth
+# Backend modules (TallyAPI, AwsDbConnector, CognitoAuth, LocalDbConnector) pull
+# in lxml, SQLAlchemy and boto3; they are imported on first use, mostly on the
+# startup threads, so the window can appear before they load.
 from config import COGNITO_USER_POOL_ID, COGNITO_CLIENT_ID, COGNITO_REGION
-
-# Import the local storage connector for silver users
-from local_db_connector import LocalDbConnector
+from startup import StartupOrchestrator, wait_for_http, wait_for_port
+from sync_scheduler import SyncScheduler
+from tally_records import AMOUNT_SCALE, LedgerTable, format_scaled
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -36,6 +39,11 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(
 LIVE_WEBSITE_URL = os.getenv("LIVE_WEBSITE_URL", "https://live.example.com")
 LOCAL_WEBSITE_URL = os.getenv("LOCAL_WEBSITE_URL", "http://localhost:9000")
 
+# Background ledger refresh interval in seconds (0 disables periodic refresh)
+SYNC_INTERVAL_SECONDS = float(os.getenv("SYNC_INTERVAL_SECONDS", "0"))
+# Tally exposes one active company at a time, so ledger syncs share one queue
+LEDGER_SYNC_KEY = "active_company"
+
 class UserIcon(QWidget):
     """A widget that draws a circular icon with the username initial."""
     def __init__(self, username, size=40):
@@ -58,11 +66,15 @@ class LoginWidget(QWidget):
     """Login/Signup screen using PyQt6 and AWS Cognito."""
     # Emits both username and user_type after a successful login
     switch_to_main_signal = pyqtSignal(str, str)
+    # Emitted from the login thread: (success, username, user_type)
+    login_finished = pyqtSignal(bool, str, str)
 
-    def __init__(self, cognito_auth):
+    def __init__(self, cognito_auth, session=None):
         super().__init__()
         self.cognito_auth = cognito_auth
+        self.session = session or CognitoSession(cognito_auth)
         self.setup_ui()
+        self.login_finished.connect(self.on_login_finished)
 
     def setup_ui(self):
         layout = QVBoxLayout()
@@ -83,9 +95,9 @@ class LoginWidget(QWidget):
         layout.addWidget(self.password_edit)
 
         btn_layout = QHBoxLayout()
-        login_btn = QPushButton("Login")
-        login_btn.clicked.connect(self.login)
-        btn_layout.addWidget(login_btn)
+        self.login_btn = QPushButton("Login")
+        self.login_btn.clicked.connect(self.login)
+        btn_layout.addWidget(self.login_btn)
 
         signup_btn = QPushButton("Sign Up")
         signup_btn.clicked.connect(self.signup)
@@ -96,18 +108,22 @@ class LoginWidget(QWidget):
     def login(self):
         username = self.username_edit.text().strip()
         password = self.password_edit.text().strip()
-        success, response = self.cognito_auth.sign_in(username, password)
+        # Sign in and decode the token off the GUI thread
+        self.login_btn.setEnabled(False)
+        threading.Thread(target=self._login_worker, args=(username, password), daemon=True).start()
+
+    def _login_worker(self, username, password):
+        try:
+            success = self.session.sign_in(username, password)
+        except Exception as e:
+            logging.error("Error during sign in: %s", e)
+            success = False
+        # Tier comes from the cached ID token claims
+        self.login_finished.emit(success, username, self.session.user_type or "silver")
+
+    def on_login_finished(self, success, username, user_type):
+        self.login_btn.setEnabled(True)
         if success:
-            # Extract the groups from the ID token
-            try:
-                id_token = response['AuthenticationResult']['IdToken']
-                decoded = jwt.decode(id_token, options={"verify_signature": False})
-                groups = decoded.get("cognito:groups", [])
-            except Exception as e:
-                logging.error("Error decoding token: %s", e)
-                groups = []
-            # Determine user tier based on groups
-            user_type = "gold" if any("gold" == group.lower() for group in groups) else "silver"
             self.switch_to_main_signal.emit(username, user_type)
         else:
             QMessageBox.critical(self, "Login Failed", "Incorrect username or password.")
@@ -121,22 +137,134 @@ class LoginWidget(QWidget):
         else:
             QMessageBox.critical(self, "Sign Up Failed", "An error occurred. Try a different username.")
 
+class LedgerStore:
+    """
+    Display columns over a LedgerTable: names and interned parents are shared
+    with the table, balance text is formatted once from the scaled amounts,
+    and a float array holds the balances for numeric sorting. Built off the
+    GUI thread and handed to LedgerTableModel in one step.
+    """
+    __slots__ = ("names", "balances", "balance_values", "parents")
+
+    def __init__(self):
+        self.names = []
+        self.balances = []
+        self.balance_values = array("d")
+        self.parents = []
+
+    @classmethod
+    def from_table(cls, table):
+        store = cls()
+        store.names = table.names
+        store.parents = [parent if parent is not None else "N/A" for parent in table.parents]
+        store.balances = [
+            format_scaled(value) if known & LedgerTable.HAS_CLOSING else "N/A"
+            for value, known in zip(table.closing, table.known)
+        ]
+        store.balance_values = array("d", (value / AMOUNT_SCALE for value in table.closing))
+        return store
+
+    def __len__(self):
+        return len(self.names)
+
+class LedgerTableModel(QAbstractTableModel):
+    """
+    Table model over a LedgerStore. Rows are exposed lazily in batches via
+    canFetchMore/fetchMore, so no per-cell objects are created and a refresh
+    costs a single model reset on the GUI thread.
+    """
+    HEADERS = ["Ledger Name", "Closing Balance", "Parent"]
+    FETCH_BATCH = 1000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.store = LedgerStore()
+        self.loaded_rows = 0
+
+    def set_store(self, store):
+        self.beginResetModel()
+        self.store = store
+        self.loaded_rows = min(len(store), self.FETCH_BATCH)
+        self.endResetModel()
+
+    def fetch_all(self):
+        """Expose every row, e.g. before sorting or filtering the full set."""
+        if self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex(), len(self.store))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded_rows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.loaded_rows < len(self.store)
+
+    def fetchMore(self, parent, count=None):
+        if parent.isValid():
+            return
+        remaining = len(self.store) - self.loaded_rows
+        to_fetch = min(remaining, count or self.FETCH_BATCH)
+        if to_fetch <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded_rows, self.loaded_rows + to_fetch - 1)
+        self.loaded_rows += to_fetch
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row, col = index.row(), index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if col == 0:
+                return self.store.names[row]
+            if col == 1:
+                return self.store.balances[row]
+            return self.store.parents[row]
+        if role == Qt.ItemDataRole.UserRole:
+            # Sort keys: numeric balance, case-insensitive text
+            if col == 1:
+                return self.store.balance_values[row]
+            if col == 0:
+                return self.store.names[row].lower()
+            return self.store.parents[row].lower()
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
 class LedgerWidget(QWidget):
     """Main ledger view that displays Tally ledger data and stores it based on user tier."""
-    ledgers_fetched = pyqtSignal(str, list)  # Emits (active_company, ledgers)
+    ledgers_fetched = pyqtSignal(str, object)  # Emits (active_company, LedgerStore)
+    sync_status_changed = pyqtSignal(str, dict)  # Emits (sync key, status) from the sync worker
 
-    def __init__(self, username, tally_api, db_connector, user_type):
+    def __init__(self, username, tally_api, db_connector, user_type, upload_queue=None):
         super().__init__()
         self.username = username
         self.user_type = user_type  # 'gold' or 'silver'
         self.tally_api = tally_api
         self.db_connector = db_connector
+        # Gold uploads go through the local write-behind queue when available
+        self.upload_queue = upload_queue
         # For silver users, initialize the local DB connector.
         if self.user_type == "silver":
+            from local_db_connector import LocalDbConnector
+            from voucher_sync import VoucherSync
             self.local_db_connector = LocalDbConnector()
-        self.ledgers = []  # Store fetched ledger data temporarily
+            self.voucher_sync = VoucherSync(tally_api, self.local_db_connector)
+        self.ledgers = LedgerTable()  # Store fetched ledger data temporarily
         self.setup_ui()
         self.ledgers_fetched.connect(self.on_ledgers_fetched)
+        # One sync at a time; Refresh clicks during a sync are coalesced into it
+        self.sync_scheduler = SyncScheduler()
+        self.sync_scheduler.add_listener(self.sync_status_changed.emit)
+        self.sync_status_changed.connect(self.on_sync_status)
+        self.sync_scheduler.start_periodic(
+            LEDGER_SYNC_KEY, lambda progress: self.run_ledger_sync(progress, manual=False), SYNC_INTERVAL_SECONDS
+        )
 
     def setup_ui(self):
         main_layout = QVBoxLayout()
@@ -173,9 +301,30 @@ class LedgerWidget(QWidget):
         self.company_label.setFont(QFont("Arial", 12, QFont.Weight.Bold))
         main_layout.addWidget(self.company_label)
 
+        self.sync_status_label = QLabel("Last sync: never")
+        main_layout.addWidget(self.sync_status_label)
+
+        # Filter box for the ledger table
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("Filter ledgers...")
+        self.filter_edit.textChanged.connect(self.on_filter_changed)
+        main_layout.addWidget(self.filter_edit)
+
         # Table with three columns: Ledger Name, Closing Balance, Parent
-        self.table = QTableWidget(0, 3)
-        self.table.setHorizontalHeaderLabels(["Ledger Name", "Closing Balance", "Parent"])
+        self.ledger_model = LedgerTableModel(self)
+        self.proxy_model = QSortFilterProxyModel(self)
+        self.proxy_model.setSourceModel(self.ledger_model)
+        self.proxy_model.setSortRole(Qt.ItemDataRole.UserRole)
+        self.proxy_model.setFilterCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        self.proxy_model.setFilterKeyColumn(-1)
+        self.table = QTableView()
+        self.table.setModel(self.proxy_model)
+        # Start unsorted so only the first batch of rows is loaded
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self.table.setSortingEnabled(True)
+        self.table.horizontalHeader().sortIndicatorChanged.connect(self.on_sort_changed)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        self.table.verticalHeader().setVisible(False)
         main_layout.addWidget(self.table)
 
         btn_layout = QHBoxLayout()
@@ -197,31 +346,63 @@ class LedgerWidget(QWidget):
         os.system("python TdlDisplay.py")
         
     def update_ledgers(self):
-        def fetch_data():
-            if not self.tally_api.is_tally_running():
-                self.ledgers_fetched.emit("Tally not running", [])
-                return
-            active_company = self.tally_api.get_active_company()
-            # Request ledger name, parent, and closing balance fields
-            fetch_fields = ["LEDGERNAME", "PARENT", "CLOSINGBALANCE"]
-            ledgers = self.tally_api.fetch_data(
-                request_id="AllLedgers",
-                collection_type="Ledger",
-                fetch_fields=fetch_fields,
-                use_cache=False
-            )
-            self.ledgers = ledgers
-            self.ledgers_fetched.emit(active_company, ledgers)
-            # Depending on the user tier, store the data:
-            if self.user_type == "gold":
-                # Gold user: store in cloud (using AWS DB connector)
-                self.db_connector.upload_ledgers(self.username, active_company, ledgers)
+        self.sync_scheduler.request_sync(
+            LEDGER_SYNC_KEY, lambda progress: self.run_ledger_sync(progress, manual=True)
+        )
+
+    def run_ledger_sync(self, progress, manual=True):
+        """Fetch ledgers from Tally and store them; runs on the sync worker thread."""
+        if not self.tally_api.is_tally_running():
+            self.ledgers_fetched.emit("Tally not running", LedgerStore())
+            return
+        progress(0.1, "Reading active company")
+        active_company = self.tally_api.get_active_company()
+        # Ledger name, parent and balances, parsed once into a typed table
+        progress(0.2, "Fetching ledgers from Tally")
+        ledgers = self.tally_api.fetch_ledgers(request_id="AllLedgers", use_cache=False)
+        self.ledgers = ledgers
+        # Build the display store here so the GUI thread only swaps it in
+        self.ledgers_fetched.emit(active_company, LedgerStore.from_table(ledgers))
+        progress(0.6, f"Storing {len(ledgers)} ledgers")
+        # Depending on the user tier, store the data:
+        if self.user_type == "gold":
+            # Gold user: store in cloud (using AWS DB connector)
+            if self.upload_queue is not None:
+                # Queued locally and flushed to the cloud in the background
+                self.upload_queue.enqueue_ledgers(self.username, active_company, ledgers)
             else:
-                # Silver user: store locally
-                self.local_db_connector.upload_ledgers(self.username, active_company, ledgers)
+                self.db_connector.upload_ledgers(self.username, active_company, ledgers)
+        else:
+            # Silver user: store locally
+            self.local_db_connector.upload_ledgers(self.username, active_company, ledgers)
+            # Pull new vouchers (incrementally) so reconciliation can run locally
+            progress(0.7, "Syncing vouchers")
+            try:
+                self.voucher_sync.sync(
+                    self.username, active_company,
+                    progress=lambda fraction, message: progress(0.7 + 0.3 * fraction, message)
+                )
+            except Exception as e:
+                logging.error("Voucher sync for '%s' failed: %s", active_company, e)
+            if manual:
                 # Schedule a popup (on the main thread) to invite user to open the local website
                 QTimer.singleShot(0, self.show_local_website_popup)
-        threading.Thread(target=fetch_data, daemon=True).start()
+
+    def on_sync_status(self, key, status):
+        if status["state"] in ("queued", "running"):
+            self.refresh_btn.setText(f"Syncing... {int(status['progress'] * 100)}%")
+            self.sync_status_label.setText(f"Sync: {status['message']}")
+            return
+        self.refresh_btn.setText("Refresh")
+        if status["last_finished"]:
+            finished = datetime.datetime.fromtimestamp(status["last_finished"]).strftime("%H:%M:%S")
+            if status["state"] == "error":
+                self.sync_status_label.setText(f"Last sync failed at {finished}: {status['last_error']}")
+            else:
+                self.sync_status_label.setText(f"Last sync: {finished} ({status['last_duration']:.2f}s)")
+
+    def shutdown_sync(self):
+        self.sync_scheduler.shutdown()
 
     def show_local_website_popup(self):
         reply = QMessageBox.question(
@@ -244,29 +425,45 @@ class LedgerWidget(QWidget):
         if reply == QMessageBox.StandardButton.Yes:
             webbrowser.open(LIVE_WEBSITE_URL)
 
-    def on_ledgers_fetched(self, active_company, ledgers):
+    def on_ledgers_fetched(self, active_company, ledger_store):
         self.company_label.setText(f"Company: {active_company}")
-        self.table.setRowCount(0)
-        for ledger in ledgers:
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            ledger_name = ledger.get("Name", ledger.get("LEDGERNAME", "N/A"))
-            closing_balance = ledger.get("ClosingBalance", ledger.get("CLOSINGBALANCE", "N/A"))
-            parent = ledger.get("PARENT", "N/A")
-            self.table.setItem(row, 0, QTableWidgetItem(ledger_name))
-            self.table.setItem(row, 1, QTableWidgetItem(closing_balance))
-            self.table.setItem(row, 2, QTableWidgetItem(parent))
+        self.ledger_model.set_store(ledger_store)
+        # Sorting/filtering must see every row, not just the fetched batch
+        if self.filter_edit.text() or self.proxy_model.sortColumn() >= 0:
+            self.ledger_model.fetch_all()
+
+    def on_filter_changed(self, text):
+        if text:
+            self.ledger_model.fetch_all()
+        self.proxy_model.setFilterFixedString(text)
+
+    def on_sort_changed(self, column, order):
+        if column >= 0:
+            self.ledger_model.fetch_all()
 
     def open_profile(self, event):
         QMessageBox.information(self, "Profile", f"Username: {self.username}\n(Additional profile info here)")
 
 class MainWindow(QMainWindow):
     """Main application window using QStackedWidget to switch between login and ledger screens."""
-    def __init__(self, tally_api, db_connector, cognito_auth):
+    # Emitted from startup threads: (phase name, error message or "")
+    startup_phase_done = pyqtSignal(str, str)
+    # Emitted when a stored Cognito session was restored: (username, user_type)
+    session_restored = pyqtSignal(str, str)
+    # Emitted from the license check thread: (username, user_type, LicenseResult, error, verify_only)
+    license_checked = pyqtSignal(str, str, object, str, bool)
+
+    def __init__(self, tally_api, db_connector, cognito_auth, startup=None, upload_queue=None):
         super().__init__()
         self.tally_api = tally_api
         self.db_connector = db_connector
         self.cognito_auth = cognito_auth
+        self.startup = startup
+        self.upload_queue = upload_queue
+        self.session = CognitoSession(cognito_auth)
+        self.session_restored.connect(self.on_session_restored)
+        self.license_service = LicenseService(db_connector)
+        self.license_checked.connect(self.on_license_checked)
         self.setWindowTitle("Tally Connector")
         self.resize(800, 600)
         self.stacked = QStackedWidget()
@@ -276,19 +473,61 @@ class MainWindow(QMainWindow):
         self.status_label = QLabel("WebSocket Status: Connecting...")
         self.statusBar().addWidget(self.status_label)
 
-        # Initialize WebSocket
+        # Initialize WebSocket (once the backend is ready when starting up lazily)
         self.ws = None
-        self.connect_websocket()
+        if self.startup is None:
+            self.connect_websocket()
+        else:
+            self.status_label.setText("Starting backend...")
+            self.startup_phase_done.connect(self.on_startup_phase_done)
+            for phase in ("backend", "db_connector", "cognito"):
+                self.startup.on_ready(phase, self._emit_startup_phase)
 
         # Setup login widget
-        self.login_widget = LoginWidget(self.cognito_auth)
+        self.login_widget = LoginWidget(self.cognito_auth, session=self.session)
         self.login_widget.switch_to_main_signal.connect(self.switch_to_ledger)
         self.stacked.addWidget(self.login_widget)
 
+        # Skip the login screen if a stored session is still usable
+        if self.startup is None:
+            self.restore_session()
+
+    def _emit_startup_phase(self, name, error):
+        # Called on a startup thread; hand over to the GUI thread via the signal
+        self.startup_phase_done.emit(name, str(error) if error else "")
+
+    def on_startup_phase_done(self, name, error):
+        if error:
+            logging.error("Startup phase '%s' failed: %s", name, error)
+            QMessageBox.critical(self, "Startup Error", f"Failed to initialize {name}: {error}")
+            return
+        if name == "backend":
+            self.connect_websocket()
+        if name == "cognito":
+            self.restore_session()
+        if all(self.startup.is_ready(phase) for phase in ("backend", "db_connector", "cognito")):
+            timings = self.startup.report()
+            logging.info("Startup timings: %s", ", ".join(f"{k}={v:.3f}s" for k, v in timings.items()))
+
+    def restore_session(self):
+        def worker():
+            try:
+                if self.session.restore():
+                    self.session_restored.emit(self.session.username, self.session.user_type)
+            except Exception as e:
+                logging.error("Could not restore session: %s", e)
+        threading.Thread(target=worker, daemon=True).start()
+
+    def on_session_restored(self, username, user_type):
+        # Ignore if the user already logged in by hand meanwhile
+        if self.stacked.currentWidget() is self.login_widget:
+            self.switch_to_ledger(username, user_type)
+
     def connect_websocket(self):
         if self.ws:
             self.ws.close()
         
+        from PyQt6.QtWebSockets import QWebSocket
         self.ws = QWebSocket()
         self.ws.connected.connect(self.on_ws_connected)
         self.ws.disconnected.connect(self.on_ws_disconnected)
@@ -323,70 +562,131 @@ class MainWindow(QMainWindow):
 
     def switch_to_ledger(self, username, user_type):
         if user_type == "silver":
-            current_hwid = get_hardware_id()
-            # Ensure a user record exists:
-            self.db_connector.create_user_if_not_exists(username)
-            registered_hwid, detected_hwid = self.db_connector.get_license_hardware(username)
-            if registered_hwid is None or registered_hwid.strip() == "":
-                # First-time login: store the current hardware ID as the registered hardware.
-                self.db_connector.create_license_record(username, current_hwid)
-                # self.db_connector.update_license_hardware(username, current_hwid)
-            elif registered_hwid != current_hwid:
-                # Hardware mismatch: update the detectedhardwareid column with the new hardware ID.
-                self.db_connector.update_detected_hardware(username, current_hwid)
-                QMessageBox.critical(
-                    self,
-                    "Hardware Mismatch",
-                    ("Your current hardware does not match the registered machine. "
-                    "The new hardware has been recorded in the license record. "
-                    "Please contact support if you wish to shift your license.")
-                )
-                self.switch_to_login()
+            # A valid signed result from an earlier start lets the user in at
+            # once; the online check then only re-verifies in the background.
+            cached = self.license_service.cached_result(username)
+            self.check_license(username, user_type, verify_only=cached is not None)
+            if cached is None:
+                self.statusBar().showMessage("Checking license...", 10000)
                 return
+        self.show_ledger(username, user_type)
 
-        # Proceed with login if hardware check passes (or for gold users)
-        self.ledger_widget = LedgerWidget(username, self.tally_api, self.db_connector, user_type)
+    def check_license(self, username, user_type, verify_only):
+        def worker():
+            try:
+                result = self.license_service.check(username)
+                self.license_checked.emit(username, user_type, result, "", verify_only)
+            except Exception as e:
+                logging.error("License check failed: %s", e)
+                self.license_checked.emit(username, user_type, None, str(e), verify_only)
+        threading.Thread(target=worker, name="license-check", daemon=True).start()
+
+    def on_license_checked(self, username, user_type, result, error, verify_only):
+        if self.session.username not in (None, username):
+            return  # A different user logged in meanwhile
+        if error:
+            if not verify_only:
+                QMessageBox.critical(self, "License Check Failed",
+                                     f"Could not verify your license: {error}")
+                self.switch_to_login()
+            return
+        if not result.allowed:
+            # Hardware mismatch: the new hardware ID was recorded in detectedhardwareid.
+            QMessageBox.critical(
+                self,
+                "Hardware Mismatch",
+                ("Your current hardware does not match the registered machine. "
+                "The new hardware has been recorded in the license record. "
+                "Please contact support if you wish to shift your license.")
+            )
+            self.switch_to_login()
+            return
+        if not verify_only:
+            self.show_ledger(username, user_type)
+
+    def show_ledger(self, username, user_type):
+        self.ledger_widget = LedgerWidget(
+            username, self.tally_api, self.db_connector, user_type, upload_queue=self.upload_queue
+        )
         self.ledger_widget.logout_btn.clicked.connect(self.switch_to_login)
         self.stacked.addWidget(self.ledger_widget)
         self.stacked.setCurrentWidget(self.ledger_widget)
 
     def switch_to_login(self):
+        if getattr(self, "ledger_widget", None):
+            self.ledger_widget.shutdown_sync()
+        self.session.sign_out()
         self.stacked.setCurrentWidget(self.login_widget)
 
     def closeEvent(self, event):
+        if getattr(self, "ledger_widget", None):
+            self.ledger_widget.shutdown_sync()
         if self.ws:
             self.ws.close()
         super().closeEvent(event)
 
+def wait_for_backend(timeout=30.0):
+    """Readiness probe for the flask_server subprocess (HTTP + WebSocket ports)."""
+    if not wait_for_http("http://localhost:5000/api/health", timeout=timeout):
+        raise TimeoutError("Flask server did not become ready")
+    if not wait_for_port("localhost", 8000, timeout=timeout):
+        raise TimeoutError("WebSocket server did not become ready")
+    return True
+
+def create_tally_api():
+    from tally_api import TallyAPI
+    return TallyAPI()
+
+def create_db_connector():
+    from db_connector import AwsDbConnector  # Existing AWS connector
+    return AwsDbConnector()
+
+def create_cognito_auth():
+    from cognito_auth import CognitoAuth
+    return CognitoAuth(COGNITO_USER_POOL_ID, COGNITO_CLIENT_ID, COGNITO_REGION)
+
+def create_upload_queue(db_connector):
+    from upload_queue import CloudUploadQueue
+    return CloudUploadQueue(db_connector).start()
+
 def main():
     from PyQt6.QtWidgets import QApplication
     import subprocess
-    import time
     import sys
-    # Initialize backend dependencies
+
+    startup = StartupOrchestrator()
 
     logging.info("Starting Flask Server...")
     flask_process = subprocess.Popen([sys.executable, "flask_server.py"])
 
-    #give the server time to start
-    time.sleep(2)
-
-    #Initialized backend dependencies
-    tally_api = TallyAPI()
-    try:
-        db_connector = AwsDbConnector()
-    except Exception as ve:
-        logging.error("Database configuration error: %s", ve)
-        return
-    cognito_auth = CognitoAuth(COGNITO_USER_POOL_ID, COGNITO_CLIENT_ID, COGNITO_REGION)
+    # Initialize backend dependencies in the background; the window is shown
+    # straight away and these are resolved on first use.
+    startup.submit("backend", wait_for_backend)
+    startup.submit("tally_api", create_tally_api)
+    startup.submit("db_connector", create_db_connector)
+    startup.submit("cognito", create_cognito_auth)
+    # wmic is slow; compute the (process-cached) hardware ID before login needs it
+    startup.submit("hardware_id", get_hardware_id)
+    # Drains uploads left over from earlier sessions as soon as it starts
+    startup.submit("upload_queue", create_upload_queue, startup.lazy("db_connector"))
 
     app = QApplication([])
-    window = MainWindow(tally_api, db_connector, cognito_auth)
+    window = MainWindow(
+        startup.lazy("tally_api"),
+        startup.lazy("db_connector"),
+        startup.lazy("cognito"),
+        startup=startup,
+        upload_queue=startup.lazy("upload_queue")
+    )
     window.show()
+    logging.info("Window shown after %.3fs", startup.report()["total"])
 
     try:
         app.exec()
     finally:
+        if startup.is_ready("upload_queue"):
+            startup.get("upload_queue").stop()
+        startup.shutdown()
         flask_process.terminate()
         flask_process.wait()
         
@@ -3,11 +3,14 @@ import os
 import platform
 import subprocess
 import uuid
+import functools
 
+@functools.lru_cache(maxsize=1)
 def get_hardware_id():
     """
     Returns a unique hardware identifier.
     On Windows, it tries to use 'wmic csproduct get uuid'; otherwise, it falls back to the MAC address.
+    The result is computed once per process, since shelling out to wmic is slow.
     """
     if platform.system() == "Windows":
         try:
@@ -0,0 +1,112 @@
+# import_benchmark.py
+"""
+Import-time regression check based on `python -X importtime`.
+
+For each entry module it measures the cumulative import time and checks that
+none of the heavy dependencies listed for it were imported eagerly. Exits
+non-zero on a regression, so it can run in CI or before a frozen build:
+
+    python import_benchmark.py
+    python import_benchmark.py --module app --budget-ms 150
+
+A module that fails to import counts as a failure, unless it is named with
+--allow-import-error (e.g. gui on a build agent without PyQt6).
+
+    python import_benchmark.py --allow-import-error gui
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+HEAVY_MODULES = (
+    "pandas", "pdfplumber", "dateutil", "tkinter", "sqlalchemy",
+    "boto3", "botocore", "lxml", "websockets", "PyQt6.QtWebSockets", "jwt",
+)
+
+# Entry module -> (time budget in ms, heavy modules that must not load eagerly)
+IMPORT_BUDGETS = {
+    "app": (150, HEAVY_MODULES),
+    "exporter": (50, HEAVY_MODULES),
+    "tally_api": (300, ("lxml", "sqlalchemy", "pandas", "pdfplumber", "boto3")),
+    "websocket_server": (300, ("sqlalchemy", "pandas", "pdfplumber", "boto3", "lxml")),
+    "flask_server": (800, ("sqlalchemy", "pandas", "pdfplumber", "boto3", "lxml", "websockets")),
+    "gui": (1500, ("sqlalchemy", "pandas", "pdfplumber", "boto3", "botocore", "lxml",
+                   "PyQt6.QtWebSockets", "jwt")),
+}
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+def measure_import(module, python=sys.executable):
+    """
+    Import module in a fresh interpreter with -X importtime.
+    Returns (cumulative microseconds, set of imported module names).
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=here, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        last_line = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "unknown error"
+        raise RuntimeError(f"import {module} failed: {last_line}")
+
+    imported = set()
+    cumulative = 0
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if not m:
+            continue
+        name = m.group(4)
+        imported.add(name)
+        if name == module:
+            cumulative = int(m.group(2))
+    return cumulative, imported
+
+def check_module(module, budget_ms, forbidden):
+    """Return a list of problems found for module (empty if it passes)."""
+    cumulative_us, imported = measure_import(module)
+    problems = []
+    eager = sorted(
+        name for name in forbidden
+        if name in imported or any(m.startswith(name + ".") for m in imported)
+    )
+    if eager:
+        problems.append(f"eagerly imports {', '.join(eager)}")
+    if cumulative_us / 1000 > budget_ms:
+        problems.append(f"took {cumulative_us / 1000:.1f}ms (budget {budget_ms}ms)")
+    return cumulative_us, problems
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Check module import times.")
+    arg_parser.add_argument("--module", action="append", help="Only check these modules")
+    arg_parser.add_argument("--budget-ms", type=float, help="Override the time budget")
+    arg_parser.add_argument("--allow-import-error", action="append", default=[], metavar="MODULE",
+                            help="Skip instead of failing when this module cannot be imported")
+    args = arg_parser.parse_args(argv)
+
+    modules = args.module or list(IMPORT_BUDGETS)
+    failures = 0
+    for module in modules:
+        budget_ms, forbidden = IMPORT_BUDGETS.get(module, (200, HEAVY_MODULES))
+        if args.budget_ms is not None:
+            budget_ms = args.budget_ms
+        try:
+            cumulative_us, problems = check_module(module, budget_ms, forbidden)
+        except RuntimeError as e:
+            if module in args.allow_import_error:
+                print(f"[SKIP] {module}: {e}")
+            else:
+                failures += 1
+                print(f"[FAIL] {module}: {e}")
+            continue
+        if problems:
+            failures += 1
+            print(f"[FAIL] {module}: {'; '.join(problems)}")
+        else:
+            print(f"[OK]   {module}: {cumulative_us / 1000:.1f}ms")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
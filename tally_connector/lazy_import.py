@@ -0,0 +1,37 @@
+# lazy_import.py
+import importlib
+import threading
+
+class LazyModule:
+    """
+    Module stand-in that imports the real module on first attribute access.
+    Lets heavy dependencies (pandas, pdfplumber, SQLAlchemy, ...) stay out of
+    the import path until they are actually used:
+
+        pd = LazyModule("pandas")
+        pd.DataFrame(...)  # pandas is imported here
+    """
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__dict__["_name"])
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<LazyModule {self.__dict__['_name']!r} ({state})>"
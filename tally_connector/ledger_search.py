@@ -0,0 +1,125 @@
+# ledger_search.py
+"""
+Server-side ledger name search, so dropdowns can ask for the top matches
+instead of downloading every ledger of the company.
+
+The index for a company holds:
+
+  * a prefix index: the lower-cased names in one sorted array and their
+    word-start suffixes ("sharma traders" -> "traders") in another. The
+    keys starting with a prefix are a contiguous range found by bisect,
+    which is what a prefix trie gives, without a Python object per node.
+    Whole names are looked up first, so a crowd of names merely containing
+    the word cannot push them out of the results.
+  * a trigram index: trigram -> sorted array of ledger ids, for typos and
+    matches inside words. Candidates come from the query's rarest trigrams
+    only; common ones are just checked against those candidates.
+
+Prefix matches rank above fuzzy ones; shorter names win ties.
+"""
+import re
+import math
+import heapq
+import bisect
+from array import array
+from collections import defaultdict
+
+_WORD_START_RE = re.compile(r"(?<=[\s\-_/(&.,])(?=\w)")
+_SPACE_RE = re.compile(r"\s+")
+
+FULL_PREFIX_SCORE = 3.0
+WORD_PREFIX_SCORE = 2.0
+# Share of the query's trigrams a fuzzy match must contain
+MIN_TRIGRAM_OVERLAP = 0.5
+
+def normalize(text):
+    return _SPACE_RE.sub(" ", (text or "").lower()).strip()
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class LedgerSearchIndex:
+    def __init__(self, names):
+        entries = sorted((normalize(name), name) for name in set(names) if name)
+        self.names = [name for _, name in entries]
+        # Ledger ids follow this order, so the names matching a prefix are an id range
+        self.full_keys = [key for key, _ in entries]
+        keys = []
+        postings = defaultdict(list)
+        self.trigram_counts = array("H")
+        for ledger_id, (key, _) in enumerate(entries):
+            for match in _WORD_START_RE.finditer(key):
+                keys.append((key[match.start():], ledger_id))
+            grams = _trigrams(key)
+            self.trigram_counts.append(min(len(grams), 65535))
+            for gram in grams:
+                postings[gram].append(ledger_id)
+        keys.sort()
+        self.word_keys = [key for key, _ in keys]
+        self.word_ids = array("i", (ledger_id for _, ledger_id in keys))
+        # Ids were appended in order, so every posting is already sorted
+        self.trigram_postings = {gram: array("i", ids) for gram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _prefix_matches(self, query, limit):
+        """{ledger id: score} for names starting with query, then names with a word starting with it."""
+        start = bisect.bisect_left(self.full_keys, query)
+        end = bisect.bisect_left(self.full_keys, query + "\uffff", start)
+        if end - start >= limit:
+            # Only the shortest can make the results
+            best = heapq.nsmallest(limit, range(start, end), key=lambda ledger_id: len(self.names[ledger_id]))
+            return dict.fromkeys(best, FULL_PREFIX_SCORE)
+        matches = dict.fromkeys(range(start, end), FULL_PREFIX_SCORE)
+        start = bisect.bisect_left(self.word_keys, query)
+        end = bisect.bisect_left(self.word_keys, query + "\uffff", start)
+        for i in range(start, end):
+            matches.setdefault(self.word_ids[i], WORD_PREFIX_SCORE)
+            if len(matches) >= limit * 4:
+                break
+        return matches
+
+    def _fuzzy_matches(self, query):
+        """{ledger id: Dice similarity} for names sharing enough trigrams with query."""
+        grams = sorted(
+            (self.trigram_postings[gram] for gram in _trigrams(query) if gram in self.trigram_postings),
+            key=len
+        )
+        query_grams = len(_trigrams(query))
+        needed = max(1, math.ceil(query_grams * MIN_TRIGRAM_OVERLAP))
+        if len(grams) < needed:
+            return {}
+        # A name sharing `needed` trigrams must appear in one of the rarest len - needed + 1 postings
+        seed_count = len(grams) - needed + 1
+        overlap = defaultdict(int)
+        for posting in grams[:seed_count]:
+            for ledger_id in posting:
+                overlap[ledger_id] += 1
+        for posting in grams[seed_count:]:
+            size = len(posting)
+            for ledger_id in overlap:
+                i = bisect.bisect_left(posting, ledger_id)
+                if i < size and posting[i] == ledger_id:
+                    overlap[ledger_id] += 1
+        return {
+            ledger_id: 2.0 * shared / (query_grams + self.trigram_counts[ledger_id])
+            for ledger_id, shared in overlap.items() if shared >= needed
+        }
+
+    def search(self, query, limit=20):
+        """Up to limit ledger names matching query, best first."""
+        query = normalize(query)
+        if not query:
+            return self.names[:limit]
+        scores = self._prefix_matches(query, limit)
+        if len(scores) < limit:
+            for ledger_id, similarity in self._fuzzy_matches(query).items():
+                if ledger_id not in scores:
+                    scores[ledger_id] = similarity
+        best = heapq.nsmallest(
+            limit, scores.items(),
+            key=lambda item: (-item[1], len(self.names[item[0]]), item[0])
+        )
+        return [self.names[ledger_id] for ledger_id, _ in best]
@@ -0,0 +1,218 @@
+# ledger_suggester.py
+"""
+Ranked ledger suggestions for bank statement rows.
+
+Two inverted indexes are built in memory per company:
+
+  * history: token (and adjacent token pair) of past descriptions ->
+    {assigned ledger: count}. Postings are aggregated per ledger, so looking
+    a token up costs the number of ledgers it was used for, not the number of
+    past transactions, and stays flat as history grows.
+  * ledger names: token -> ledgers whose name contains it, plus character
+    trigrams of name tokens (and of the name written without spaces) for
+    near matches ("SHARMATRADERS", "TRADRS").
+
+A row's score for a ledger is the sum over its tokens of
+idf(token) * P(ledger | token) from history, plus a weighted name match.
+Weighted postings are computed once per term and cut to the MAX_POSTINGS
+strongest ledgers, so a common word costs the same as a rare one.
+Descriptions repeat a lot in statements, so results are memoised per batch.
+Assignments made after the index was built are applied with add_history /
+remove_history instead of rebuilding it.
+"""
+import re
+import math
+import heapq
+import threading
+from collections import defaultdict
+
+# Letters only: digits are reference numbers, dates and amounts, which never
+# identify a ledger and would defeat the per-term caches
+TOKEN_RE = re.compile(r"[a-z]{2,}")
+# Bank narration boilerplate carries no information about the ledger
+STOP_TOKENS = frozenset((
+    "neft", "rtgs", "imps", "upi", "ach", "nach", "ecs", "inb", "ib", "mb", "pos", "atm", "chq", "cheque",
+    "clg", "trf", "transfer", "to", "by", "from", "for", "the", "of", "and", "ref", "no", "txn", "dr", "cr",
+    "payment", "ltd", "pvt", "private", "limited", "co",
+))
+NAME_WEIGHT = 2.0
+FUZZY_MIN_SIMILARITY = 0.4
+FUZZY_MIN_LENGTH = 4
+MAX_POSTINGS = 32
+
+def tokenize(text):
+    """Lower-cased word tokens without boilerplate or numbers."""
+    return [token for token in TOKEN_RE.findall((text or "").lower()) if token not in STOP_TOKENS]
+
+def _terms(tokens):
+    """Tokens plus adjacent pairs, which reward phrase matches ("sharma traders")."""
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+def _trigrams(token):
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class LedgerSuggester:
+    def __init__(self, ledger_names=(), history=()):
+        """
+        ledger_names: the company's current ledgers. history: iterable of
+        (description, assigned_ledger) or (description, assigned_ledger, count).
+        """
+        self.ledgers = set(ledger_names)
+        self.history_postings = defaultdict(lambda: defaultdict(int))  # term -> {ledger: count}
+        self.term_totals = defaultdict(int)
+        self.history_rows = 0
+        self.name_postings = defaultdict(set)  # token -> ledgers
+        self.name_token_counts = {}
+        self.trigram_postings = defaultdict(set)  # trigram -> name tokens
+        self.fuzzy_cache = {}
+        self.weight_cache = {}
+        # History can change while another thread is ranking
+        self.lock = threading.Lock()
+        for name in self.ledgers:
+            self._index_name(name)
+        for entry in history:
+            self.add_history(*entry)
+
+    def _index_name(self, name):
+        words = tokenize(name)
+        tokens = set(words)
+        self.name_token_counts[name] = max(1, len(tokens))
+        if len(tokens) > 1:
+            # Narrations often run the name together ("SHARMATRADERS")
+            tokens.add("".join(words))
+        for token in tokens:
+            self.name_postings[token].add(name)
+            if len(token) >= FUZZY_MIN_LENGTH:
+                for trigram in _trigrams(token):
+                    self.trigram_postings[trigram].add(token)
+
+    def add_history(self, description, ledger, count=1):
+        """Record that description was assigned to ledger (count times)."""
+        if not ledger:
+            return
+        with self.lock:
+            self.history_rows += count
+            for term in set(_terms(tokenize(description))):
+                self.history_postings[term][ledger] += count
+                self.term_totals[term] += count
+            self.weight_cache.clear()
+
+    def remove_history(self, description, ledger, count=1):
+        """Undo add_history(description, ledger, count), e.g. when an assignment is edited."""
+        if not ledger:
+            return
+        with self.lock:
+            self.history_rows = max(0, self.history_rows - count)
+            for term in set(_terms(tokenize(description))):
+                postings = self.history_postings.get(term)
+                if not postings or ledger not in postings:
+                    continue
+                removed = min(count, postings[ledger])
+                postings[ledger] -= removed
+                self.term_totals[term] -= removed
+                if not postings[ledger]:
+                    del postings[ledger]
+                if not postings:
+                    del self.history_postings[term]
+                    del self.term_totals[term]
+            self.weight_cache.clear()
+
+    def _fuzzy_name_tokens(self, token):
+        """Name tokens similar to token by trigram Jaccard similarity (memoised)."""
+        cached = self.fuzzy_cache.get(token)
+        if cached is not None:
+            return cached
+        matches = []
+        if len(token) >= FUZZY_MIN_LENGTH:
+            grams = _trigrams(token)
+            overlap = defaultdict(int)
+            for gram in grams:
+                for candidate in self.trigram_postings.get(gram, ()):
+                    overlap[candidate] += 1
+            for candidate, shared in overlap.items():
+                similarity = shared / (len(grams) + len(_trigrams(candidate)) - shared)
+                if similarity >= FUZZY_MIN_SIMILARITY and candidate != token:
+                    matches.append((candidate, similarity))
+        self.fuzzy_cache[token] = matches
+        return matches
+
+    def _history_weights(self, term):
+        """[(ledger, idf * P(ledger | term))] for the strongest ledgers of term (memoised)."""
+        key = ("history", term)
+        weights = self.weight_cache.get(key)
+        if weights is None:
+            weights = []
+            postings = self.history_postings.get(term)
+            if postings:
+                term_total = self.term_totals[term]
+                idf = math.log(1 + self.history_rows / term_total)
+                weights = heapq.nlargest(
+                    MAX_POSTINGS,
+                    ((ledger, idf * count / term_total) for ledger, count in postings.items()
+                     if not self.ledgers or ledger in self.ledgers),
+                    key=lambda item: item[1]
+                )
+            self.weight_cache[key] = weights
+        return weights
+
+    def _name_weights(self, token):
+        """[(ledger, weight)] for ledgers whose name matches token exactly or nearly (memoised)."""
+        key = ("name", token)
+        weights = self.weight_cache.get(key)
+        if weights is None:
+            ledger_count = max(1, len(self.ledgers))
+            matches = [(token, 1.0)] if token in self.name_postings else self._fuzzy_name_tokens(token)
+            combined = defaultdict(float)
+            for name_token, similarity in matches:
+                names = self.name_postings[name_token]
+                idf = math.log(1 + ledger_count / len(names))
+                for name in names:
+                    combined[name] += NAME_WEIGHT * similarity * idf / self.name_token_counts[name]
+            weights = heapq.nlargest(MAX_POSTINGS, combined.items(), key=lambda item: item[1])
+            self.weight_cache[key] = weights
+        return weights
+
+    def scores(self, description):
+        """{ledger: score} for one description."""
+        with self.lock:
+            return self._scores(tokenize(description))
+
+    def _scores(self, tokens):
+        scores = defaultdict(float)
+        for term in _terms(tokens):
+            for ledger, weight in self._history_weights(term):
+                scores[ledger] += weight
+        for token in set(tokens):
+            for ledger, weight in self._name_weights(token):
+                scores[ledger] += weight
+        return scores
+
+    def suggest(self, description, top_k=3):
+        """Best ledgers for description as [{"ledger", "score", "confidence"}]."""
+        with self.lock:
+            return self._rank(tokenize(description), top_k)
+
+    def _rank(self, tokens, top_k):
+        scores = self._scores(tokens)
+        if not scores:
+            return []
+        total = sum(scores.values())
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [
+            {"ledger": ledger, "score": round(score, 4), "confidence": round(score / total, 4)}
+            for ledger, score in best
+        ]
+
+    def suggest_batch(self, descriptions, top_k=3):
+        """suggest() for many descriptions; repeated descriptions are scored once."""
+        memo = {}
+        results = []
+        with self.lock:
+            for description in descriptions:
+                tokens = tokenize(description)
+                key = " ".join(tokens)
+                if key not in memo:
+                    memo[key] = self._rank(tokens, top_k)
+                results.append(memo[key])
+        return results
@@ -0,0 +1,207 @@
+# license_service.py
+import os
+import hmac
+import json
+import time
+import hashlib
+import logging
+import secrets
+import datetime
+import threading
+
+from hardware import get_hardware_id
+import dpapi
+from session_store import SESSION_DIR, KEYRING_SERVICE
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# How long a cached "license ok" result lets silver users start without
+# reaching the license database.
+LICENSE_OFFLINE_GRACE_DAYS = float(os.getenv("LICENSE_OFFLINE_GRACE_DAYS", "7"))
+# Signing secret for the cache. Without it, a random per-install secret is
+# kept in the OS keyring, or in SESSION_DIR readable only by the current user.
+LICENSE_CACHE_SECRET = os.getenv("LICENSE_CACHE_SECRET")
+LICENSE_SECRET_KEYRING_USER = "license-cache-secret"
+
+_secret = None
+_secret_lock = threading.Lock()
+
+class LicenseResult:
+    """Outcome of a license check. status is "ok", "registered" or "mismatch"."""
+    __slots__ = ("username", "hardware_id", "status", "valid_till", "checked_at", "cached")
+
+    def __init__(self, username, hardware_id, status, valid_till=None, checked_at=None, cached=False):
+        self.username = username
+        self.hardware_id = hardware_id
+        self.status = status
+        self.valid_till = valid_till
+        self.checked_at = checked_at if checked_at is not None else time.time()
+        self.cached = cached
+
+    @property
+    def allowed(self):
+        return self.status in ("ok", "registered")
+
+    def as_dict(self):
+        return {
+            "username": self.username,
+            "hardware_id": self.hardware_id,
+            "status": self.status,
+            "valid_till": self.valid_till,
+            "checked_at": self.checked_at,
+        }
+
+def _keyring_secret():
+    """The secret kept in the OS keyring (created there if missing), or None without a usable keyring."""
+    try:
+        import keyring
+    except ImportError:
+        return None
+    try:
+        secret = keyring.get_password(KEYRING_SERVICE, LICENSE_SECRET_KEYRING_USER)
+        if not secret:
+            secret = secrets.token_hex(32)
+            keyring.set_password(KEYRING_SERVICE, LICENSE_SECRET_KEYRING_USER, secret)
+        return secret
+    except Exception as e:
+        # e.g. NoKeyringError on a headless Linux box
+        logging.info("Keyring unavailable for the license cache secret (%s); using a file.", e)
+        return None
+
+def _file_secret(path):
+    """The secret kept in path (created, readable only by this user, if missing)."""
+    try:
+        with open(path, "rb") as f:
+            return dpapi.unprotect(f.read()).decode("utf-8")
+    except FileNotFoundError:
+        pass
+    secret = secrets.token_hex(32)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another process got there first; use its secret
+        return _file_secret(path)
+    with os.fdopen(fd, "wb") as f:
+        f.write(dpapi.protect(secret.encode("utf-8")))
+    return secret
+
+def _load_or_create_secret(path):
+    """This install's cache secret, generated on first use. None if it cannot be stored."""
+    secret = _keyring_secret()
+    if secret:
+        return secret
+    try:
+        return _file_secret(path)
+    except Exception as e:
+        logging.warning("No license cache secret available; offline starts are disabled: %s", e)
+        return None
+
+def _cache_secret():
+    global _secret
+    if LICENSE_CACHE_SECRET:
+        return LICENSE_CACHE_SECRET
+    with _secret_lock:
+        if _secret is None:
+            _secret = _load_or_create_secret(os.path.join(SESSION_DIR, "license.key"))
+        return _secret
+
+def _sign(payload, hardware_id):
+    """HMAC of payload, or None when there is no secret to sign with."""
+    secret = _cache_secret()
+    if not secret:
+        return None
+    # Keyed on the machine too, so a cache file copied to another PC is rejected
+    key = hashlib.sha256(f"{secret}:{hardware_id}".encode("utf-8")).digest()
+    message = json.dumps(payload, sort_keys=True).encode("utf-8")
+    return hmac.new(key, message, hashlib.sha256).hexdigest()
+
+class LicenseService:
+    """
+    Hardware license check for silver users. The check is one round trip to
+    the license database (AwsDbConnector.check_license) and is meant to run
+    off the GUI thread. Every allowed result is cached locally with an HMAC
+    signature, so the next start can proceed at once from the cache (and
+    re-verify in the background) and offline starts work within the grace
+    period.
+    """
+    def __init__(self, db_connector, cache_path=None, grace_days=LICENSE_OFFLINE_GRACE_DAYS):
+        self.db_connector = db_connector
+        self.cache_path = cache_path or os.path.join(SESSION_DIR, "license.json")
+        self.grace_seconds = grace_days * 86400
+
+    def cached_result(self, username):
+        """Signed cached result for username on this machine, or None."""
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning("Could not read license cache: %s", e)
+            return None
+
+        payload = stored.get("payload") or {}
+        hardware_id = get_hardware_id()
+        if payload.get("username") != username or payload.get("hardware_id") != hardware_id:
+            return None
+        signature = _sign(payload, hardware_id)
+        if signature is None or not hmac.compare_digest(stored.get("signature", ""), signature):
+            logging.warning("License cache signature mismatch; ignoring it.")
+            return None
+        if time.time() - payload.get("checked_at", 0) > self.grace_seconds:
+            return None
+        valid_till = payload.get("valid_till")
+        if valid_till and datetime.datetime.fromisoformat(valid_till) < datetime.datetime.now(datetime.timezone.utc):
+            return None
+        return LicenseResult(username, hardware_id, payload.get("status"), valid_till,
+                             payload.get("checked_at"), cached=True)
+
+    def _store(self, result):
+        payload = result.as_dict()
+        signature = _sign(payload, result.hardware_id)
+        if signature is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            fd = os.open(self.cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"payload": payload, "signature": signature}, f)
+        except OSError as e:
+            logging.warning("Could not write license cache: %s", e)
+
+    def clear(self):
+        try:
+            os.remove(self.cache_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning("Could not clear license cache: %s", e)
+
+    def check(self, username):
+        """
+        Check the license online. Falls back to the cached result if the
+        license database cannot be reached; raises if there is none.
+        """
+        hardware_id = get_hardware_id()
+        try:
+            status, valid_till, _ = self.db_connector.check_license(username, hardware_id)
+        except Exception as e:
+            cached = self.cached_result(username)
+            if cached is None:
+                raise
+            logging.warning("License check offline (%s); using cached result from %s.",
+                            e, datetime.datetime.fromtimestamp(cached.checked_at).isoformat())
+            return cached
+
+        if isinstance(valid_till, datetime.datetime):
+            if valid_till.tzinfo is None:
+                valid_till = valid_till.replace(tzinfo=datetime.timezone.utc)
+            valid_till = valid_till.isoformat()
+        result = LicenseResult(username, hardware_id, status, valid_till)
+        if result.allowed:
+            self._store(result)
+        else:
+            self.clear()
+        logging.info("License check for %s: %s", username, status)
+        return result
@@ -1,30 +1,41 @@
 # line_identifier.py
 
-import tkinter as tk
-from tkinter import filedialog, messagebox
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pdfplumber
-import pandas as pd
 
-def extract_lines_to_excel(pdf_path, output_path):
+from exporter import export_rows, LINE_COLUMNS
+from lazy_import import LazyModule
+
+# Only the dialog needs Tk; the batch CLI runs without it
+tk = LazyModule("tkinter")
+filedialog = LazyModule("tkinter.filedialog")
+messagebox = LazyModule("tkinter.messagebox")
+
+def iter_pdf_lines(pdf_path):
     """
-    Extract all lines from the PDF into an Excel file, each line in a separate row,
-    so the user can see what lines appear in the statement.
+    Yield (page #, line #, content) for every line of the PDF, one page at a
+    time, so memory use does not grow with the document size.
     """
-    lines = []
     with pdfplumber.open(pdf_path) as pdf:
         for page_idx, page in enumerate(pdf.pages, start=1):
             text = page.extract_text()
             if text:
                 page_lines = text.split('\n')
                 for ln_idx, ln in enumerate(page_lines, start=1):
-                    lines.append({
-                        "Page #": page_idx,
-                        "Line #": ln_idx,
-                        "Content": ln.strip()
-                    })
+                    yield (page_idx, ln_idx, ln.strip())
+            # Release the page's parsed objects before moving on
+            page.flush_cache()
 
-    df = pd.DataFrame(lines, columns=["Page #", "Line #", "Content"])
-    df.to_excel(output_path, index=False)
+def extract_lines_to_excel(pdf_path, output_path, fmt=None):
+    """
+    Extract all lines from the PDF into an Excel file, each line in a separate row,
+    so the user can see what lines appear in the statement.
+    A .csv or .parquet output_path (or fmt) selects those formats instead.
+    """
+    return export_rows(iter_pdf_lines(pdf_path), LINE_COLUMNS, output_path, fmt)
 
 def on_select_pdf(pdf_path_var):
     file_path = filedialog.askopenfilename(
@@ -43,7 +54,7 @@ def on_extract(pdf_path_var):
     save_path = filedialog.asksaveasfilename(
         title="Save Excel File",
         defaultextension=".xlsx",
-        filetypes=[("Excel Files", "*.xlsx"), ("All Files", "*.*")]
+        filetypes=[("Excel Files", "*.xlsx"), ("CSV Files", "*.csv"), ("Parquet Files", "*.parquet"), ("All Files", "*.*")]
     )
     if not save_path:
         return
@@ -75,5 +86,72 @@ def main():
 
     root.mainloop()
 
+# --- Headless CLI (batch indexing) ---
+def output_paths(pdf_paths, output_dir, fmt):
+    """
+    {pdf path: output path}. Outputs mirror the PDFs' folders below their
+    common parent, so statements with the same name in different folders do
+    not overwrite each other.
+    """
+    folders = [os.path.dirname(os.path.abspath(pdf_path)) for pdf_path in pdf_paths]
+    try:
+        root = os.path.commonpath(folders)
+    except ValueError:
+        # Different drives on Windows
+        root = None
+    paths = {}
+    taken = set()
+    for pdf_path, folder in zip(pdf_paths, folders):
+        base = os.path.splitext(os.path.basename(pdf_path))[0]
+        relative = os.path.relpath(folder, root) if root else ""
+        output_path = os.path.normpath(os.path.join(output_dir, relative, f"{base}_lines.{fmt}"))
+        n = 1
+        while os.path.normcase(output_path) in taken:
+            n += 1
+            output_path = os.path.normpath(os.path.join(output_dir, relative, f"{base}_lines_{n}.{fmt}"))
+        taken.add(os.path.normcase(output_path))
+        paths[pdf_path] = output_path
+    return paths
+
+def _index_one(pdf_path, output_path, fmt):
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    count = extract_lines_to_excel(pdf_path, output_path, fmt)
+    return output_path, count
+
+def run_cli(argv=None):
+    """
+    Index many PDFs without the Tkinter dialog, one output file per PDF.
+    Example: python line_identifier.py statements/*.pdf -o out --format csv -j 4
+    """
+    arg_parser = argparse.ArgumentParser(description="Extract every line of one or more PDFs.")
+    arg_parser.add_argument("pdfs", nargs="+", help="PDF files to index")
+    arg_parser.add_argument("-o", "--output-dir", default=".", help="Directory for the output files")
+    arg_parser.add_argument("--format", default="xlsx", choices=["xlsx", "csv", "parquet"])
+    arg_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                            help="Number of worker processes")
+    args = arg_parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    # The same file named twice is indexed once
+    pdf_paths = list(dict.fromkeys(args.pdfs))
+    targets = output_paths(pdf_paths, args.output_dir, args.format)
+    failures = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {
+            pool.submit(_index_one, pdf_path, targets[pdf_path], args.format): pdf_path
+            for pdf_path in pdf_paths
+        }
+        for future in as_completed(futures):
+            pdf_path = futures[future]
+            try:
+                output_path, count = future.result()
+                print(f"[✓] {pdf_path}: {count} lines -> {output_path}")
+            except Exception as e:
+                failures += 1
+                print(f"[❌ Error] {pdf_path}: {e}")
+    return 1 if failures else 0
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_cli())
     main()
@@ -1,17 +1,97 @@
+import re
 import datetime
+import hashlib
+import itertools
 import logging
 import uuid
-from sqlalchemy import create_engine, Table, Column, Integer, String, MetaData, DateTime, JSON, Numeric, select, update, func
+from decimal import Decimal
+from sqlalchemy import (
+    create_engine, Table, Column, Integer, BigInteger, String, MetaData, DateTime, Date, Boolean, JSON, Numeric,
+    Index, ForeignKey, select, update, delete, func, text, bindparam
+)
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from lookup_cache import lookup_cache, touch_sync_marker
+from telemetry import instrument_engine
+from tally_records import as_ledger_table, parse_amount, to_scaled
+from ledger_suggester import LedgerSuggester
+from ledger_search import LedgerSearchIndex
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Unique index backing the ON CONFLICT upsert of user-company mappings. On a
+# database created before it, duplicates left by the old select-then-insert
+# code are removed once, when the index is built.
+USER_COMPANIES_UNIQUE_INDEX = "uq_user_companies_user_company"
+USER_COMPANIES_DEDUPLICATE = (
+    "DELETE FROM user_companies WHERE id NOT IN "
+    "(SELECT MIN(id) FROM user_companies GROUP BY user_email, company_id)"
+)
+USER_COMPANIES_CREATE_INDEX = (
+    f"CREATE UNIQUE INDEX IF NOT EXISTS {USER_COMPANIES_UNIQUE_INDEX} "
+    "ON user_companies (user_email, company_id)"
+)
+
+# Index backing duplicate detection of statement rows (see transaction_fingerprint)
+TRANSACTION_FINGERPRINT_INDEX = "ix_temporary_transactions_fingerprint"
+# SQLite limits bound parameters per statement
+FINGERPRINT_LOOKUP_BATCH = 500
+_DESCRIPTION_NOISE_RE = re.compile(r"[^a-z0-9]+")
+
+def transaction_fingerprint(company, bank_account, transaction_date, transaction_type, amount, description,
+                            occurrence=0):
+    """
+    Hash identifying a statement transaction across uploads: company, bank
+    account, date, type, amount and the description with case, spacing and
+    punctuation removed. occurrence numbers identical rows within one upload,
+    so two genuine same-day payments of the same amount to the same payee are
+    not taken for each other.
+    """
+    parsed = parse_amount(amount)
+    key = "\x1f".join((
+        str(company or ""),
+        (bank_account or "").strip().lower(),
+        transaction_date.strftime("%Y-%m-%d") if transaction_date else "",
+        (transaction_type or "").strip().lower(),
+        str(to_scaled(abs(parsed))) if parsed is not None else "",
+        _DESCRIPTION_NOISE_RE.sub("", (description or "").lower()),
+        str(occurrence),
+    ))
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+def _assign_fingerprints(rows):
+    """Set "fingerprint" on the insert values of one upload's rows."""
+    occurrences = {}
+    for row in rows:
+        base = (row["company"], row["bank_account"], row["transaction_date"], row["transaction_type"],
+                row["amount"], row["description"])
+        occurrence = occurrences.get(base, 0)
+        occurrences[base] = occurrence + 1
+        row["fingerprint"] = transaction_fingerprint(*base, occurrence=occurrence)
+    return rows
+
+# (db_path, company_id) and (db_path, user_email, company_id) known to exist
+_known_companies = set()
+_known_mappings = set()
+
+# Lookup namespaces that change when ledgers are synced
+LEDGER_LOOKUP_NAMESPACES = (
+    "companies", "bank_accounts", "ledger_options", "company_names", "ledger_suggesters", "ledger_search"
+)
+
 class LocalDbConnector:
     def __init__(self, db_path="local_storage.db"):
-        self.engine = create_engine(f"sqlite:///{db_path}", echo=False, future=True)
+        self.db_path = db_path
+        self.engine = instrument_engine(create_engine(f"sqlite:///{db_path}", echo=False, future=True), "local")
         self.metadata = MetaData()
         self.define_tables()
         self.metadata.create_all(self.engine)
+        self._migrate_user_companies()
+        self._migrate_transaction_fingerprints()
+        # Touched by upload_ledgers so other processes drop their cached lookups
+        self.sync_marker = f"{db_path}.sync"
+        for namespace in LEDGER_LOOKUP_NAMESPACES:
+            lookup_cache.bind_marker(namespace, self.sync_marker)
         logging.info("Local SQLite database initialized and tables created if not present.")
 
     def define_tables(self):
@@ -43,7 +123,8 @@ class LocalDbConnector:
             Column('id', Integer, primary_key=True, autoincrement=True),
             Column('user_email', String(255), nullable=False),
             Column('company_id', String, nullable=False),
-            Column('role', String(50), nullable=True)
+            Column('role', String(50), nullable=True),
+            Index(USER_COMPANIES_UNIQUE_INDEX, 'user_email', 'company_id', unique=True)
         )
 
         # Ledgers Table
@@ -85,7 +166,8 @@ class LocalDbConnector:
             Column('description', String, nullable=False),
             Column('amount', Numeric, nullable=True),
             Column('assigned_ledger', String, nullable=True, default=""),
-            Column('status', String, nullable=True, default="")
+            Column('status', String, nullable=True, default=""),
+            Column('fingerprint', String, nullable=True)
         )
 
          # --- New Table: user_temp_tables ---
@@ -98,6 +180,88 @@ class LocalDbConnector:
             Column('uploaded_file', String, nullable=False)
         )
 
+        # --- Vouchers exported from Tally (see voucher_sync.py) ---
+        # Amounts are stored in paise so matching against statements is exact.
+        self.tally_vouchers = Table(
+            'tally_vouchers', self.metadata,
+            Column('id', Integer, primary_key=True, autoincrement=True),
+            Column('company_id', String, nullable=False),
+            Column('guid', String, nullable=True),
+            Column('master_id', BigInteger, nullable=True),
+            Column('alter_id', BigInteger, nullable=True),
+            Column('voucher_date', Date, nullable=True),
+            Column('voucher_type', String, nullable=True),
+            Column('voucher_number', String, nullable=True),
+            Column('party_ledger', String, nullable=True),
+            Column('narration', String, nullable=True),
+            Column('synced_at', DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc)),
+            Index('ix_tally_vouchers_company_date', 'company_id', 'voucher_date'),
+            Index('uq_tally_vouchers_company_guid', 'company_id', 'guid', unique=True)
+        )
+
+        self.tally_voucher_entries = Table(
+            'tally_voucher_entries', self.metadata,
+            Column('id', Integer, primary_key=True, autoincrement=True),
+            Column('voucher_id', Integer, ForeignKey('tally_vouchers.id', ondelete='CASCADE'), nullable=False),
+            Column('company_id', String, nullable=False),
+            Column('ledger_name', String, nullable=False),
+            Column('voucher_date', Date, nullable=True),  # copied from the voucher for ledger/date lookups
+            Column('amount_paise', BigInteger, nullable=False),  # Tally sign: debit negative
+            Column('is_debit', Boolean, nullable=False),
+            Index('ix_tally_voucher_entries_voucher', 'voucher_id'),
+            Index('ix_tally_voucher_entries_ledger_date', 'company_id', 'ledger_name', 'voucher_date')
+        )
+
+        # Period already exported per company, for incremental voucher syncs
+        self.tally_voucher_sync = Table(
+            'tally_voucher_sync', self.metadata,
+            Column('company_id', String, primary_key=True),
+            Column('synced_from', Date, nullable=False),
+            Column('synced_to', Date, nullable=False),
+            Column('updated_at', DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc),
+                   onupdate=lambda: datetime.datetime.now(datetime.timezone.utc))
+        )
+
+    def _migrate_user_companies(self):
+        """Deduplicate user_companies and build its unique index on databases created without it."""
+        with self.engine.begin() as connection:
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"),
+                {"name": USER_COMPANIES_UNIQUE_INDEX}
+            ).fetchone()
+            if exists:
+                return
+            removed = connection.execute(text(USER_COMPANIES_DEDUPLICATE)).rowcount
+            connection.execute(text(USER_COMPANIES_CREATE_INDEX))
+        logging.info("Indexed user_companies (removed %d duplicate mappings).", removed)
+
+    def _migrate_transaction_fingerprints(self):
+        """Add, backfill and index temporary_transactions.fingerprint on databases created without it."""
+        tt = self.temporary_transactions
+        with self.engine.begin() as connection:
+            columns = {row[1] for row in connection.execute(text("PRAGMA table_info(temporary_transactions)"))}
+            if "fingerprint" not in columns:
+                connection.execute(text("ALTER TABLE temporary_transactions ADD COLUMN fingerprint VARCHAR"))
+                stmt = select(
+                    tt.c.id, tt.c.upload_id, tt.c.company, tt.c.bank_account, tt.c.transaction_date,
+                    tt.c.transaction_type, tt.c.amount, tt.c.description
+                ).order_by(tt.c.upload_id, tt.c.id)
+                updates = []
+                rows = (dict(row._mapping) for row in connection.execute(stmt).fetchall())
+                for _, upload_rows in itertools.groupby(rows, key=lambda row: row["upload_id"]):
+                    for row in _assign_fingerprints(list(upload_rows)):
+                        updates.append({"row_id": row["id"], "row_fingerprint": row["fingerprint"]})
+                if updates:
+                    connection.execute(
+                        tt.update().where(tt.c.id == bindparam("row_id"))
+                        .values(fingerprint=bindparam("row_fingerprint")),
+                        updates
+                    )
+                logging.info("Backfilled fingerprints for %d existing statement rows.", len(updates))
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {TRANSACTION_FINGERPRINT_INDEX} ON temporary_transactions (fingerprint)"
+            ))
+
     def create_user_if_not_exists(self, user_email):
         stmt = select(self.users_table.c.email).where(self.users_table.c.email == user_email)
         with self.engine.connect() as connection:
@@ -165,59 +329,56 @@ class LocalDbConnector:
 
     def get_or_create_company(self, username, company_name):
         company_id = company_name.replace(" ", "_").lower()
-        with self.engine.connect() as connection:
-            stmt = select(self.companies_table.c.company_id).where(
-                self.companies_table.c.company_id == company_id
-            )
-            result = connection.execute(stmt).fetchone()
-        if result:
-            logging.info("Company '%s' already exists.", company_id)
+        if (self.db_path, company_id) in _known_companies:
             return company_id
-        ins = self.companies_table.insert().values(
+        # Single round trip: INSERT ... ON CONFLICT DO NOTHING RETURNING
+        ins = sqlite_insert(self.companies_table).values(
             company_id=company_id,
             company_name=company_name,
             created_by=username,
             created_at=datetime.datetime.now(datetime.timezone.utc)
-        )
+        ).on_conflict_do_nothing(index_elements=["company_id"]).returning(self.companies_table.c.company_id)
         with self.engine.begin() as connection:
-            connection.execute(ins)
-        logging.info("Created new company '%s' for user '%s'.", company_name, username)
+            created = connection.execute(ins).fetchone()
+        if created:
+            logging.info("Created new company '%s' for user '%s'.", company_name, username)
+        else:
+            logging.info("Company '%s' already exists.", company_id)
+        _known_companies.add((self.db_path, company_id))
         return company_id
 
     def add_user_company_mapping(self, user_email, company_id, role='admin'):
-        with self.engine.connect() as connection:
-            stmt = select(self.user_companies_table).where(
-                self.user_companies_table.c.user_email == user_email,
-                self.user_companies_table.c.company_id == company_id
-            )
-            result = connection.execute(stmt).fetchone()
-        if result:
-            logging.info("User-company mapping for '%s' and '%s' exists.", user_email, company_id)
+        key = (self.db_path, user_email, company_id)
+        if key in _known_mappings:
             return
-        ins = self.user_companies_table.insert().values(
+        ins = sqlite_insert(self.user_companies_table).values(
             user_email=user_email,
             company_id=company_id,
             role=role
-        )
+        ).on_conflict_do_nothing(index_elements=["user_email", "company_id"]).returning(self.user_companies_table.c.id)
         with self.engine.begin() as connection:
-            connection.execute(ins)
-        logging.info("Created user-company mapping for '%s' and '%s'.", user_email, company_id)
+            created = connection.execute(ins).fetchone()
+        if created:
+            logging.info("Created user-company mapping for '%s' and '%s'.", user_email, company_id)
+            # The user's cached company list is missing it, here and in other
+            # processes (new companies are rare, so the marker is cheap)
+            lookup_cache.invalidate("companies", (self.db_path, user_email))
+            touch_sync_marker(self.sync_marker)
+        else:
+            logging.info("User-company mapping for '%s' and '%s' exists.", user_email, company_id)
+        _known_mappings.add(key)
 
     def upload_ledgers(self, username, company_name, ledgers):
         try:
             company_id = self.get_or_create_company(username, company_name)
             self.add_user_company_mapping(username, company_id, role='admin')
+            # Balances arrive parsed (Decimal); dicts from older callers are parsed once here
+            ledgers = as_ledger_table(ledgers)
             with self.engine.begin() as connection:
                 for ledger in ledgers:
-                    ledger_name = ledger.get("Name", ledger.get("LEDGERNAME", "N/A"))
-                    closing_balance_raw = ledger.get("ClosingBalance", ledger.get("CLOSINGBALANCE", "0"))
-                    try:
-                        closing_balance = float(closing_balance_raw)
-                    except (ValueError, TypeError):
-                        closing_balance = 0.0
-
-                    standard_keys = {"Name", "LEDGERNAME", "ClosingBalance", "CLOSINGBALANCE"}
-                    extra_fields = {k: v for k, v in ledger.items() if k not in standard_keys}
+                    ledger_name = ledger.name
+                    closing_balance = ledger.closing_balance if ledger.closing_balance is not None else Decimal(0)
+                    extra_fields = ledger.extra_fields()
 
                     select_stmt = select(self.ledgers_table.c.ledger_id).where(
                     self.ledgers_table.c.company_id == company_id,
@@ -238,10 +399,23 @@ class LocalDbConnector:
                     )
                     connection.execute(ins)
             logging.info("Uploaded %d ledger records for user '%s' and company '%s' into local ledgers table.", len(ledgers), username, company_name)
+            self.invalidate_lookups()
         except SQLAlchemyError as e:
             logging.error("Local DB insertion error: %s", e)
 
+    def invalidate_lookups(self):
+        """Drop cached company/bank/ledger lookups here and in other processes."""
+        for namespace in LEDGER_LOOKUP_NAMESPACES:
+            lookup_cache.invalidate(namespace)
+        touch_sync_marker(self.sync_marker)
+
     def get_user_companies(self, user_email):
+        return lookup_cache.get_or_load(
+            "companies", (self.db_path, user_email),
+            lambda: self._load_user_companies(user_email)
+        )
+
+    def _load_user_companies(self, user_email):
         with self.engine.connect() as connection:
             stmt = select(
                 self.companies_table.c.company_id,
@@ -259,6 +433,12 @@ class LocalDbConnector:
         return companies
     
     def get_user_bank_accounts(self, user_email, company_id):
+        return lookup_cache.get_or_load(
+            "bank_accounts", (self.db_path, user_email, company_id),
+            lambda: self._load_user_bank_accounts(user_email, company_id)
+        )
+
+    def _load_user_bank_accounts(self, user_email, company_id):
         with self.engine.connect() as connection:
             # First, verify the user has access to this company
             stmt_verify = select(self.user_companies_table).where(
@@ -299,44 +479,57 @@ class LocalDbConnector:
                 return None
 
     # --- Upload Excel/PDF Data to Local DB ---
-    def upload_excel_local(self, email, company, bankAccount, data, fileName):
+    def upload_excel_local(self, email, company, bankAccount, data, fileName, on_duplicate="flag"):
         """
         Mimics the online server uploadExcel function:
           - Generates a unique upload_id.
           - Inserts each row from data into temporary_transactions.
           - Inserts a record into user_temp_tables.
           - Returns the upload_id.
+        Rows already uploaded earlier (same transaction_fingerprint, in any
+        upload, sent or not) get status "duplicate", or are left out with
+        on_duplicate="skip".
         """
         try:
             upload_id = str(uuid.uuid4())
+            rows = []
+            for row in data:
+                # Convert the transaction date: try both keys.
+                let_date = row.get("transaction_date") or row.get("txn_date")
+                jsDate = None
+                if let_date:
+                    jsDate = self.convert_date(let_date)
+
+                # For transaction type, try both keys.
+                txn_type = row.get("transaction_type") or row.get("type") or None
+
+                # For assigned ledger, try both keys.
+                assigned_ledger = row.get("assignedLedger") or row.get("ledger") or ""
+
+                rows.append({
+                    "upload_id": upload_id,
+                    "email": email,
+                    "company": company,
+                    "bank_account": bankAccount,
+                    "transaction_date": jsDate,
+                    "transaction_type": txn_type,
+                    "description": row.get("description"),
+                    "amount": row.get("amount"),
+                    "assigned_ledger": assigned_ledger,
+                    "status": "",
+                })
+            _assign_fingerprints(rows)
+
             with self.engine.begin() as connection:
-                # Insert each row from the uploaded data into temporary_transactions
-                for row in data:
-                    # Convert the transaction date: try both keys.
-                    let_date = row.get("transaction_date") or row.get("txn_date")
-                    jsDate = None
-                    if let_date:
-                        jsDate = self.convert_date(let_date)
-                    
-                    # For transaction type, try both keys.
-                    txn_type = row.get("transaction_type") or row.get("type") or None
-                    
-                    # For assigned ledger, try both keys.
-                    assigned_ledger = row.get("assignedLedger") or row.get("ledger") or ""
-                    
-                    connection.execute(
-                        self.temporary_transactions.insert().values(
-                            upload_id=upload_id,
-                            email=email,
-                            company=company,
-                            bank_account=bankAccount,
-                            transaction_date=jsDate,
-                            transaction_type=txn_type,
-                            description=row.get("description"),
-                            amount=row.get("amount"),
-                            assigned_ledger=assigned_ledger
-                        )
-                    )
+                seen = self._existing_fingerprints(connection, [row["fingerprint"] for row in rows])
+                duplicates = [row for row in rows if row["fingerprint"] in seen]
+                if on_duplicate == "skip":
+                    rows = [row for row in rows if row["fingerprint"] not in seen]
+                else:
+                    for row in duplicates:
+                        row["status"] = "duplicate"
+                if rows:
+                    connection.execute(self.temporary_transactions.insert(), rows)
                 # Insert a record into user_temp_tables for tracking
                 connection.execute(
                     self.user_temp_tables.insert().values(
@@ -346,17 +539,33 @@ class LocalDbConnector:
                         uploaded_file=fileName
                     )
                 )
-                # (Optional) You could query the count of inserted rows if needed.
-                stmt = select(self.temporary_transactions.c.id).where(
-                    self.temporary_transactions.c.upload_id == upload_id
-                )
-                rows = connection.execute(stmt).fetchall()
-                logging.info(f"Now have {len(rows)} rows for upload {upload_id}")
+            logging.info("Stored %d rows for upload %s; %d already uploaded before (%s).",
+                         len(rows), upload_id, len(duplicates), "skipped" if on_duplicate == "skip" else "flagged")
+            self._update_suggesters(
+                added=[(row["company"], row["description"], row["assigned_ledger"]) for row in rows]
+            )
             return upload_id
         except SQLAlchemyError as e:
             logging.error("Error in upload_excel_local: %s", e)
             raise e
-        
+
+    def _existing_fingerprints(self, connection, fingerprints):
+        """The subset of fingerprints already in temporary_transactions (indexed lookups)."""
+        tt = self.temporary_transactions
+        found = set()
+        unique = list(set(fingerprints))
+        for i in range(0, len(unique), FINGERPRINT_LOOKUP_BATCH):
+            stmt = select(tt.c.fingerprint).where(tt.c.fingerprint.in_(unique[i:i + FINGERPRINT_LOOKUP_BATCH]))
+            found.update(row[0] for row in connection.execute(stmt))
+        return found
+
+    def get_duplicate_count(self, upload_id):
+        """Rows of upload_id flagged as duplicates of earlier uploads."""
+        tt = self.temporary_transactions
+        with self.engine.connect() as connection:
+            stmt = select(func.count()).where(tt.c.upload_id == upload_id, tt.c.status == "duplicate")
+            return connection.execute(stmt).scalar()
+
     def get_all_temp_tables(self, email, company):
         with self.engine.connect() as connection:
             stmt = select(
@@ -388,7 +597,6 @@ class LocalDbConnector:
             data = [dict(row._mapping) for row in result]
             for row in data:
                 for key, value in row.items():
-                    from decimal import Decimal
                     if isinstance(value, Decimal):
                         row[key] = float(value)
                     elif isinstance(value, datetime.datetime):
@@ -401,7 +609,32 @@ class LocalDbConnector:
         Deletes existing rows and inserts the new data.
         """
         try:
+            rows = []
+            for row in data:
+                let_date = row.get("transaction_date")
+                jsDate = self.convert_date(let_date) if let_date else None
+                txn_type = row.get("transaction_type") or row.get("type") or None
+                assigned_ledger = row.get("assignedLedger") or row.get("assigned_ledger") or ""
+                rows.append({
+                    "upload_id": upload_id,
+                    "email": row.get("email", ""),    # Ensure email is included
+                    "company": row.get("company", ""),  # Ensure company is included
+                    "bank_account": row.get("bank_account", ""),
+                    "transaction_date": jsDate,
+                    "transaction_type": txn_type,
+                    "description": row.get("description", ""),
+                    "amount": row.get("amount", 0),
+                    "assigned_ledger": assigned_ledger,
+                    # Keeps "duplicate" (and "sent") flags across edits
+                    "status": row.get("status") or "",
+                })
+            _assign_fingerprints(rows)
+            tt = self.temporary_transactions
             with self.engine.begin() as connection:
+                # The assignments being replaced, for the cached suggesters
+                previous = [tuple(row) for row in connection.execute(
+                    select(tt.c.company, tt.c.description, tt.c.assigned_ledger).where(tt.c.upload_id == upload_id)
+                )]
                 # Delete existing rows for this upload_id
                 delete_stmt = self.temporary_transactions.delete().where(
                     self.temporary_transactions.c.upload_id == upload_id
@@ -409,25 +642,13 @@ class LocalDbConnector:
                 connection.execute(delete_stmt)
 
                 # Insert updated rows
-                for row in data:
-                    let_date = row.get("transaction_date")
-                    jsDate = self.convert_date(let_date) if let_date else None
-                    txn_type = row.get("transaction_type") or row.get("type") or None
-                    assigned_ledger = row.get("assignedLedger") or row.get("assigned_ledger") or ""
-                    connection.execute(
-                        self.temporary_transactions.insert().values(
-                            upload_id=upload_id,
-                            email=row.get("email", ""),    # Ensure email is included
-                            company=row.get("company", ""),  # Ensure company is included
-                            bank_account=row.get("bank_account", ""),
-                            transaction_date=jsDate,
-                            transaction_type=txn_type,
-                            description=row.get("description", ""),
-                            amount=row.get("amount", 0),
-                            assigned_ledger=assigned_ledger
-                        )
-                    )
+                if rows:
+                    connection.execute(self.temporary_transactions.insert(), rows)
             logging.info(f"update_temp_excel: updated rows for upload {upload_id}")
+            self._update_suggesters(
+                added=[(row["company"], row["description"], row["assigned_ledger"]) for row in rows],
+                removed=previous
+            )
             return upload_id
         except SQLAlchemyError as e:
             logging.error("Error in update_temp_excel: %s", e)
@@ -449,6 +670,12 @@ class LocalDbConnector:
 
 
     def get_company_name(self, company_id):
+        return lookup_cache.get_or_load(
+            "company_names", (self.db_path, company_id),
+            lambda: self._load_company_name(company_id)
+        )
+
+    def _load_company_name(self, company_id):
         with self.engine.connect() as connection:
             stmt = select(self.companies_table.c.company_name).where(
                 self.companies_table.c.company_id == company_id
@@ -456,18 +683,210 @@ class LocalDbConnector:
             result = connection.execute(stmt).fetchone()
             return result[0] if result else None
     def get_ledger_options(self, company_id):
+        return lookup_cache.get_or_load(
+            "ledger_options", (self.db_path, company_id),
+            lambda: self._load_ledger_options(company_id)
+        )
+
+    def _load_ledger_options(self, company_id):
         with self.engine.connect() as connection:
             stmt = select(self.ledgers_table.c.description).where(
                 self.ledgers_table.c.company_id == company_id
             )
             result = connection.execute(stmt).fetchall()
-            logging.info("Ledger rows found for %s: %s", company_id, result)
             ledger_options = [row[0] for row in result]
+        logging.debug("Ledger rows found for %s: %d", company_id, len(ledger_options))
         return ledger_options
 
+    def get_ledger_search_index(self, company_id):
+        """Prefix/trigram index over the company's ledger names, rebuilt after each sync."""
+        return lookup_cache.get_or_load(
+            "ledger_search", (self.db_path, company_id),
+            lambda: LedgerSearchIndex(self._load_ledger_options(company_id))
+        )
+
+    def search_ledgers(self, company_id, query, limit=20):
+        return self.get_ledger_search_index(company_id).search(query, limit)
+
+    # --- Ledger suggestions ---
 
+    def get_assignment_history(self, company_id):
+        """(description, assigned_ledger, count) for every ledger assigned in company_id's uploads."""
+        tt = self.temporary_transactions
+        with self.engine.connect() as connection:
+            stmt = (
+                select(tt.c.description, tt.c.assigned_ledger, func.count())
+                .where(tt.c.company == str(company_id), tt.c.assigned_ledger != "")
+                .group_by(tt.c.description, tt.c.assigned_ledger)
+            )
+            return [tuple(row) for row in connection.execute(stmt)]
 
+    def get_ledger_suggester(self, company_id):
+        """The company's LedgerSuggester, built on first use; new assignments are applied to it as they are saved."""
+        return lookup_cache.get_or_load(
+            "ledger_suggesters", (self.db_path, str(company_id)),
+            lambda: self._build_ledger_suggester(company_id)
+        )
 
+    def _build_ledger_suggester(self, company_id):
+        history = self.get_assignment_history(company_id)
+        suggester = LedgerSuggester(self.get_ledger_options(company_id), history)
+        logging.info("Built ledger suggester for company %s from %d assignment patterns.", company_id, len(history))
+        return suggester
 
+    def suggest_ledgers(self, company_id, descriptions, top_k=3):
+        """Ranked ledger suggestions for each description, in order."""
+        return self.get_ledger_suggester(company_id).suggest_batch(descriptions, top_k)
 
+    def _update_suggesters(self, added=(), removed=()):
+        """
+        Apply changed assignments, as (company, description, ledger), to the
+        companies' cached suggesters instead of rebuilding them from the
+        whole history. Companies without a cached suggester are skipped.
+        """
+        suggesters = {}
+        for company, _, ledger in itertools.chain(removed, added):
+            if ledger and company not in suggesters:
+                suggesters[company] = lookup_cache.peek("ledger_suggesters", (self.db_path, str(company)))
+        if not any(suggesters.values()):
+            return
+        for company, description, ledger in removed:
+            if suggesters.get(company) is not None:
+                suggesters[company].remove_history(description, ledger)
+        for company, description, ledger in added:
+            if suggesters.get(company) is not None:
+                suggesters[company].add_history(description, ledger)
+
+    # --- Tally vouchers ---
+    def replace_vouchers(self, company_id, from_date, to_date, vouchers, batch_size=1000):
+        """
+        Replace the stored vouchers of company_id dated from_date..to_date with
+        vouchers (an iterable of VoucherRecord). The export is read to the end
+        before the transaction starts, so the database is not locked for the
+        length of a Tally request and a failed export leaves the window as it
+        was; vouchers altered or deleted in Tally are picked up this way too.
+        Returns the number of vouchers stored.
+        """
+        vouchers_tbl = self.tally_vouchers
+        entries_tbl = self.tally_voucher_entries
+        received = []
+        for voucher in vouchers:
+            if not voucher.guid:
+                logging.warning("Skipping voucher without GUID dated %s.", voucher.date)
+                continue
+            received.append(voucher)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        count = len(received)
+        with self.engine.begin() as connection:
+            window = select(vouchers_tbl.c.id).where(
+                vouchers_tbl.c.company_id == company_id,
+                vouchers_tbl.c.voucher_date.between(from_date, to_date)
+            )
+            connection.execute(delete(entries_tbl).where(entries_tbl.c.voucher_id.in_(window)))
+            connection.execute(delete(vouchers_tbl).where(vouchers_tbl.c.id.in_(window)))
+
+            batch = []
+
+            def flush():
+                # Vouchers first (a voucher whose date moved out of an older
+                # window is updated in place), then their entries by voucher id
+                guids = [voucher.guid for voucher in batch]
+                upsert = sqlite_insert(vouchers_tbl)
+                upsert = upsert.on_conflict_do_update(
+                    index_elements=['company_id', 'guid'],
+                    set_={column: upsert.excluded[column] for column in (
+                        "master_id", "alter_id", "voucher_date", "voucher_type", "voucher_number",
+                        "party_ledger", "narration", "synced_at"
+                    )}
+                )
+                connection.execute(
+                    upsert,
+                    [{
+                        "company_id": company_id,
+                        "guid": voucher.guid,
+                        "master_id": voucher.master_id,
+                        "alter_id": voucher.alter_id,
+                        "voucher_date": voucher.date,
+                        "voucher_type": voucher.voucher_type,
+                        "voucher_number": voucher.voucher_number,
+                        "party_ledger": voucher.party_ledger,
+                        "narration": voucher.narration,
+                        "synced_at": now,
+                    } for voucher in batch]
+                )
+                ids = dict(connection.execute(
+                    select(vouchers_tbl.c.guid, vouchers_tbl.c.id).where(
+                        vouchers_tbl.c.company_id == company_id, vouchers_tbl.c.guid.in_(guids)
+                    )
+                ).fetchall())
+                connection.execute(delete(entries_tbl).where(entries_tbl.c.voucher_id.in_(list(ids.values()))))
+                entry_rows = [{
+                    "voucher_id": ids[voucher.guid],
+                    "company_id": company_id,
+                    "ledger_name": entry.ledger_name,
+                    "voucher_date": voucher.date,
+                    "amount_paise": to_scaled(entry.amount),
+                    "is_debit": entry.is_debit,
+                } for voucher in batch if voucher.guid in ids for entry in voucher.entries]
+                if entry_rows:
+                    connection.execute(entries_tbl.insert(), entry_rows)
+                batch.clear()
+
+            for voucher in received:
+                batch.append(voucher)
+                if len(batch) >= batch_size:
+                    flush()
+            if batch:
+                flush()
+        logging.info("Stored %d vouchers for '%s' (%s to %s).", count, company_id, from_date, to_date)
+        return count
+
+    def get_voucher_sync_state(self, company_id):
+        """(synced_from, synced_to) already exported for company_id, or None."""
+        tbl = self.tally_voucher_sync
+        with self.engine.connect() as connection:
+            row = connection.execute(
+                select(tbl.c.synced_from, tbl.c.synced_to).where(tbl.c.company_id == company_id)
+            ).fetchone()
+        return (row.synced_from, row.synced_to) if row else None
+
+    def update_voucher_sync_state(self, company_id, synced_from, synced_to):
+        """Record that synced_from..synced_to has been exported (widening the stored range)."""
+        tbl = self.tally_voucher_sync
+        stmt = sqlite_insert(tbl).values(
+            company_id=company_id, synced_from=synced_from, synced_to=synced_to,
+            updated_at=datetime.datetime.now(datetime.timezone.utc)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['company_id'],
+            set_={
+                "synced_from": func.min(tbl.c.synced_from, stmt.excluded.synced_from),
+                "synced_to": func.max(tbl.c.synced_to, stmt.excluded.synced_to),
+                "updated_at": stmt.excluded.updated_at,
+            }
+        )
+        with self.engine.begin() as connection:
+            connection.execute(stmt)
 
+    def get_ledger_entries(self, company_id, ledger_name, from_date=None, to_date=None):
+        """
+        Entries posted to ledger_name (e.g. a bank ledger) ordered by date, as
+        dicts with the voucher's details and the amount in paise.
+        """
+        entries_tbl = self.tally_voucher_entries
+        vouchers_tbl = self.tally_vouchers
+        stmt = select(
+            entries_tbl.c.voucher_date, entries_tbl.c.amount_paise, entries_tbl.c.is_debit,
+            vouchers_tbl.c.guid, vouchers_tbl.c.voucher_type, vouchers_tbl.c.voucher_number,
+            vouchers_tbl.c.party_ledger, vouchers_tbl.c.narration
+        ).join(vouchers_tbl, vouchers_tbl.c.id == entries_tbl.c.voucher_id).where(
+            entries_tbl.c.company_id == company_id,
+            entries_tbl.c.ledger_name == ledger_name
+        )
+        if from_date is not None:
+            stmt = stmt.where(entries_tbl.c.voucher_date >= from_date)
+        if to_date is not None:
+            stmt = stmt.where(entries_tbl.c.voucher_date <= to_date)
+        stmt = stmt.order_by(entries_tbl.c.voucher_date, entries_tbl.c.id)
+        with self.engine.connect() as connection:
+            return [dict(row._mapping) for row in connection.execute(stmt)]
@@ -0,0 +1,110 @@
+# lookup_cache.py
+import os
+import time
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+LOOKUP_CACHE_TTL = float(os.getenv("LOOKUP_CACHE_TTL", "300"))  # seconds
+
+_MISSING = object()
+
+class LookupCache:
+    """
+    Thread-safe in-process read-through cache for small lookups (companies,
+    bank accounts, ledger options, company names). Entries live in
+    namespaces, expire after a TTL and can be invalidated explicitly.
+
+    Processes that share a SQLite file cannot see each other's invalidations,
+    so a namespace can also be tied to a sync marker file: whenever another
+    process touches the marker (see touch_sync_marker), the namespace is
+    dropped on its next read. Checking it costs one stat() call.
+    """
+    def __init__(self, default_ttl=LOOKUP_CACHE_TTL):
+        self.default_ttl = default_ttl
+        self.lock = threading.Lock()
+        self.entries = {}  # namespace -> {key: (expires_at, value)}
+        self.markers = {}  # namespace -> (marker path, last seen mtime)
+        self.hits = 0
+        self.misses = 0
+
+    def bind_marker(self, namespace, marker_path):
+        with self.lock:
+            if namespace not in self.markers:
+                self.markers[namespace] = (marker_path, _marker_mtime(marker_path))
+
+    def _check_marker(self, namespace):
+        marker = self.markers.get(namespace)
+        if marker is None:
+            return
+        path, seen = marker
+        current = _marker_mtime(path)
+        if current != seen:
+            self.entries.pop(namespace, None)
+            self.markers[namespace] = (path, current)
+
+    def get_or_load(self, namespace, key, loader, ttl=None, cache_none=False):
+        """Return the cached value, or call loader() and cache its result."""
+        now = time.monotonic()
+        with self.lock:
+            self._check_marker(namespace)
+            entry = self.entries.get(namespace, {}).get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = loader()
+        if value is None and not cache_none:
+            return value
+        expires_at = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+        with self.lock:
+            self.entries.setdefault(namespace, {})[key] = (expires_at, value)
+        return value
+
+    def peek(self, namespace, key, default=None):
+        """Return the cached value, or default; never calls a loader."""
+        now = time.monotonic()
+        with self.lock:
+            self._check_marker(namespace)
+            entry = self.entries.get(namespace, {}).get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                return entry[1]
+        return default
+
+    def invalidate(self, namespace=None, key=_MISSING):
+        """Drop one key, one namespace, or (with no arguments) everything."""
+        with self.lock:
+            if namespace is None:
+                self.entries.clear()
+            elif key is _MISSING:
+                self.entries.pop(namespace, None)
+            else:
+                self.entries.get(namespace, {}).pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": sum(len(v) for v in self.entries.values()),
+            }
+
+def _marker_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def touch_sync_marker(path):
+    """Signal other processes that data behind path's namespaces changed."""
+    try:
+        with open(path, "a"):
+            pass
+        os.utime(path, None)
+    except OSError as e:
+        logging.warning("Could not touch sync marker %s: %s", path, e)
+
+# Shared by every connector in the process
+lookup_cache = LookupCache()
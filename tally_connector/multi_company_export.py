@@ -0,0 +1,212 @@
+# multi_company_export.py
+"""
+Export every company loaded in one or more Tally instances.
+
+Each endpoint's loaded companies are enumerated, then one ledger export per
+company is issued with SVCURRENTCOMPANY pinned, so nobody has to switch the
+active company in Tally. Exports run concurrently across endpoints, with a
+per-endpoint limit on requests in flight (Tally serves requests largely one at
+a time, so 1-2 per instance is usually right).
+
+Nightly refresh of every client book into the local database:
+
+    python multi_company_export.py --username accounts@example.com --store local
+    python multi_company_export.py --endpoint http://10.0.0.5:9000=2 --endpoint http://10.0.0.6:9000=1
+"""
+import sys
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tally_api import TallyAPI
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+class TallyEndpoint:
+    """One Tally instance and how many requests it may have in flight."""
+    __slots__ = ("url", "max_concurrency", "api")
+
+    def __init__(self, url, max_concurrency=1):
+        self.url = url
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.api = TallyAPI(server_url=url)
+
+    @classmethod
+    def parse(cls, spec):
+        """Parse "url" or "url=max_concurrency"."""
+        url, _, limit = spec.strip().rpartition("=")
+        if not url or not limit.isdigit():
+            return cls(spec.strip())
+        return cls(url, int(limit))
+
+    def __repr__(self):
+        return f"TallyEndpoint({self.url!r}, {self.max_concurrency})"
+
+def parse_endpoints(specs):
+    """Endpoints from a comma separated string or a list of specs."""
+    if isinstance(specs, str):
+        specs = specs.split(",")
+    return [TallyEndpoint.parse(spec) for spec in specs if spec.strip()]
+
+class CompanyExport:
+    """Result of exporting one company."""
+    __slots__ = ("endpoint", "company", "ledgers", "seconds", "error")
+
+    def __init__(self, endpoint, company, ledgers=None, seconds=0.0, error=None):
+        self.endpoint = endpoint
+        self.company = company
+        self.ledgers = ledgers
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+class MultiCompanyExporter:
+    """
+    Schedules company exports across endpoints. Each endpoint gets its own
+    thread pool sized to its concurrency limit, so a slow Tally only holds up
+    its own companies. on_result(CompanyExport) is called from the worker
+    thread as each company finishes, e.g. to store it while others export.
+    """
+    def __init__(self, endpoints, on_result=None):
+        self.endpoints = list(endpoints)
+        self.on_result = on_result
+        self.lock = threading.Lock()
+        self.unreachable = []  # URLs of endpoints the last discover() could not reach
+
+    def discover(self):
+        """
+        Map each endpoint to the companies loaded in it. A company loaded in
+        several instances is exported from the first endpoint only. Endpoints
+        that cannot be reached are listed in self.unreachable.
+        """
+        def enumerate_companies(endpoint):
+            if not endpoint.api.is_tally_running():
+                logging.error("Tally at %s is not reachable.", endpoint.url)
+                return None
+            return endpoint.api.get_loaded_companies()
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.endpoints))) as pool:
+            loaded = list(pool.map(enumerate_companies, self.endpoints))
+
+        plan = []
+        seen = {}
+        self.unreachable = [endpoint.url for endpoint, companies in zip(self.endpoints, loaded) if companies is None]
+        for endpoint, companies in zip(self.endpoints, loaded):
+            if companies is None:
+                continue
+            logging.info("%s has %d companies loaded.", endpoint.url, len(companies))
+            for company in companies:
+                if company in seen:
+                    logging.warning("Company '%s' is loaded in %s and %s; exporting it from %s.",
+                                    company, seen[company], endpoint.url, seen[company])
+                    continue
+                seen[company] = endpoint.url
+                plan.append((endpoint, company))
+        return plan
+
+    def _export(self, endpoint, company):
+        start = time.perf_counter()
+        try:
+            ledgers = endpoint.api.fetch_ledgers(request_id="AllLedgers", use_cache=False, company=company)
+            result = CompanyExport(endpoint.url, company, ledgers, time.perf_counter() - start)
+        except Exception as e:
+            logging.exception("Export of '%s' from %s failed", company, endpoint.url)
+            result = CompanyExport(endpoint.url, company, seconds=time.perf_counter() - start, error=str(e))
+        if self.on_result is not None:
+            try:
+                self.on_result(result)
+            except Exception as e:
+                logging.exception("Storing '%s' failed", company)
+                result.error = f"store failed: {e}"
+        return result
+
+    def run(self, companies=None):
+        """
+        Export every loaded company (or only those named in companies).
+        Returns the list of CompanyExport results; an unreachable endpoint is
+        one failed result with company None.
+        """
+        plan = self.discover()
+        if companies:
+            wanted = set(companies)
+            plan = [(endpoint, company) for endpoint, company in plan if company in wanted]
+
+        pools = {
+            endpoint.url: ThreadPoolExecutor(max_workers=endpoint.max_concurrency,
+                                             thread_name_prefix=f"tally-export-{i}")
+            for i, endpoint in enumerate(self.endpoints)
+        }
+        results = [CompanyExport(url, None, error="Tally is not reachable") for url in self.unreachable]
+        try:
+            futures = [pools[endpoint.url].submit(self._export, endpoint, company) for endpoint, company in plan]
+            for done, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                results.append(result)
+                logging.info("[%d/%d] %s: %s in %.2fs", done, len(futures), result.company,
+                             f"{len(result.ledgers)} ledgers" if result.ok else result.error, result.seconds)
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait=True)
+        return results
+
+def local_store(username):
+    """on_result callback storing ledgers in the local (silver) database."""
+    from local_db_connector import LocalDbConnector
+    local_db = LocalDbConnector()
+    lock = threading.Lock()
+
+    def store(result):
+        if result.ok:
+            # SQLite takes one writer at a time anyway
+            with lock:
+                local_db.upload_ledgers(username, result.company, result.ledgers)
+    return store
+
+def cloud_store(username):
+    """on_result callback uploading ledgers to the AWS database (gold)."""
+    from db_connector import AwsDbConnector
+    cloud_db = AwsDbConnector()
+
+    def store(result):
+        if result.ok:
+            cloud_db.upload_ledgers(username, result.company, result.ledgers, raise_errors=True)
+    return store
+
+def main(argv=None):
+    from config import TALLY_ENDPOINTS
+
+    arg_parser = argparse.ArgumentParser(description="Export ledgers of every company loaded in Tally.")
+    arg_parser.add_argument("--endpoint", action="append",
+                            help="Tally URL, optionally with '=max_concurrency' (repeatable; "
+                                 "defaults to TALLY_ENDPOINTS)")
+    arg_parser.add_argument("--company", action="append", help="Only export these companies")
+    arg_parser.add_argument("--username", help="User the companies are stored for")
+    arg_parser.add_argument("--store", choices=("none", "local", "cloud"), default="none")
+    args = arg_parser.parse_args(argv)
+
+    if args.store != "none" and not args.username:
+        arg_parser.error("--username is required with --store")
+    on_result = None
+    if args.store == "local":
+        on_result = local_store(args.username)
+    elif args.store == "cloud":
+        on_result = cloud_store(args.username)
+
+    endpoints = parse_endpoints(args.endpoint or TALLY_ENDPOINTS)
+    start = time.perf_counter()
+    results = MultiCompanyExporter(endpoints, on_result=on_result).run(companies=args.company)
+    failed = [result for result in results if not result.ok]
+    logging.info("Exported %d companies (%d ledgers) in %.1fs; %d failed.",
+                 len(results) - len(failed), sum(len(r.ledgers) for r in results if r.ok),
+                 time.perf_counter() - start, len(failed))
+    for result in failed:
+        logging.error("%s (%s): %s", result.company or "all companies", result.endpoint, result.error)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
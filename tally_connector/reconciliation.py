@@ -0,0 +1,247 @@
+# reconciliation.py
+"""
+Bank reconciliation of a statement upload (temporary_transactions) against
+the bank ledger's entries in the vouchers exported from Tally (voucher_sync).
+
+Both sides are sorted by date and swept once. Tally entries dated up to
+date_window_days after the current statement row are held in buckets keyed
+by (direction, amount); a statement row takes the earliest unmatched entry of
+its direction within amount_tolerance, preferring the closest amount. Entries
+that fall more than date_window_days behind the sweep can no longer match and
+are reported as missing in the statement right away, so results stream out in
+date order instead of after the whole account has been compared:
+
+    python reconciliation.py --upload-id 3f2a... --window-days 3 --tolerance 1.00
+"""
+import sys
+import json
+import bisect
+import logging
+import argparse
+import datetime
+from collections import deque, defaultdict
+from decimal import Decimal
+
+from tally_records import format_scaled, parse_amount, to_scaled
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+MATCHED = "matched"
+MISSING_IN_TALLY = "missing_in_tally"
+MISSING_IN_STATEMENT = "missing_in_statement"
+
+DEFAULT_DATE_WINDOW_DAYS = 3
+DEFAULT_AMOUNT_TOLERANCE = Decimal("0")
+
+RECEIPT = "receipt"
+PAYMENT = "payment"
+
+class ReconciliationItem:
+    """One result. statement is a temporary_transactions row, tally a get_ledger_entries dict."""
+    __slots__ = ("status", "statement", "tally", "date_difference", "amount_difference")
+
+    def __init__(self, status, statement=None, tally=None, date_difference=None, amount_difference=None):
+        self.status = status
+        self.statement = statement
+        self.tally = tally
+        self.date_difference = date_difference  # days, Tally date minus statement date
+        self.amount_difference = amount_difference  # paise, Tally minus statement
+
+    def as_dict(self):
+        tally = None
+        if self.tally is not None:
+            tally = {
+                "guid": self.tally.get("guid"),
+                "date": self.tally["voucher_date"].isoformat() if self.tally.get("voucher_date") else None,
+                "amount": format_scaled(abs(self.tally["amount_paise"])),
+                "voucher_type": self.tally.get("voucher_type"),
+                "voucher_number": self.tally.get("voucher_number"),
+                "party_ledger": self.tally.get("party_ledger"),
+                "narration": self.tally.get("narration"),
+            }
+        return {
+            "status": self.status,
+            "statement_id": self.statement.get("id") if self.statement is not None else None,
+            "tally": tally,
+            "date_difference": self.date_difference,
+            "amount_difference": format_scaled(self.amount_difference) if self.amount_difference is not None else None,
+        }
+
+def _statement_date(row):
+    value = row.get("transaction_date")
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.datetime.fromisoformat(value).date() if value else None
+    except ValueError:
+        return None
+
+def _statement_direction(row):
+    return RECEIPT if (row.get("transaction_type") or "").strip().lower() == RECEIPT else PAYMENT
+
+def _tally_direction(entry):
+    # Receipts and payments (including the ones this connector imports) say it
+    # in the voucher type; otherwise money into the bank is a debit to it.
+    voucher_type = (entry.get("voucher_type") or "").strip().lower()
+    if voucher_type in (RECEIPT, PAYMENT):
+        return voucher_type
+    return RECEIPT if entry.get("is_debit") else PAYMENT
+
+def reconcile(statement_rows, tally_entries, date_window_days=DEFAULT_DATE_WINDOW_DAYS,
+              amount_tolerance=DEFAULT_AMOUNT_TOLERANCE):
+    """
+    Yield ReconciliationItem objects for statement_rows against tally_entries,
+    in date order. amount_tolerance is in rupees.
+    """
+    tolerance = to_scaled(Decimal(str(amount_tolerance)))
+
+    statement = []
+    for row in statement_rows:
+        date = _statement_date(row)
+        amount = parse_amount(row.get("amount"))
+        if date is None or amount is None:
+            # Nothing to match on
+            yield ReconciliationItem(MISSING_IN_TALLY, statement=row)
+            continue
+        statement.append((date.toordinal(), _statement_direction(row), to_scaled(abs(amount)), row))
+    statement.sort(key=lambda item: item[0])
+
+    entries = [entry for entry in tally_entries if entry.get("voucher_date") is not None]
+    entries.sort(key=lambda entry: entry["voucher_date"])
+    # Day numbers and bucket keys, computed once per entry
+    entry_days = [entry["voucher_date"].toordinal() for entry in entries]
+    entry_keys = [(_tally_direction(entry), abs(entry["amount_paise"])) for entry in entries]
+
+    buckets = {}  # (direction, amount) -> deque of entry indexes, oldest first
+    amounts = defaultdict(list)  # direction -> sorted amounts with a non-empty bucket
+    pending = deque()  # entry indexes in date order; matched ones are skipped when evicted
+    matched = bytearray(len(entries))
+    next_entry = 0
+    entry_count = len(entries)
+
+    def take(key):
+        bucket = buckets[key]
+        index = bucket.popleft()
+        if not bucket:
+            del buckets[key]
+            sorted_amounts = amounts[key[0]]
+            del sorted_amounts[bisect.bisect_left(sorted_amounts, key[1])]
+        return index
+
+    for day, direction, amount, row in statement:
+        # Entries that can still match this row or a later one
+        latest = day + date_window_days
+        while next_entry < entry_count and entry_days[next_entry] <= latest:
+            key = entry_keys[next_entry]
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = deque()
+                bisect.insort(amounts[key[0]], key[1])
+            bucket.append(next_entry)
+            pending.append(next_entry)
+            next_entry += 1
+        # Entries too old for this row are too old for every later row as well
+        earliest = day - date_window_days
+        while pending and entry_days[pending[0]] < earliest:
+            index = pending.popleft()
+            if not matched[index]:
+                take(entry_keys[index])
+                yield ReconciliationItem(MISSING_IN_STATEMENT, tally=entries[index])
+
+        key = (direction, amount)
+        if key not in buckets:
+            key = None
+            if tolerance:
+                # The closest amount is next to the insertion point
+                candidates = amounts.get(direction, ())
+                i = bisect.bisect_left(candidates, amount)
+                nearest = [c for c in candidates[max(0, i - 1):i + 1] if abs(c - amount) <= tolerance]
+                if nearest:
+                    key = (direction, min(nearest, key=lambda c: abs(c - amount)))
+        if key is None:
+            yield ReconciliationItem(MISSING_IN_TALLY, statement=row)
+            continue
+        index = take(key)
+        matched[index] = 1
+        yield ReconciliationItem(
+            MATCHED, statement=row, tally=entries[index],
+            date_difference=entry_days[index] - day,
+            amount_difference=key[1] - amount
+        )
+
+    # Whatever is left never met a statement row
+    while pending:
+        index = pending.popleft()
+        if not matched[index]:
+            yield ReconciliationItem(MISSING_IN_STATEMENT, tally=entries[index])
+    for index in range(next_entry, entry_count):
+        yield ReconciliationItem(MISSING_IN_STATEMENT, tally=entries[index])
+
+class BankReconciler:
+    """
+    Reconciles statement uploads stored in the local database. With a
+    VoucherSync, the statement period is exported from Tally first so the
+    comparison sees vouchers entered since the last sync.
+    """
+    def __init__(self, local_db, voucher_sync=None):
+        self.local_db = local_db
+        self.voucher_sync = voucher_sync
+
+    def run(self, upload_id, date_window_days=DEFAULT_DATE_WINDOW_DAYS, amount_tolerance=DEFAULT_AMOUNT_TOLERANCE,
+            username=None):
+        """Yield ReconciliationItem objects for the upload; nothing for an empty upload."""
+        rows = self.local_db.get_temp_table_data(upload_id)
+        if not rows:
+            return
+        company_id = rows[0]["company"]
+        bank_ledger = rows[0]["bank_account"]
+        dates = [date for date in map(_statement_date, rows) if date is not None]
+        if not dates:
+            for row in rows:
+                yield ReconciliationItem(MISSING_IN_TALLY, statement=row)
+            return
+        window = datetime.timedelta(days=date_window_days)
+        from_date, to_date = min(dates) - window, max(dates) + window
+
+        if self.voucher_sync is not None:
+            company_name = self.local_db.get_company_name(company_id)
+            self.voucher_sync.sync(username or rows[0]["email"], company_name, from_date=from_date, to_date=to_date)
+
+        entries = self.local_db.get_ledger_entries(company_id, bank_ledger, from_date, to_date)
+        logging.info("Reconciling %d statement rows of upload %s against %d entries of '%s'.",
+                     len(rows), upload_id, len(entries), bank_ledger)
+        yield from reconcile(rows, entries, date_window_days, amount_tolerance)
+
+def main(argv=None):
+    from local_db_connector import LocalDbConnector
+
+    arg_parser = argparse.ArgumentParser(description="Reconcile a statement upload against Tally vouchers.")
+    arg_parser.add_argument("--upload-id", required=True)
+    arg_parser.add_argument("--window-days", type=int, default=DEFAULT_DATE_WINDOW_DAYS)
+    arg_parser.add_argument("--tolerance", type=Decimal, default=DEFAULT_AMOUNT_TOLERANCE,
+                            help="Allowed amount difference in rupees")
+    arg_parser.add_argument("--refresh", action="store_true",
+                            help="Export the statement period's vouchers from Tally first")
+    arg_parser.add_argument("--json", action="store_true", help="Print every result as a JSON line")
+    args = arg_parser.parse_args(argv)
+
+    local_db = LocalDbConnector()
+    voucher_sync = None
+    if args.refresh:
+        from tally_api import TallyAPI
+        from voucher_sync import VoucherSync
+        voucher_sync = VoucherSync(TallyAPI(), local_db)
+
+    counts = {MATCHED: 0, MISSING_IN_TALLY: 0, MISSING_IN_STATEMENT: 0}
+    for item in BankReconciler(local_db, voucher_sync).run(args.upload_id, args.window_days, args.tolerance):
+        counts[item.status] += 1
+        if args.json:
+            print(json.dumps(item.as_dict()))
+    logging.info("Matched %d, missing in Tally %d, missing in statement %d.",
+                 counts[MATCHED], counts[MISSING_IN_TALLY], counts[MISSING_IN_STATEMENT])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+# session_store.py
+import os
+import json
+import time
+import logging
+import threading
+
+import dpapi
+from lazy_import import LazyModule
+
+jwt = LazyModule("jwt")  # Requires: pip install pyjwt
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+SESSION_DIR = os.getenv("TALLY_CONNECTOR_HOME", os.path.join(os.path.expanduser("~"), ".tally_connector"))
+KEYRING_SERVICE = "tally_connector"
+# Refresh this many seconds before the ID token expires
+REFRESH_MARGIN = 300
+
+class TokenStore:
+    """
+    Persists Cognito tokens for the next app launch. Uses the OS keyring when
+    the optional keyring package is installed; otherwise a file in
+    SESSION_DIR readable only by the current user (DPAPI-encrypted on
+    Windows).
+    """
+    def __init__(self, path=None):
+        self.path = path or os.path.join(SESSION_DIR, "session.json")
+        try:
+            import keyring
+            self.keyring = keyring
+        except ImportError:
+            self.keyring = None
+
+    def load(self):
+        try:
+            if self.keyring is not None:
+                raw = self.keyring.get_password(KEYRING_SERVICE, "session")
+                return json.loads(raw) if raw else None
+            with open(self.path, "rb") as f:
+                raw = dpapi.unprotect(f.read())
+            return json.loads(raw.decode("utf-8"))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning("Could not load stored session: %s", e)
+            return None
+
+    def save(self, session):
+        raw = json.dumps(session)
+        try:
+            if self.keyring is not None:
+                self.keyring.set_password(KEYRING_SERVICE, "session", raw)
+                return
+            data = dpapi.protect(raw.encode("utf-8"))
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+        except Exception as e:
+            logging.warning("Could not store session: %s", e)
+
+    def clear(self):
+        try:
+            if self.keyring is not None:
+                self.keyring.delete_password(KEYRING_SERVICE, "session")
+            elif os.path.exists(self.path):
+                os.remove(self.path)
+        except Exception as e:
+            logging.warning("Could not clear stored session: %s", e)
+
+###############################################################################
+#                              SESSION MANAGER
+###############################################################################
+def decode_claims(id_token):
+    """
+    Claims of a Cognito ID token (signature not verified, as before). Only
+    for tokens taken straight from a Cognito response, never stored ones.
+    """
+    return jwt.decode(id_token, options={"verify_signature": False})
+
+def user_type_from_claims(claims):
+    groups = claims.get("cognito:groups", [])
+    return "gold" if any("gold" == group.lower() for group in groups) else "silver"
+
+class CognitoSession:
+    """
+    Keeps the signed-in user's tokens and claims. The tier (gold/silver) and
+    other claims are decoded once and cached until the ID token expires.
+    A stored session is restored without a password by renewing its tokens
+    with REFRESH_TOKEN_AUTH, and they are renewed silently on a background
+    timer after that.
+    """
+    def __init__(self, cognito_auth, store=None):
+        self.cognito_auth = cognito_auth
+        self.store = store or TokenStore()
+        self.lock = threading.Lock()
+        self.session = None
+        self.claims = None
+        self.refresh_timer = None
+
+    @property
+    def username(self):
+        return self.session["username"] if self.session else None
+
+    @property
+    def user_type(self):
+        return user_type_from_claims(self.claims) if self.claims else None
+
+    def _token_expiry(self):
+        return self.claims.get("exp", 0) if self.claims else 0
+
+    def is_valid(self):
+        return self.claims is not None and self._token_expiry() > time.time()
+
+    def _apply(self, username, auth_result, previous_refresh_token=None):
+        id_token = auth_result["IdToken"]
+        claims = decode_claims(id_token)
+        session = {
+            "username": username,
+            "id_token": id_token,
+            "access_token": auth_result.get("AccessToken"),
+            # REFRESH_TOKEN_AUTH responses do not include a new refresh token
+            "refresh_token": auth_result.get("RefreshToken") or previous_refresh_token,
+        }
+        with self.lock:
+            self.session = session
+            self.claims = claims
+        self.store.save(session)
+        self._schedule_refresh()
+
+    def sign_in(self, username, password):
+        """Full USER_PASSWORD_AUTH sign in. Returns True on success."""
+        success, response = self.cognito_auth.sign_in(username, password)
+        if not success:
+            return False
+        self._apply(username, response["AuthenticationResult"])
+        return True
+
+    def restore(self):
+        """
+        Restore the stored session. Returns True if its refresh token could be
+        renewed with Cognito. The stored ID token is never trusted as is: its
+        claims (and so the tier) come from the fresh Cognito response, since
+        the file or keyring entry can be edited by the user.
+        """
+        stored = self.store.load()
+        if not stored or not stored.get("username") or not stored.get("refresh_token"):
+            return False
+        with self.lock:
+            self.session = {"username": stored["username"], "refresh_token": stored["refresh_token"]}
+            self.claims = None
+        return self.refresh()
+
+    def refresh(self):
+        """Renew tokens with the refresh token. Returns True on success."""
+        with self.lock:
+            session = self.session
+        if not session or not session.get("refresh_token"):
+            return False
+        try:
+            success, response = self.cognito_auth.refresh(session["refresh_token"])
+        except Exception as e:
+            logging.warning("Could not reach Cognito to refresh tokens: %s", e)
+            success = False
+        if not success:
+            logging.info("Silent token refresh failed; a full login is required.")
+            # Leave no tier behind from the session that could not be renewed
+            with self.lock:
+                if self.session is session:
+                    self.session = None
+                    self.claims = None
+            return False
+        self._apply(session["username"], response["AuthenticationResult"], session["refresh_token"])
+        logging.info("Cognito tokens refreshed for %s", session["username"])
+        return True
+
+    def _schedule_refresh(self):
+        if self.refresh_timer:
+            self.refresh_timer.cancel()
+        delay = max(5.0, self._token_expiry() - REFRESH_MARGIN - time.time())
+        self.refresh_timer = threading.Timer(delay, self.refresh)
+        self.refresh_timer.daemon = True
+        self.refresh_timer.start()
+
+    def sign_out(self):
+        if self.refresh_timer:
+            self.refresh_timer.cancel()
+            self.refresh_timer = None
+        with self.lock:
+            self.session = None
+            self.claims = None
+        self.store.clear()
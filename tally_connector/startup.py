@@ -0,0 +1,117 @@
+# startup.py
+import time
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+def wait_for_port(host, port, timeout=30.0, interval=0.1):
+    """Poll until a TCP port accepts connections. Returns True if it did before timeout."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=interval * 5):
+                return True
+        except OSError:
+            time.sleep(interval)
+    return False
+
+def wait_for_http(url, timeout=30.0, interval=0.1):
+    """Poll until url answers with HTTP 200. Returns True if it did before timeout."""
+    import requests
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(interval)
+    return False
+
+class LazyService:
+    """
+    Stand-in for a backend object that is still being built in the background.
+    Attribute access blocks until the object is ready, then forwards to it.
+    """
+    def __init__(self, orchestrator, name):
+        self._orchestrator = orchestrator
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._orchestrator.get(self._name), attr)
+
+class StartupOrchestrator:
+    """
+    Runs startup phases (DB connectors, Cognito, Tally, readiness probes) on
+    background threads so the window can be shown immediately, and records
+    how long each phase took.
+    """
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+        self.futures = {}
+        self.timings = {}
+        self.callbacks = {}
+        self.lock = threading.Lock()
+        self.started_at = time.perf_counter()
+
+    def submit(self, name, func, *args, **kwargs):
+        """Start a named phase; func's return value becomes the service."""
+        def run():
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    self.timings[name] = elapsed
+                logging.info("Startup phase '%s' finished in %.3fs", name, elapsed)
+        future = self.executor.submit(run)
+        self.futures[name] = future
+        future.add_done_callback(lambda f: self._notify(name, f))
+        return future
+
+    def _notify(self, name, future):
+        with self.lock:
+            callbacks = self.callbacks.pop(name, [])
+        for callback in callbacks:
+            try:
+                callback(name, future.exception())
+            except Exception as e:
+                logging.error("Startup callback for '%s' failed: %s", name, e)
+
+    def on_ready(self, name, callback):
+        """
+        Call callback(name, error) once the phase finishes (error is None on
+        success). Runs on the startup thread, or immediately if already done.
+        """
+        future = self.futures[name]
+        with self.lock:
+            if not future.done():
+                self.callbacks.setdefault(name, []).append(callback)
+                return
+        callback(name, future.exception())
+
+    def get(self, name, timeout=None):
+        """Block until the phase is done and return its result (re-raises errors)."""
+        return self.futures[name].result(timeout=timeout)
+
+    def lazy(self, name):
+        return LazyService(self, name)
+
+    def is_ready(self, name):
+        future = self.futures.get(name)
+        return future is not None and future.done() and future.exception() is None
+
+    def report(self):
+        """Return {phase: seconds} plus total time since the orchestrator was created."""
+        with self.lock:
+            timings = dict(self.timings)
+        timings["total"] = time.perf_counter() - self.started_at
+        return timings
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
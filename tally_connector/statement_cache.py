@@ -0,0 +1,130 @@
+# statement_cache.py
+import datetime
+import hashlib
+import json
+import logging
+from sqlalchemy import create_engine, Table, Column, Integer, String, MetaData, DateTime, Text, select, func
+from sqlalchemy.exc import SQLAlchemyError
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256 MB of cached parse results
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """SHA-256 of the file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _encode_transactions(transactions):
+    encoded = []
+    for txn in transactions:
+        item = dict(txn)
+        if isinstance(item.get("Date"), datetime.date):
+            item["Date"] = item["Date"].isoformat()
+        encoded.append(item)
+    return json.dumps(encoded)
+
+def _decode_transactions(payload):
+    transactions = json.loads(payload)
+    for txn in transactions:
+        if txn.get("Date"):
+            txn["Date"] = datetime.date.fromisoformat(txn["Date"])
+    return transactions
+
+class StatementCache:
+    """
+    Persistent cache of parsed PDF statements, keyed by the SHA-256 of the PDF
+    bytes plus the parser version. Stores the extracted rows, the column map
+    and the final transactions. When the total cached size exceeds max_bytes,
+    the least recently used entries are evicted.
+    """
+    def __init__(self, db_path="statement_cache.db", max_bytes=DEFAULT_MAX_BYTES):
+        self.engine = create_engine(f"sqlite:///{db_path}", echo=False, future=True)
+        self.max_bytes = max_bytes
+        self.metadata = MetaData()
+        self.cache_table = Table(
+            'statement_cache', self.metadata,
+            Column('cache_key', String, primary_key=True),
+            Column('rows', Text, nullable=False),
+            Column('col_map', Text, nullable=False),
+            Column('transactions', Text, nullable=False),
+            Column('size_bytes', Integer, nullable=False),
+            Column('created_at', DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc)),
+            Column('last_accessed', DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc), index=True)
+        )
+        self.metadata.create_all(self.engine)
+
+    @staticmethod
+    def make_key(pdf_path, parser_version):
+        return f"{hash_file(pdf_path)}:{parser_version}"
+
+    def get(self, cache_key):
+        """Return (rows, col_map, transactions) for the key, or None on a miss."""
+        tbl = self.cache_table
+        try:
+            with self.engine.begin() as connection:
+                result = connection.execute(
+                    select(tbl.c.rows, tbl.c.col_map, tbl.c.transactions).where(tbl.c.cache_key == cache_key)
+                ).fetchone()
+                if not result:
+                    return None
+                connection.execute(
+                    tbl.update().where(tbl.c.cache_key == cache_key).values(
+                        last_accessed=datetime.datetime.now(datetime.timezone.utc)
+                    )
+                )
+            return json.loads(result.rows), json.loads(result.col_map), _decode_transactions(result.transactions)
+        except SQLAlchemyError as e:
+            logging.error("Statement cache read error: %s", e)
+            return None
+
+    def put(self, cache_key, rows, col_map, transactions):
+        rows_json = json.dumps(rows)
+        col_map_json = json.dumps(col_map)
+        txns_json = _encode_transactions(transactions)
+        size = len(rows_json) + len(col_map_json) + len(txns_json)
+        if size > self.max_bytes:
+            logging.info("Statement %s too large to cache (%d bytes).", cache_key, size)
+            return
+        tbl = self.cache_table
+        now = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(tbl.delete().where(tbl.c.cache_key == cache_key))
+                connection.execute(tbl.insert().values(
+                    cache_key=cache_key,
+                    rows=rows_json,
+                    col_map=col_map_json,
+                    transactions=txns_json,
+                    size_bytes=size,
+                    created_at=now,
+                    last_accessed=now
+                ))
+                self._evict(connection)
+        except SQLAlchemyError as e:
+            logging.error("Statement cache write error: %s", e)
+
+    def _evict(self, connection):
+        tbl = self.cache_table
+        total = connection.execute(select(func.coalesce(func.sum(tbl.c.size_bytes), 0))).scalar()
+        if total <= self.max_bytes:
+            return
+        entries = connection.execute(
+            select(tbl.c.cache_key, tbl.c.size_bytes).order_by(tbl.c.last_accessed.asc())
+        ).fetchall()
+        evicted = []
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            evicted.append(entry.cache_key)
+            total -= entry.size_bytes
+        if evicted:
+            connection.execute(tbl.delete().where(tbl.c.cache_key.in_(evicted)))
+            logging.info("Evicted %d statement cache entries.", len(evicted))
+
+    def clear(self):
+        with self.engine.begin() as connection:
+            connection.execute(self.cache_table.delete())
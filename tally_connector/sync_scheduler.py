@@ -0,0 +1,164 @@
+# sync_scheduler.py
+import time
+import queue
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+class SyncStatus:
+    """Progress and timing of the syncs for one key (company)."""
+    __slots__ = ("key", "state", "progress", "message", "last_started", "last_finished",
+                 "last_duration", "last_error", "runs", "coalesced")
+
+    def __init__(self, key):
+        self.key = key
+        self.state = "idle"  # idle | queued | running | error
+        self.progress = 0.0
+        self.message = ""
+        self.last_started = None
+        self.last_finished = None
+        self.last_duration = None
+        self.last_error = None
+        self.runs = 0
+        self.coalesced = 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class SyncScheduler:
+    """
+    Runs sync jobs on one worker thread per key, so syncs for the same company
+    never overlap. A request for a key that already has a queued or running
+    sync is coalesced into it instead of starting another one. Keys can also
+    be refreshed periodically in the background.
+
+    Jobs are called as job(progress), where progress(fraction, message)
+    reports how far along the sync is. Listeners are called with
+    (key, status_dict) from the worker thread on every state change.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.workers = {}
+        self.pending = {}  # key -> job queued or running
+        self.statuses = {}
+        self.listeners = []
+        self.timers = {}
+        self.stopped = threading.Event()
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def _notify(self, status):
+        snapshot = status.as_dict()
+        for callback in list(self.listeners):
+            try:
+                callback(status.key, snapshot)
+            except Exception as e:
+                logging.error("Sync listener error: %s", e)
+
+    def status(self, key):
+        with self.lock:
+            status = self.statuses.get(key)
+            return status.as_dict() if status else SyncStatus(key).as_dict()
+
+    def request_sync(self, key, job):
+        """
+        Queue job for key. Returns False if it was coalesced into a sync that
+        is already queued or running for that key, True if it was queued.
+        """
+        with self.lock:
+            status = self.statuses.setdefault(key, SyncStatus(key))
+            if key in self.pending:
+                status.coalesced += 1
+                logging.info("Sync for '%s' already in progress; request coalesced.", key)
+                return False
+            self.pending[key] = job
+            status.state = "queued"
+            status.progress = 0.0
+            status.message = "Queued"
+            work_queue = self.queues.get(key)
+            if work_queue is None:
+                work_queue = self.queues[key] = queue.Queue()
+                worker = threading.Thread(target=self._worker, args=(key, work_queue),
+                                          name=f"sync-{key}", daemon=True)
+                self.workers[key] = worker
+                worker.start()
+        work_queue.put(job)
+        self._notify(status)
+        return True
+
+    def _worker(self, key, work_queue):
+        while not self.stopped.is_set():
+            job = work_queue.get()
+            if job is None:
+                break
+            status = self.statuses[key]
+
+            def progress(fraction, message=""):
+                status.progress = max(0.0, min(1.0, fraction))
+                status.message = message
+                self._notify(status)
+
+            status.state = "running"
+            status.last_started = time.time()
+            start = time.perf_counter()
+            progress(0.0, "Starting")
+            try:
+                job(progress)
+                status.state = "idle"
+                status.last_error = None
+                status.progress = 1.0
+                status.message = "Done"
+            except Exception as e:
+                logging.exception("Sync for '%s' failed", key)
+                status.state = "error"
+                status.last_error = str(e)
+                status.message = "Failed"
+            finally:
+                status.last_duration = time.perf_counter() - start
+                status.last_finished = time.time()
+                status.runs += 1
+                with self.lock:
+                    self.pending.pop(key, None)
+                self._notify(status)
+
+    def start_periodic(self, key, job, interval):
+        """Request a sync for key every interval seconds until stopped."""
+        if not interval or interval <= 0:
+            return
+        self.stop_periodic(key)
+        token = object()
+
+        def tick():
+            with self.lock:
+                active = self.timers.get(key, (None, None))[0] is token
+            if self.stopped.is_set() or not active:
+                return
+            self.request_sync(key, job)
+            self._schedule(key, token, tick, interval)
+
+        self._schedule(key, token, tick, interval)
+
+    def _schedule(self, key, token, tick, interval):
+        timer = threading.Timer(interval, tick)
+        timer.daemon = True
+        with self.lock:
+            self.timers[key] = (token, timer)
+        timer.start()
+
+    def stop_periodic(self, key):
+        with self.lock:
+            _, timer = self.timers.pop(key, (None, None))
+        if timer:
+            timer.cancel()
+
+    def shutdown(self):
+        self.stopped.set()
+        for key in list(self.timers):
+            self.stop_periodic(key)
+        with self.lock:
+            queues = list(self.queues.values())
+        for work_queue in queues:
+            work_queue.put(None)
@@ -1,14 +1,22 @@
 # tally_api.py
 import time
-import re
 import logging
 import requests
 import xml.etree.ElementTree as ET
-from lxml import etree as LET  # Requires: pip install lxml
+from xml.sax.saxutils import escape
 from config import TALLY_URL  # TALLY_URL is defined in config.py
+from xml_sanitizer import sanitize_xml, sanitize_xml_chunks
+from tally_records import LedgerTable, parse_amount, voucher_from_element
+from telemetry import metrics, log_payload
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Voucher header fields and ledger entry lists requested for Day Book exports
+VOUCHER_FETCH_FIELDS = [
+    "DATE", "GUID", "MASTERID", "ALTERID", "VOUCHERTYPENAME", "VOUCHERNUMBER",
+    "PARTYLEDGERNAME", "NARRATION", "ALLLEDGERENTRIES", "LEDGERENTRIES",
+]
+
 class TallyAPIError(Exception):
     """Custom exception for Tally API errors."""
     pass
@@ -34,45 +42,33 @@ class TallyAPI:
             logging.error("Tally is not accessible.")
             return None
         try:
-            response = requests.post(
-                self.server_url, data=xml_request, headers={"Content-Type": "text/xml"}
-            )
-            response.raise_for_status()
-            return self.clean_xml(response.text)
+            with metrics.timer("tally_http_seconds", request="export"):
+                response = requests.post(
+                    self.server_url, data=xml_request, headers={"Content-Type": "text/xml"}
+                )
+                response.raise_for_status()
+            metrics.inc("tally_response_bytes_total", len(response.content), request="export")
+            with metrics.timer("xml_sanitize_seconds"):
+                return self.clean_xml(response.text)
         except requests.exceptions.RequestException as e:
             logging.error(f"Tally request error: {e}")
             return None
 
     @staticmethod
     def clean_xml(text):
-        # Remove non-printable and unwanted characters
-        cleaned = re.sub(r'[\x00-\x08\x0B-\x0C\x0E-\x1F\x7F-\x9F]', '', text)
-        cleaned = re.sub(r'[^\x09\x0A\x0D\x20-\x7E\xA0-\xD7FF\xE000-\xFFFD]', '', cleaned)
-        
-        # Replace numeric character references with their actual character if allowed
-        def replace_entity(match):
-            try:
-                num_str = match.group(1)
-                if num_str.lower().startswith('x'):
-                    code = int(num_str[1:], 16)
-                else:
-                    code = int(num_str)
-                # Allow allowed XML characters: Tab, newline, carriage return, and other allowed ranges.
-                if code in (0x09, 0x0A, 0x0D) or (0x20 <= code <= 0xD7FF) or (0xE000 <= code <= 0xFFFD):
-                    return chr(code)
-                else:
-                    return ''
-            except Exception:
-                return ''
-        cleaned = re.sub(r'&#(x?[0-9A-Fa-f]+);', replace_entity, cleaned)
-        
-        # Extract only the ENVELOPE content
-        cleaned = re.sub(r'^.*?<ENVELOPE>', '<ENVELOPE>', cleaned, 1, re.DOTALL)
-        cleaned = re.sub(r'</ENVELOPE>.*$', '</ENVELOPE>', cleaned, 1, re.DOTALL)
-        return cleaned.strip()
-
-    def _generate_request(self, request_type, request_id, fetch_fields=None, collection_type="Ledger"):
+        # Keep only the ENVELOPE and drop characters/references XML does not allow
+        return sanitize_xml(text)
+
+    def _generate_request(self, request_type, request_id, fetch_fields=None, collection_type="Ledger", company=None,
+                          from_date=None, to_date=None):
         fields_xml = f"<FETCH>{', '.join(fetch_fields)}</FETCH>" if fetch_fields else ""
+        # Pin the request to one loaded company instead of the active one
+        company_xml = f"<SVCURRENTCOMPANY>{escape(company)}</SVCURRENTCOMPANY>" if company else ""
+        # Reporting period (datetime.date) for voucher collections
+        if from_date:
+            company_xml += f"<SVFROMDATE>{from_date:%Y%m%d}</SVFROMDATE>"
+        if to_date:
+            company_xml += f"<SVTODATE>{to_date:%Y%m%d}</SVTODATE>"
         return f"""
         <ENVELOPE>
             <HEADER>
@@ -85,6 +81,7 @@ class TallyAPI:
                 <DESC>
                     <STATICVARIABLES>
                         <SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>
+                        {company_xml}
                     </STATICVARIABLES>
                     <TDL>
                         <TDLMESSAGE>
@@ -121,6 +118,122 @@ class TallyAPI:
             logging.error(f"Failed to parse Tally response: {e}")
             return "Unknown (Parsing Error)"
 
+    @staticmethod
+    @metrics.timed("xml_parse_seconds")
+    def _parse_response(response_xml):
+        """Parse a cleaned response; falls back to lxml's recovery mode. None on failure."""
+        try:
+            return ET.fromstring(response_xml)
+        except ET.ParseError as e:
+            logging.error(f"XML Parsing error with ElementTree: {e}")
+            logging.info("Attempting to parse using lxml with recovery mode.")
+            try:
+                from lxml import etree as LET  # Requires: pip install lxml; only needed for recovery
+                parser = LET.XMLParser(recover=True)
+                return LET.fromstring(response_xml.encode('utf-8'), parser=parser)
+            except Exception as e2:
+                logging.error(f"XML Parsing error with lxml: {e2}")
+                return None
+
+    def get_loaded_companies(self):
+        """Names of all companies currently loaded in this Tally instance."""
+        xml_request = self._generate_request("Collection", "LoadedCompanies", fetch_fields=["NAME"],
+                                             collection_type="Company")
+        response_xml = self.send_request(xml_request)
+        if not response_xml:
+            return []
+        root = self._parse_response(response_xml)
+        if root is None:
+            return []
+        companies = []
+        for item in root.iterfind(".//COLLECTION/COMPANY"):
+            name = item.get("NAME") or (item.findtext("NAME") or "").strip()
+            if name and name not in companies:
+                companies.append(name)
+        return companies
+
+    def fetch_ledgers(self, request_id="AllLedgers", use_cache=True, company=None):
+        """
+        Fetch all ledgers as a typed LedgerTable (name, parent, opening and
+        closing balance parsed once), instead of fetch_data's string dicts.
+        With company set, the export is pinned to that loaded company via
+        SVCURRENTCOMPANY; otherwise Tally's active company is used. Raises
+        TallyAPIError if the request fails or the reply cannot be parsed, so
+        an outage is not mistaken for a company without ledgers.
+        """
+        current_time = time.time()
+        cache_key = ("ledgers", request_id, company)
+        if use_cache and cache_key in self.cache and (current_time - self.cache[cache_key][0]) < self.cache_timeout:
+            return self.cache[cache_key][1]
+
+        xml_request = self._generate_request(
+            "Collection", request_id,
+            fetch_fields=["LEDGERNAME", "PARENT", "OPENINGBALANCE", "CLOSINGBALANCE"],
+            collection_type="Ledger",
+            company=company
+        )
+        response_xml = self.send_request(xml_request)
+        if not response_xml:
+            raise TallyAPIError("No response from Tally for the ledger export.")
+        root = self._parse_response(response_xml)
+        if root is None:
+            raise TallyAPIError("Could not parse the ledger export.")
+
+        table = LedgerTable()
+
+        for item in root.iterfind(".//COLLECTION/LEDGER"):
+            name = item.get("NAME") or (item.findtext("LEDGERNAME") or "").strip() or "N/A"
+            parent = (item.findtext("PARENT") or "").strip() or None
+            table.append(
+                name, parent,
+                parse_amount(item.findtext("CLOSINGBALANCE")),
+                parse_amount(item.findtext("OPENINGBALANCE"))
+            )
+        self.cache[cache_key] = (time.time(), table)
+        metrics.inc("tally_records_total", len(table), collection="Ledger")
+        logging.info("Fetched %d ledgers from Tally%s.", len(table), f" for '{company}'" if company else "")
+        return table
+
+    def iter_vouchers(self, from_date, to_date, company=None, chunk_size=65536, timeout=600):
+        """
+        Stream the vouchers (Day Book) dated from_date to to_date as
+        VoucherRecord objects. The response is sanitized and parsed chunk by
+        chunk, and each voucher element is released once converted, so memory
+        stays flat however many vouchers the period holds. Raises
+        TallyAPIError if Tally cannot be reached.
+        """
+        xml_request = self._generate_request(
+            "Collection", "DayBookVouchers", fetch_fields=VOUCHER_FETCH_FIELDS,
+            collection_type="Voucher", company=company, from_date=from_date, to_date=to_date
+        )
+        if not self.is_tally_running():
+            raise TallyAPIError("Tally is not accessible.")
+        try:
+            # Time to the response headers; the body is consumed as the caller iterates
+            with metrics.timer("tally_http_seconds", request="vouchers"):
+                response = requests.post(self.server_url, data=xml_request, headers={"Content-Type": "text/xml"},
+                                         stream=True, timeout=timeout)
+            count = 0
+            try:
+                with response:
+                    response.raise_for_status()
+                    parser = ET.XMLPullParser(events=("end",))
+                    for chunk in sanitize_xml_chunks(response.iter_content(chunk_size)):
+                        metrics.inc("tally_response_bytes_total", len(chunk), request="vouchers")
+                        parser.feed(chunk)
+                        for _, element in parser.read_events():
+                            if element.tag == "VOUCHER":
+                                count += 1
+                                yield voucher_from_element(element)
+                                element.clear()
+                    parser.close()
+            finally:
+                metrics.inc("tally_records_total", count, collection="Voucher")
+        except requests.exceptions.RequestException as e:
+            raise TallyAPIError(f"Tally request error: {e}") from e
+        except ET.ParseError as e:
+            raise TallyAPIError(f"Could not parse voucher export: {e}") from e
+
     def fetch_data(self, request_id, collection_type="Ledger", fetch_fields=None, use_cache=True):
         """
         Dynamically fetch data from Tally based on provided fields.
@@ -139,17 +252,9 @@ class TallyAPI:
         extracted_data = []
 
         if response_xml:
-            try:
-                root = ET.fromstring(response_xml)
-            except ET.ParseError as e:
-                logging.error(f"XML Parsing error with ElementTree: {e}")
-                logging.info("Attempting to parse using lxml with recovery mode.")
-                try:
-                    parser = LET.XMLParser(recover=True)
-                    root = LET.fromstring(response_xml.encode('utf-8'), parser=parser)
-                except Exception as e2:
-                    logging.error(f"XML Parsing error with lxml: {e2}")
-                    return extracted_data
+            root = self._parse_response(response_xml)
+            if root is None:
+                return extracted_data
 
             for item in root.findall(f".//COLLECTION/{collection_type.upper()}"):
                 # Build dictionary only with requested fields
@@ -168,7 +273,9 @@ class TallyAPI:
                 extracted_data.append(item_data)
 
             self.cache[request_id] = (time.time(), extracted_data)
-            logging.info(f"Fetched data ({collection_type}): {extracted_data}")
+            metrics.inc("tally_records_total", len(extracted_data), collection=collection_type)
+            logging.info("Fetched %d %s records from Tally.", len(extracted_data), collection_type)
+            log_payload(logging.getLogger(), f"Fetched data ({collection_type})", extracted_data, level=logging.DEBUG)
 
         return extracted_data
 
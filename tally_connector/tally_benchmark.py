@@ -0,0 +1,235 @@
+# tally_benchmark.py
+"""
+Benchmarks for the Tally data path, run against the local Tally emulator
+(tally_emulator.py) so the numbers do not depend on a real Tally install:
+
+    export_fetch   TallyAPI.fetch_data over HTTP (request, clean_xml, parse)
+    export_parse   the same minus HTTP: clean_xml, parse and record extraction
+    import_build   building the Import Data envelope (process_ledgers_to_xml)
+    import_post    posting that envelope and reading CREATED/ERRORS
+    sync           the silver ledger sync: active company, export, local store
+
+With --sanitizer only the clean_xml micro-benchmarks run: xml_sanitizer
+(str and chunked bytes) against the previous regex implementation, kept
+below as legacy_clean_xml.
+
+The dataset is generated from a fixed seed. Save a baseline once, then compare
+every performance change against it; a stage slower than the baseline by more
+than --tolerance makes the run exit non-zero:
+
+    python tally_benchmark.py --save-baseline benchmark_baseline.json
+    python tally_benchmark.py --baseline benchmark_baseline.json
+    python tally_benchmark.py --sanitizer
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import statistics
+import datetime
+import timeit
+
+from tally_emulator import SyntheticCompany, TallyEmulator, _render_collection
+from xml_sanitizer import sanitize_xml, sanitize_xml_chunks
+
+LEDGER_FIELDS = ["LEDGERNAME", "PARENT", "CLOSINGBALANCE"]
+
+def _timed(func, repeat):
+    """Run func repeat times; returns (median seconds, last result)."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+def _synthetic_transactions(ledger_names, count, seed):
+    rng = random.Random(seed)
+    bank = ledger_names[0]
+    start = datetime.date(2024, 4, 1)
+    return [{
+        "id": i + 1,
+        "transaction_date": (start + datetime.timedelta(days=rng.randint(0, 364))).isoformat(),
+        "transaction_type": rng.choice(("receipt", "payment")),
+        "description": f"NEFT/{rng.getrandbits(40):x}/{rng.choice(ledger_names)}",
+        "amount": f"{rng.uniform(10, 250000):.2f}",
+        "bank_account": bank,
+        "assigned_ledger": rng.choice(ledger_names),
+    } for i in range(count)]
+
+def legacy_clean_xml(text):
+    """TallyAPI.clean_xml before xml_sanitizer; the reference for --sanitizer."""
+    cleaned = re.sub(r'[\x00-\x08\x0B-\x0C\x0E-\x1F\x7F-\x9F]', '', text)
+    cleaned = re.sub(r'[^\x09\x0A\x0D\x20-\x7E\xA0-\xD7FF\xE000-\xFFFD]', '', cleaned)
+
+    def replace_entity(match):
+        try:
+            num_str = match.group(1)
+            if num_str.lower().startswith('x'):
+                code = int(num_str[1:], 16)
+            else:
+                code = int(num_str)
+            if code in (0x09, 0x0A, 0x0D) or (0x20 <= code <= 0xD7FF) or (0xE000 <= code <= 0xFFFD):
+                return chr(code)
+            else:
+                return ''
+        except Exception:
+            return ''
+    cleaned = re.sub(r'&#(x?[0-9A-Fa-f]+);', replace_entity, cleaned)
+    cleaned = re.sub(r'^.*?<ENVELOPE>', '<ENVELOPE>', cleaned, 1, re.DOTALL)
+    cleaned = re.sub(r'</ENVELOPE>.*$', '</ENVELOPE>', cleaned, 1, re.DOTALL)
+    return cleaned.strip()
+
+def run_sanitizer_benchmarks(ledgers=20000, noise=0.01, repeat=5, seed=0, chunk_size=65536):
+    """Time legacy_clean_xml against sanitize_xml and the chunked byte variant."""
+    company = SyntheticCompany("Benchmark", ledgers, seed=seed, noise=noise)
+    ascii_text = "\r\n" + _render_collection("Ledger", company.ledgers, LEDGER_FIELDS) + "\r\n"
+    # Same export with non-ASCII ledger names, which take sanitize_xml's regex path
+    unicode_text = ascii_text.replace("Traders", "ट्रेडर्स")
+    raw = ascii_text.encode("utf-8")
+    chunks = [raw[i:i + chunk_size] for i in range(0, len(raw), chunk_size)]
+
+    cases = {
+        "legacy (ascii)": lambda: legacy_clean_xml(ascii_text),
+        "sanitize_xml (ascii)": lambda: sanitize_xml(ascii_text),
+        "legacy (unicode)": lambda: legacy_clean_xml(unicode_text),
+        "sanitize_xml (unicode)": lambda: sanitize_xml(unicode_text),
+        "sanitize_xml_chunks": lambda: b"".join(sanitize_xml_chunks(chunks)),
+    }
+    results = {}
+    for name, func in cases.items():
+        seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+        results[name] = {"seconds": seconds, "mb_per_second": len(raw) / 1e6 / seconds}
+    return results
+
+def run_benchmarks(ledgers=20000, vouchers=5000, latency=0.0, repeat=3, seed=0):
+    """Run every stage and return {stage: {"seconds": ..., "per_second": ...}}."""
+    import requests
+    from tally_api import TallyAPI
+    from flask_server import process_ledgers_to_xml
+    from local_db_connector import LocalDbConnector
+
+    results = {}
+    with TallyEmulator(port=0, ledger_count=ledgers, latency=latency, seed=seed, noise=0.01) as emulator:
+        company = emulator.active_company
+
+        def fetch():
+            return TallyAPI(server_url=emulator.url).fetch_data(
+                "AllLedgers", collection_type="Ledger", fetch_fields=LEDGER_FIELDS, use_cache=False)
+        seconds, fetched = _timed(fetch, repeat)
+        results["export_fetch"] = {"seconds": seconds, "per_second": len(fetched) / seconds}
+
+        api = TallyAPI(server_url=emulator.url)
+        raw = requests.post(emulator.url, data=api._generate_request(
+            "Collection", "AllLedgers", fetch_fields=LEDGER_FIELDS, collection_type="Ledger")).text
+        # Same parsing path as fetch_data, with the HTTP round trip taken out
+        api.send_request = lambda xml_request: TallyAPI.clean_xml(raw)
+
+        def parse():
+            return api.fetch_data("AllLedgers", collection_type="Ledger",
+                                  fetch_fields=LEDGER_FIELDS, use_cache=False)
+        seconds, parsed = _timed(parse, repeat)
+        results["export_parse"] = {"seconds": seconds, "per_second": len(parsed) / seconds,
+                                   "mb_per_second": len(raw.encode("utf-8")) / 1e6 / seconds}
+
+        ledger_names = sorted(emulator.companies[company].ledger_names)
+        transactions = _synthetic_transactions(ledger_names, vouchers, seed)
+        seconds, payload = _timed(lambda: process_ledgers_to_xml(company, transactions), repeat)
+        results["import_build"] = {"seconds": seconds, "per_second": vouchers / seconds}
+
+        def post():
+            response = requests.post(emulator.url, data=payload,
+                                     headers={"Content-Type": "text/xml"}, timeout=120)
+            if "<ERRORS>0</ERRORS>" not in response.text:
+                raise RuntimeError(f"Emulator rejected the import: {response.text[:500]}")
+            return response
+        seconds, _ = _timed(post, repeat)
+        results["import_post"] = {"seconds": seconds, "per_second": vouchers / seconds}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            local_db = LocalDbConnector(db_path=os.path.join(tmp, "benchmark.db"))
+
+            def sync():
+                # Mirrors LedgerWidget.run_ledger_sync for a silver user
+                tally = TallyAPI(server_url=emulator.url)
+                if not tally.is_tally_running():
+                    raise RuntimeError("Emulator not reachable")
+                active_company = tally.get_active_company(use_cache=False)
+                synced = tally.fetch_ledgers("AllLedgers", use_cache=False)
+                local_db.upload_ledgers("benchmark@example.com", active_company, synced)
+                return synced
+            seconds, synced = _timed(sync, repeat)
+            local_db.engine.dispose()
+        results["sync"] = {"seconds": seconds, "per_second": len(synced) / seconds}
+    return results
+
+def compare(results, baseline, tolerance):
+    """Return the list of stages slower than baseline by more than tolerance."""
+    regressions = []
+    for stage, current in results.items():
+        reference = baseline.get("results", {}).get(stage)
+        if not reference:
+            continue
+        ratio = current["seconds"] / reference["seconds"]
+        status = "SLOWER" if ratio > 1 + tolerance else "ok"
+        print(f"  {stage:<13} {reference['seconds'] * 1000:9.1f}ms -> {current['seconds'] * 1000:9.1f}ms "
+              f"({ratio:5.2f}x) {status}")
+        if status != "ok":
+            regressions.append(stage)
+    return regressions
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Benchmark the Tally export/import/sync path.")
+    arg_parser.add_argument("--ledgers", type=int, default=20000)
+    arg_parser.add_argument("--vouchers", type=int, default=5000)
+    arg_parser.add_argument("--latency-ms", type=float, default=0.0)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--sanitizer", action="store_true",
+                            help="Only run the clean_xml micro-benchmarks")
+    arg_parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    arg_parser.add_argument("--baseline", help="Compare the results with this JSON file")
+    arg_parser.add_argument("--tolerance", type=float, default=0.15,
+                            help="Allowed slowdown per stage before failing (0.15 = 15%%)")
+    args = arg_parser.parse_args(argv)
+    # Per-record logging would otherwise dominate the timings
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.sanitizer:
+        for name, values in run_sanitizer_benchmarks(ledgers=args.ledgers, repeat=max(args.repeat, 5),
+                                                     seed=args.seed).items():
+            print(f"{name:<24} {values['seconds'] * 1000:9.1f}ms  {values['mb_per_second']:8.1f} MB/s")
+        return 0
+
+    params = {"ledgers": args.ledgers, "vouchers": args.vouchers,
+              "latency_ms": args.latency_ms, "seed": args.seed}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("params") != params:
+            print(f"Baseline was recorded with {baseline.get('params')}; run with the same parameters.")
+            return 2
+
+    results = run_benchmarks(ledgers=args.ledgers, vouchers=args.vouchers,
+                             latency=args.latency_ms / 1000, repeat=args.repeat, seed=args.seed)
+    for stage, values in results.items():
+        print(f"{stage:<13} {values['seconds'] * 1000:9.1f}ms  {values['per_second']:12.0f}/s")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"params": params, "python": sys.version.split()[0], "results": results}, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.baseline:
+        print(f"Compared with {args.baseline}:")
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+# tally_emulator.py
+"""
+Local stand-in for the Tally XML server on port 9000.
+
+Serves synthetic Collection exports (ledgers, loaded companies, and vouchers
+filtered by SVFROMDATE/SVTODATE) and $$CurrentCompany lookups, and answers
+Import Data envelopes with Tally-style CREATED/ALTERED/ERRORS responses
+(including LINEERROR for vouchers that reference unknown ledgers). Response
+size, shape and latency are configurable so TallyAPI, /api/tallyConnector and
+the WebSocket send_to_tally flow can be exercised and benchmarked without Tally:
+
+    python tally_emulator.py --port 9000 --ledgers 20000 --latency-ms 50
+"""
+import re
+import time
+import random
+import datetime
+import logging
+import argparse
+import threading
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape, quoteattr
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+LEDGER_GROUPS = (
+    "Sundry Debtors", "Sundry Creditors", "Bank Accounts", "Cash-in-Hand",
+    "Indirect Expenses", "Direct Expenses", "Indirect Incomes", "Sales Accounts",
+    "Purchase Accounts", "Duties & Taxes", "Current Liabilities", "Loans (Liability)",
+)
+NAME_WORDS = (
+    "Sharma", "Traders", "Enterprises", "Agencies", "Rent", "Salary", "Electricity",
+    "Mumbai", "Delhi", "Steel", "Textiles", "Logistics", "Services", "Hardware",
+    "Pharma", "Motors", "Suppliers", "Industries", "Exports", "Foods", "HDFC", "ICICI",
+)
+# Bytes Tally is known to leave in exports; used when noise is enabled
+NOISE = ("\x04", "&#4;", "\x1f", "&#x1F;", "\x0b")
+NAME_FIELDS = ("NAME", "LEDGERNAME")
+
+class SyntheticCompany:
+    """Deterministic ledger master data for one emulated company."""
+    def __init__(self, name, ledger_count, seed=0, name_words=3, noise=0.0, voucher_count=0,
+                 first_date=datetime.date(2024, 4, 1), days=365):
+        self.name = name
+        rng = random.Random(f"{seed}:{name}")
+        self.ledgers = []
+        seen = set()
+        for i in range(ledger_count):
+            words = [rng.choice(NAME_WORDS) for _ in range(rng.randint(1, name_words))]
+            ledger_name = f"{' '.join(words)} {i}"
+            seen.add(ledger_name)
+            balance = rng.uniform(-500000, 500000)
+            self.ledgers.append({
+                # Written out raw after the name; clean_xml is expected to drop it
+                "_noise": rng.choice(NOISE) if noise and rng.random() < noise else "",
+                "NAME": ledger_name,
+                "LEDGERNAME": ledger_name,
+                "PARENT": rng.choice(LEDGER_GROUPS),
+                "CLOSINGBALANCE": f"{balance:.2f}",
+                "OPENINGBALANCE": f"{rng.uniform(-100000, 100000):.2f}",
+                "GUID": f"{rng.getrandbits(128):032x}",
+                "MASTERID": str(i + 1),
+                "ALTERID": str(rng.randint(1, 10 * ledger_count + 1)),
+            })
+        self.ledger_names = seen
+        self.vouchers = self._make_vouchers(rng, voucher_count, first_date, days) if ledger_count else []
+        self.last_voucher_id = 0
+        self.lock = threading.Lock()
+
+    def _make_vouchers(self, rng, count, first_date, days):
+        """Bank receipts/payments against random ledgers, sorted by date."""
+        bank = next((l["NAME"] for l in self.ledgers if l["PARENT"] == "Bank Accounts"), self.ledgers[0]["NAME"])
+        vouchers = []
+        for i in range(count):
+            party = rng.choice(self.ledgers)["NAME"]
+            amount = round(rng.uniform(10, 250000), 2)
+            is_payment = rng.random() < 0.5
+            vouchers.append({
+                "DATE": first_date + datetime.timedelta(days=rng.randrange(days)),
+                "GUID": f"{rng.getrandbits(128):032x}-{i:08x}",
+                "MASTERID": str(i + 1),
+                "ALTERID": str(i + 1),
+                "VOUCHERTYPENAME": "Payment" if is_payment else "Receipt",
+                "VOUCHERNUMBER": str(i + 1),
+                "PARTYLEDGERNAME": party,
+                "NARRATION": f"{'NEFT' if rng.random() < 0.7 else 'UPI'}/{rng.getrandbits(32):x}/{party}",
+                # (ledger, amount) with Tally's sign: debit negative
+                "ENTRIES": ((bank, amount if is_payment else -amount), (party, -amount if is_payment else amount)),
+            })
+        vouchers.sort(key=lambda v: v["DATE"])
+        return vouchers
+
+def _render_collection(collection_type, items, fetch_fields):
+    tag = collection_type.upper()
+    parts = ["<ENVELOPE><HEADER><VERSION>1</VERSION><STATUS>1</STATUS></HEADER>"
+             "<BODY><DESC></DESC><DATA><COLLECTION>"]
+    for item in items:
+        noise = item.get("_noise", "")
+        parts.append(f"<{tag} NAME={quoteattr(item['NAME'])[:-1]}{noise}\" RESERVEDNAME=\"\">")
+        for field in fetch_fields:
+            value = item.get(field)
+            if value is not None:
+                parts.append(f"<{field}>{escape(value)}{noise if field in NAME_FIELDS else ''}</{field}>")
+        parts.append(f"</{tag}>")
+    parts.append("</COLLECTION></DATA></BODY></ENVELOPE>")
+    return "".join(parts)
+
+def _render_vouchers(vouchers):
+    parts = ["<ENVELOPE><HEADER><VERSION>1</VERSION><STATUS>1</STATUS></HEADER>"
+             "<BODY><DESC></DESC><DATA><COLLECTION>"]
+    for voucher in vouchers:
+        parts.append(f"<VOUCHER REMOTEID={quoteattr(voucher['GUID'])} VCHTYPE={quoteattr(voucher['VOUCHERTYPENAME'])}>"
+                     f"<DATE TYPE=\"Date\">{voucher['DATE']:%Y%m%d}</DATE>")
+        for field in ("GUID", "MASTERID", "ALTERID", "VOUCHERTYPENAME", "VOUCHERNUMBER", "PARTYLEDGERNAME", "NARRATION"):
+            parts.append(f"<{field}>{escape(voucher[field])}</{field}>")
+        for ledger, amount in voucher["ENTRIES"]:
+            parts.append(f"<ALLLEDGERENTRIES.LIST><LEDGERNAME>{escape(ledger)}</LEDGERNAME>"
+                         f"<ISDEEMEDPOSITIVE>{'Yes' if amount < 0 else 'No'}</ISDEEMEDPOSITIVE>"
+                         f"<AMOUNT>{amount:.2f}</AMOUNT></ALLLEDGERENTRIES.LIST>")
+        parts.append("</VOUCHER>")
+    parts.append("</COLLECTION></DATA></BODY></ENVELOPE>")
+    return "".join(parts)
+
+def _parse_request_date(text):
+    try:
+        return datetime.datetime.strptime((text or "").strip(), "%Y%m%d").date()
+    except ValueError:
+        return None
+
+def _render_function_result(value):
+    return ("<ENVELOPE><HEADER><VERSION>1</VERSION><STATUS>1</STATUS></HEADER>"
+            f"<BODY><DESC></DESC><DATA><RESULT TYPE=\"String\">{escape(value)}</RESULT>"
+            "</DATA></BODY></ENVELOPE>")
+
+def _render_import_result(created=0, altered=0, errors=0, last_vch_id=0, line_errors=()):
+    parts = ["<RESPONSE>"]
+    parts.extend(f"<LINEERROR>{escape(message)}</LINEERROR>" for message in line_errors)
+    parts.append(
+        f"<CREATED>{created}</CREATED><ALTERED>{altered}</ALTERED><DELETED>0</DELETED>"
+        f"<LASTVCHID>{last_vch_id}</LASTVCHID><LASTMID>0</LASTMID><COMBINED>0</COMBINED>"
+        f"<IGNORED>0</IGNORED><ERRORS>{errors}</ERRORS><CANCELLED>0</CANCELLED>"
+        "<EXCEPTIONS>0</EXCEPTIONS></RESPONSE>"
+    )
+    return "".join(parts)
+
+FETCH_SPLIT_RE = re.compile(r"\s*,\s*")
+
+class TallyEmulator:
+    """
+    Threaded HTTP server that speaks enough of Tally's XML protocol for the
+    connector. latency is added to every response; latency_per_kb is added
+    per KB of response body to mimic Tally's slow serialisation of big exports.
+    """
+    def __init__(self, host="127.0.0.1", port=9000, companies=("Emulated Company",), ledger_count=1000,
+                 latency=0.0, latency_per_kb=0.0, seed=0, noise=0.0, active_company=None, voucher_count=0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_per_kb = latency_per_kb
+        self.companies = {
+            name: SyntheticCompany(name, ledger_count, seed=seed, noise=noise, voucher_count=voucher_count)
+            for name in companies
+        }
+        self.active_company = active_company or next(iter(self.companies))
+        self.export_cache = {}
+        self.requests_served = 0
+        self.imported = []  # (company, kind, count) per successful import
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    # --- request handling -----------------------------------------------------
+    def handle_xml(self, body):
+        """Return the response body for one XML request."""
+        self.requests_served += 1
+        try:
+            root = ET.fromstring(body)
+        except ET.ParseError as e:
+            return _render_import_result(errors=1, line_errors=[f"Could not parse request: {e}"])
+
+        request_kind = (root.findtext("./HEADER/TALLYREQUEST") or "").strip()
+        if request_kind == "Import Data":
+            return self.handle_import(root)
+
+        request_type = (root.findtext("./HEADER/TYPE") or "").strip()
+        request_id = (root.findtext("./HEADER/ID") or "").strip()
+        company_name = (root.findtext(".//STATICVARIABLES/SVCURRENTCOMPANY") or self.active_company).strip()
+        if request_type == "Function" and request_id == "$$CurrentCompany":
+            return _render_function_result(self.active_company)
+        if request_type == "Collection":
+            collection = root.find(".//TDLMESSAGE/COLLECTION")
+            collection_type = (collection.findtext("TYPE") if collection is not None else None) or "Ledger"
+            fetch = (collection.findtext("FETCH") if collection is not None else None) or ""
+            fields = tuple(f.upper() for f in FETCH_SPLIT_RE.split(fetch.strip()) if f)
+            if collection_type.strip().lower() == "voucher":
+                return self.handle_vouchers(
+                    company_name,
+                    _parse_request_date(root.findtext(".//STATICVARIABLES/SVFROMDATE")),
+                    _parse_request_date(root.findtext(".//STATICVARIABLES/SVTODATE"))
+                )
+            return self.handle_collection(company_name, collection_type.strip(), fields)
+        return _render_function_result("")
+
+    def handle_collection(self, company_name, collection_type, fields):
+        company = self.companies.get(company_name)
+        if company is None:
+            return _render_collection(collection_type, [], fields)
+        key = (company_name, collection_type, fields)
+        cached = self.export_cache.get(key)
+        if cached is None:
+            if collection_type.lower() == "company":
+                items = [{"NAME": name} for name in self.companies]
+            elif collection_type.lower() == "ledger":
+                items = company.ledgers
+            else:
+                items = []
+            cached = self.export_cache[key] = _render_collection(collection_type, items, fields)
+        return cached
+
+    def handle_vouchers(self, company_name, from_date, to_date):
+        company = self.companies.get(company_name)
+        vouchers = company.vouchers if company else []
+        return _render_vouchers([
+            voucher for voucher in vouchers
+            if (from_date is None or voucher["DATE"] >= from_date) and (to_date is None or voucher["DATE"] <= to_date)
+        ])
+
+    def handle_import(self, root):
+        company_name = (root.findtext(".//STATICVARIABLES/SVCURRENTCOMPANY") or self.active_company).strip()
+        company = self.companies.get(company_name)
+        messages = root.findall(".//REQUESTDATA/TALLYMESSAGE")
+        if company is None:
+            return _render_import_result(errors=len(messages),
+                                         line_errors=[f"Could not set 'SVCurrentCompany' to '{company_name}'."])
+        created = errors = 0
+        line_errors = []
+        kind = "masters"
+        for message in messages:
+            voucher = message.find("VOUCHER")
+            if voucher is not None:
+                kind = "vouchers"
+                unknown = [
+                    name for name in (e.findtext("LEDGERNAME") or "" for e in voucher.findall("ALLLEDGERENTRIES.LIST"))
+                    if name not in company.ledger_names
+                ]
+                if unknown:
+                    errors += 1
+                    line_errors.append(f"Ledger '{unknown[0]}' does not exist!")
+                    continue
+                created += 1
+                continue
+            ledger = message.find("LEDGER")
+            if ledger is not None:
+                name = ledger.get("NAME") or ledger.findtext("NAME") or ""
+                with company.lock:
+                    if name in company.ledger_names:
+                        errors += 1
+                        line_errors.append(f"Ledger '{name}' already exists.")
+                        continue
+                    company.ledger_names.add(name)
+                created += 1
+        with company.lock:
+            company.last_voucher_id += created if kind == "vouchers" else 0
+            last_vch_id = company.last_voucher_id
+        if created:
+            self.imported.append((company_name, kind, created))
+        return _render_import_result(created=created, errors=errors, last_vch_id=last_vch_id,
+                                     line_errors=line_errors)
+
+    # --- server lifecycle -----------------------------------------------------
+    def _handler_class(self):
+        emulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logging.debug("tally-emulator: " + format, *args)
+
+            def _reply(self, text):
+                data = text.encode("utf-8")
+                delay = emulator.latency + emulator.latency_per_kb * len(data) / 1024
+                if delay > 0:
+                    time.sleep(delay)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/xml; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._reply("<RESPONSE>TallyPrime Server is Running</RESPONSE>")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                self._reply(emulator.handle_xml(body))
+
+        return Handler
+
+    def start(self):
+        """Serve on a background thread. Port 0 picks a free port."""
+        self.server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="tally-emulator", daemon=True)
+        self.thread.start()
+        logging.info("Tally emulator listening on %s", self.url)
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Run a local Tally XML server stand-in.")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=9000)
+    arg_parser.add_argument("--company", action="append", help="Company name (repeatable)")
+    arg_parser.add_argument("--ledgers", type=int, default=1000, help="Ledgers per company")
+    arg_parser.add_argument("--vouchers", type=int, default=0, help="Vouchers per company (FY 2024-25)")
+    arg_parser.add_argument("--latency-ms", type=float, default=0.0, help="Fixed delay per response")
+    arg_parser.add_argument("--latency-ms-per-kb", type=float, default=0.0, help="Extra delay per KB returned")
+    arg_parser.add_argument("--noise", type=float, default=0.0,
+                            help="Fraction of ledger names carrying control characters/entities")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args(argv)
+
+    emulator = TallyEmulator(
+        host=args.host, port=args.port, companies=args.company or ("Emulated Company",),
+        ledger_count=args.ledgers, latency=args.latency_ms / 1000,
+        latency_per_kb=args.latency_ms_per_kb / 1000, seed=args.seed, noise=args.noise,
+        voucher_count=args.vouchers
+    )
+    emulator.start()
+    try:
+        emulator.thread.join()
+    except KeyboardInterrupt:
+        emulator.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# tally_records.py
+"""
+Typed records for data exported from Tally.
+
+Values are parsed once, when the export is read: amounts become Decimal
+(stored as scaled integers in the columnar tables) with Tally's Dr/Cr
+convention applied, and dates become datetime.date. Consumers work with the
+typed values instead of re-parsing the strings fetch_data returns.
+"""
+import re
+import sys
+import datetime
+from array import array
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Amounts are kept in paise
+AMOUNT_SCALE = 100
+_AMOUNT_NOISE_RE = re.compile(r"[,\s₹]|Rs\.?|INR", re.IGNORECASE)
+_TALLY_DATE_FORMATS = ("%Y%m%d", "%d-%b-%Y", "%d-%b-%y", "%Y-%m-%d", "%d/%m/%Y")
+
+def parse_amount(text):
+    """
+    Parse a Tally amount ("-1234.50", "1,234.50 Dr", "₹ 500 Cr") to Decimal.
+    Follows Tally's XML sign convention: debit is negative, credit positive.
+    Returns None for empty or unparseable values.
+    """
+    if text is None:
+        return None
+    if isinstance(text, Decimal):
+        return text
+    if isinstance(text, (int, float)):
+        return Decimal(str(text))
+    value = text.strip()
+    if not value or value == "N/A":
+        return None
+    sign = 0
+    suffix = value[-2:].lower()
+    if suffix in ("dr", "cr"):
+        sign = -1 if suffix == "dr" else 1
+        value = value[:-2]
+    value = _AMOUNT_NOISE_RE.sub("", value)
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        return None
+    return abs(amount) * sign if sign else amount
+
+def parse_tally_date(text):
+    """Parse a Tally date ("20240401", "1-Apr-2024", ...) to datetime.date, or None."""
+    if text is None:
+        return None
+    if isinstance(text, datetime.date):
+        return text
+    value = text.strip()
+    for fmt in _TALLY_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def format_amount(amount):
+    """Inverse of parse_amount for display/storage; "N/A" for a missing amount."""
+    return "N/A" if amount is None else f"{amount:.2f}"
+
+def format_scaled(value):
+    """Format a scaled integer amount exactly, e.g. -12345 -> "-123.45"."""
+    whole, fraction = divmod(abs(value), AMOUNT_SCALE)
+    return f"{'-' if value < 0 else ''}{whole}.{fraction:02d}"
+
+def to_scaled(amount):
+    """Decimal amount -> integer paise (half-up rounding)."""
+    return int((amount * AMOUNT_SCALE).to_integral_value(rounding=ROUND_HALF_UP))
+
+class LedgerRecord:
+    """One ledger master. closing_balance/opening_balance are Decimal or None."""
+    __slots__ = ("name", "parent", "closing_balance", "opening_balance", "extra")
+
+    def __init__(self, name, parent=None, closing_balance=None, opening_balance=None, extra=None):
+        self.name = name
+        self.parent = parent
+        self.closing_balance = closing_balance
+        self.opening_balance = opening_balance
+        self.extra = extra
+
+    def extra_fields(self):
+        """Fields stored in the ledgers tables' extra_data column, as before."""
+        fields = {"PARENT": self.parent if self.parent is not None else "N/A"}
+        if self.opening_balance is not None:
+            fields["OPENINGBALANCE"] = format_amount(self.opening_balance)
+        if self.extra:
+            fields.update(self.extra)
+        return fields
+
+    def as_dict(self):
+        """The dict shape fetch_data returns for a ledger."""
+        data = {
+            "LEDGERNAME": self.name,
+            "Name": self.name,
+            "CLOSINGBALANCE": format_amount(self.closing_balance),
+            "ClosingBalance": format_amount(self.closing_balance),
+        }
+        data.update(self.extra_fields())
+        return data
+
+    def __repr__(self):
+        return f"LedgerRecord({self.name!r}, {self.parent!r}, {self.closing_balance!r})"
+
+_LEDGER_DICT_KEYS = {"Name", "LEDGERNAME", "ClosingBalance", "CLOSINGBALANCE", "PARENT", "OPENINGBALANCE"}
+
+class LedgerTable:
+    """
+    Columnar, array-backed ledger collection. Balances are scaled integers in
+    array("q") columns (a missing balance is flagged in a bytearray), and
+    parent group names are interned, so a ledger costs a few dozen bytes
+    instead of a dict of strings. Iterating yields LedgerRecord objects.
+    """
+    __slots__ = ("names", "parents", "closing", "opening", "known", "extras")
+
+    # Bits in "known"
+    HAS_CLOSING = 1
+    HAS_OPENING = 2
+
+    def __init__(self):
+        self.names = []
+        self.parents = []
+        self.closing = array("q")
+        self.opening = array("q")
+        self.known = bytearray()
+        self.extras = None  # {row index: dict}, only for rows with extra fields
+
+    def append(self, name, parent=None, closing_balance=None, opening_balance=None, extra=None):
+        flags = 0
+        if closing_balance is not None:
+            flags |= self.HAS_CLOSING
+        if opening_balance is not None:
+            flags |= self.HAS_OPENING
+        self.names.append(name)
+        # Parents repeat heavily (group names); intern to share the strings
+        self.parents.append(sys.intern(parent) if parent is not None else None)
+        self.closing.append(to_scaled(closing_balance) if closing_balance is not None else 0)
+        self.opening.append(to_scaled(opening_balance) if opening_balance is not None else 0)
+        self.known.append(flags)
+        if extra:
+            if self.extras is None:
+                self.extras = {}
+            self.extras[len(self.names) - 1] = extra
+
+    def __len__(self):
+        return len(self.names)
+
+    def closing_balance(self, i):
+        if not self.known[i] & self.HAS_CLOSING:
+            return None
+        return Decimal(self.closing[i]) / AMOUNT_SCALE
+
+    def opening_balance(self, i):
+        if not self.known[i] & self.HAS_OPENING:
+            return None
+        return Decimal(self.opening[i]) / AMOUNT_SCALE
+
+    def record(self, i):
+        return LedgerRecord(
+            self.names[i], self.parents[i], self.closing_balance(i), self.opening_balance(i),
+            self.extras.get(i) if self.extras else None
+        )
+
+    def __iter__(self):
+        return (self.record(i) for i in range(len(self.names)))
+
+    def to_dicts(self):
+        """Legacy list-of-dicts form (e.g. for JSON payloads)."""
+        return [record.as_dict() for record in self]
+
+    @classmethod
+    def from_dicts(cls, ledgers):
+        """Build a table from fetch_data-style dicts, parsing each value once."""
+        table = cls()
+        for ledger in ledgers:
+            extra = {k: v for k, v in ledger.items() if k not in _LEDGER_DICT_KEYS}
+            parent = ledger.get("PARENT")
+            table.append(
+                ledger.get("Name", ledger.get("LEDGERNAME", "N/A")),
+                None if parent in (None, "N/A") else parent,
+                parse_amount(ledger.get("ClosingBalance", ledger.get("CLOSINGBALANCE"))),
+                parse_amount(ledger.get("OPENINGBALANCE")),
+                extra or None
+            )
+        return table
+
+def as_ledger_table(ledgers):
+    """Accept a LedgerTable or legacy ledger dicts; returns a LedgerTable."""
+    return ledgers if isinstance(ledgers, LedgerTable) else LedgerTable.from_dicts(ledgers)
+
+class VoucherEntry:
+    """One ledger line of a voucher. amount follows Tally's sign (debit negative)."""
+    __slots__ = ("ledger_name", "amount", "is_debit")
+
+    def __init__(self, ledger_name, amount, is_debit):
+        self.ledger_name = ledger_name
+        self.amount = amount
+        self.is_debit = is_debit
+
+    def __repr__(self):
+        return f"VoucherEntry({self.ledger_name!r}, {self.amount!r})"
+
+class VoucherRecord:
+    """One voucher with its ledger entries; date is a datetime.date."""
+    __slots__ = ("guid", "master_id", "alter_id", "date", "voucher_type", "voucher_number",
+                 "party_ledger", "narration", "entries")
+
+    def __init__(self, guid, date, voucher_type=None, voucher_number=None, party_ledger=None,
+                 narration=None, entries=(), master_id=None, alter_id=None):
+        self.guid = guid
+        self.master_id = master_id
+        self.alter_id = alter_id
+        self.date = date
+        self.voucher_type = voucher_type
+        self.voucher_number = voucher_number
+        self.party_ledger = party_ledger
+        self.narration = narration
+        self.entries = entries
+
+    def __repr__(self):
+        return f"VoucherRecord({self.guid!r}, {self.date!r}, {self.voucher_type!r}, {len(self.entries)} entries)"
+
+# Ledger lines appear under either list depending on the voucher's view
+VOUCHER_ENTRY_TAGS = ("ALLLEDGERENTRIES.LIST", "LEDGERENTRIES.LIST")
+
+def _text(element, tag):
+    value = element.findtext(tag)
+    if value is None:
+        return None
+    value = value.strip()
+    return value or None
+
+def _int_or_none(value):
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+def voucher_from_element(element):
+    """Build a VoucherRecord from a <VOUCHER> element of a Tally export."""
+    entries = []
+    for tag in VOUCHER_ENTRY_TAGS:
+        for entry in element.iterfind(tag):
+            amount = parse_amount(entry.findtext("AMOUNT"))
+            if amount is None:
+                continue
+            deemed_positive = _text(entry, "ISDEEMEDPOSITIVE")
+            entries.append(VoucherEntry(
+                _text(entry, "LEDGERNAME") or "",
+                amount,
+                deemed_positive == "Yes" if deemed_positive else amount < 0
+            ))
+    return VoucherRecord(
+        guid=_text(element, "GUID") or element.get("REMOTEID"),
+        date=parse_tally_date(element.findtext("DATE")),
+        voucher_type=_text(element, "VOUCHERTYPENAME") or element.get("VCHTYPE"),
+        voucher_number=_text(element, "VOUCHERNUMBER"),
+        party_ledger=_text(element, "PARTYLEDGERNAME"),
+        narration=_text(element, "NARRATION"),
+        entries=tuple(entries),
+        master_id=_int_or_none(_text(element, "MASTERID")),
+        alter_id=_int_or_none(_text(element, "ALTERID")),
+    )
@@ -0,0 +1,226 @@
+# telemetry.py
+"""
+In-process metrics for the connector: counters and timing histograms around
+Tally requests, XML sanitize/parse/build, database statements and WebSocket
+handlers.
+
+    from telemetry import metrics
+    with metrics.timer("xml_parse_seconds", kind="ledgers"):
+        ...
+    metrics.inc("tally_request_errors_total")
+
+The flask server exposes them as Prometheus text on /metrics and as JSON on
+/api/metrics. Processes without an HTTP server (the GUI) can write the JSON
+dump on exit by setting TELEMETRY_DUMP_PATH.
+
+log_payload() replaces logging whole request/response bodies: payloads above
+PAYLOAD_LOG_MAX_CHARS are only logged for a PAYLOAD_LOG_SAMPLE_RATE fraction
+of calls (always when the logger is at DEBUG); otherwise just their size.
+"""
+import os
+import json
+import time
+import atexit
+import random
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+METRICS_PREFIX = "tally_connector_"
+PAYLOAD_LOG_SAMPLE_RATE = float(os.getenv("PAYLOAD_LOG_SAMPLE_RATE", "0.01"))
+PAYLOAD_LOG_MAX_CHARS = int(os.getenv("PAYLOAD_LOG_MAX_CHARS", "2000"))
+TELEMETRY_DUMP_PATH = os.getenv("TELEMETRY_DUMP_PATH")
+# Upper bounds (seconds) of the timing histogram buckets
+TIMER_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+class _Timing:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(TIMER_BUCKETS)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        for i, bound in enumerate(TIMER_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+class Metrics:
+    """Thread-safe counters and timers keyed by name and label set."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # name -> {label key: value}
+        self.timers = {}  # name -> {label key: _Timing}
+        self.started = time.time()
+
+    def inc(self, name, value=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.timers.setdefault(name, {})
+            timing = series.get(key)
+            if timing is None:
+                timing = series[key] = _Timing()
+            timing.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Time the block into histogram name. Exceptions are also counted, in
+        name with "_seconds" replaced by "_errors_total".
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(name.replace("_seconds", "") + "_errors_total", **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        """Decorator form of timer()."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """Everything recorded so far as a JSON-serializable dict."""
+        with self.lock:
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self.counters.items()
+            }
+            timers = {
+                name: [{
+                    "labels": dict(key), "count": timing.count, "sum": timing.total, "max": timing.max,
+                    "mean": timing.total / timing.count if timing.count else 0.0,
+                } for key, timing in series.items()]
+                for name, series in self.timers.items()
+            }
+        return {"started": self.started, "uptime_seconds": time.time() - self.started,
+                "counters": counters, "timers": timers}
+
+    def render_prometheus(self):
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        with self.lock:
+            for name in sorted(self.counters):
+                metric = METRICS_PREFIX + name
+                lines.append(f"# TYPE {metric} counter")
+                for key, value in self.counters[name].items():
+                    lines.append(f"{metric}{_format_labels(key)} {value}")
+            for name in sorted(self.timers):
+                metric = METRICS_PREFIX + name
+                lines.append(f"# TYPE {metric} histogram")
+                for key, timing in self.timers[name].items():
+                    cumulative = 0
+                    for bound, count in zip(TIMER_BUCKETS, timing.buckets):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{_format_labels(key, [('le', str(bound))])} {cumulative}")
+                    lines.append(f"{metric}_bucket{_format_labels(key, [('le', '+Inf')])} {timing.count}")
+                    lines.append(f"{metric}_sum{_format_labels(key)} {timing.total}")
+                    lines.append(f"{metric}_count{_format_labels(key)} {timing.count}")
+        lines.append(f"# TYPE {METRICS_PREFIX}uptime_seconds gauge")
+        lines.append(f"{METRICS_PREFIX}uptime_seconds {time.time() - self.started}")
+        return "\n".join(lines) + "\n"
+
+    def dump_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.timers.clear()
+            self.started = time.time()
+
+# Process-wide metrics
+metrics = Metrics()
+
+if TELEMETRY_DUMP_PATH:
+    atexit.register(lambda: metrics.dump_json(TELEMETRY_DUMP_PATH))
+
+def log_payload(logger, label, payload, level=logging.INFO):
+    """
+    Log payload (str, bytes or anything json.dumps accepts) under label.
+    Large payloads are logged in full only for a sample of calls.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if isinstance(payload, bytes):
+        text = payload.decode("utf-8", errors="replace")
+    elif isinstance(payload, str):
+        text = payload
+    else:
+        text = json.dumps(payload, default=str)
+    if (len(text) <= PAYLOAD_LOG_MAX_CHARS or logger.isEnabledFor(logging.DEBUG)
+            or random.random() < PAYLOAD_LOG_SAMPLE_RATE):
+        logger.log(level, "%s: %s", label, text)
+    else:
+        metrics.inc("payload_logs_sampled_out_total")
+        logger.log(level, "%s: %d chars (not logged; sampled at %.2f%%)", label, len(text),
+                   PAYLOAD_LOG_SAMPLE_RATE * 100)
+
+def _statement_kind(statement):
+    word = statement.lstrip().split(None, 1)
+    return word[0].upper() if word else "OTHER"
+
+def instrument_engine(engine, db):
+    """Time every statement run on a SQLAlchemy engine as db_statement_seconds{db, statement}."""
+    from sqlalchemy import event
+
+    if getattr(engine, "_telemetry_instrumented", False):
+        return engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("telemetry_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("telemetry_start")
+        if starts:
+            metrics.observe("db_statement_seconds", time.perf_counter() - starts.pop(),
+                            db=db, statement=_statement_kind(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("telemetry_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+        metrics.inc("db_statement_errors_total", db=db)
+
+    engine._telemetry_instrumented = True
+    return engine
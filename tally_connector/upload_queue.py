@@ -0,0 +1,156 @@
+# upload_queue.py
+import datetime
+import json
+import logging
+import random
+import threading
+import time
+from sqlalchemy import create_engine, Table, Column, Integer, String, MetaData, DateTime, Text, Float, select, func
+from sqlalchemy.exc import SQLAlchemyError
+from tally_records import LedgerTable
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+class CloudUploadQueue:
+    """
+    Durable write-behind queue for gold-tier cloud uploads.
+
+    enqueue_ledgers records the upload in a local SQLite table and returns at
+    once. A background thread flushes pending uploads to the cloud connector
+    in batches; failures are retried with exponential backoff, so cloud
+    latency or outages neither block the GUI nor lose synced data.
+    """
+    def __init__(self, cloud_connector, db_path="local_storage.db", batch_size=5,
+                 base_delay=5.0, max_delay=600.0, poll_interval=30.0):
+        self.cloud_connector = cloud_connector
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.engine = create_engine(f"sqlite:///{db_path}", echo=False, future=True)
+        self.metadata = MetaData()
+        self.pending_uploads = Table(
+            'pending_cloud_uploads', self.metadata,
+            Column('id', Integer, primary_key=True, autoincrement=True),
+            Column('kind', String, nullable=False),
+            Column('username', String, nullable=False),
+            Column('company_name', String, nullable=False),
+            Column('payload', Text, nullable=False),
+            Column('attempts', Integer, nullable=False, default=0),
+            Column('next_attempt_at', Float, nullable=False, index=True),  # unix time
+            Column('last_error', Text, nullable=True),
+            Column('created_at', DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+        )
+        self.metadata.create_all(self.engine)
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.in_flight = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, name="cloud-upload-queue", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+
+    def enqueue_ledgers(self, username, company_name, ledgers):
+        """
+        Record a ledger upload for the cloud and return its queue id. Older
+        pending snapshots for the same user and company are replaced, since
+        only the latest sync needs to reach the cloud.
+        """
+        tbl = self.pending_uploads
+        with self.lock:
+            in_flight = self.in_flight
+        with self.engine.begin() as connection:
+            stale = tbl.delete().where(
+                tbl.c.kind == "ledgers",
+                tbl.c.username == username,
+                tbl.c.company_name == company_name
+            )
+            if in_flight is not None:
+                stale = stale.where(tbl.c.id != in_flight)
+            connection.execute(stale)
+            result = connection.execute(tbl.insert().values(
+                kind="ledgers",
+                username=username,
+                company_name=company_name,
+                payload=json.dumps(ledgers.to_dicts() if isinstance(ledgers, LedgerTable) else ledgers),
+                attempts=0,
+                next_attempt_at=time.time()
+            ))
+            upload_id = result.inserted_primary_key[0]
+        logging.info("Queued %d ledgers for cloud upload (%s / %s).", len(ledgers), username, company_name)
+        self.wakeup.set()
+        return upload_id
+
+    def pending_count(self):
+        with self.engine.connect() as connection:
+            return connection.execute(select(func.count()).select_from(self.pending_uploads)).scalar()
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                flushed = self.flush()
+            except SQLAlchemyError as e:
+                logging.error("Cloud upload queue error: %s", e)
+                flushed = 0
+            if flushed == 0:
+                self.wakeup.wait(self._seconds_until_next())
+                self.wakeup.clear()
+
+    def _seconds_until_next(self):
+        tbl = self.pending_uploads
+        with self.engine.connect() as connection:
+            next_at = connection.execute(select(func.min(tbl.c.next_attempt_at))).scalar()
+        if next_at is None:
+            return self.poll_interval
+        return max(0.1, min(self.poll_interval, next_at - time.time()))
+
+    def flush(self):
+        """Upload one batch of due entries. Returns how many were uploaded."""
+        tbl = self.pending_uploads
+        with self.engine.connect() as connection:
+            due = connection.execute(
+                select(tbl).where(tbl.c.next_attempt_at <= time.time())
+                .order_by(tbl.c.id).limit(self.batch_size)
+            ).fetchall()
+
+        uploaded = 0
+        for entry in due:
+            if self.stopped.is_set():
+                break
+            with self.lock:
+                self.in_flight = entry.id
+            try:
+                ledgers = json.loads(entry.payload)
+                self.cloud_connector.upload_ledgers(entry.username, entry.company_name, ledgers, raise_errors=True)
+            except Exception as e:
+                attempts = entry.attempts + 1
+                delay = self._backoff(attempts)
+                logging.warning("Cloud upload %s failed (attempt %d), retrying in %.0fs: %s",
+                                entry.id, attempts, delay, e)
+                with self.engine.begin() as connection:
+                    connection.execute(tbl.update().where(tbl.c.id == entry.id).values(
+                        attempts=attempts,
+                        next_attempt_at=time.time() + delay,
+                        last_error=str(e)[:1000]
+                    ))
+                continue
+            finally:
+                with self.lock:
+                    self.in_flight = None
+            with self.engine.begin() as connection:
+                connection.execute(tbl.delete().where(tbl.c.id == entry.id))
+            uploaded += 1
+        return uploaded
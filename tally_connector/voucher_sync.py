@@ -0,0 +1,101 @@
+# voucher_sync.py
+"""
+Voucher (Day Book) export from Tally into the local store.
+
+The requested period is split into date windows. Each window is streamed from
+Tally with TallyAPI.iter_vouchers, then replaces that window in the local
+tally_vouchers / tally_voucher_entries tables in one short transaction. The
+exported range is recorded per company, so the next run only fetches from the
+last synced date (minus an overlap for back-dated entries) up to today:
+
+    python voucher_sync.py --username accounts@example.com --company "ABC Traders"
+    python voucher_sync.py --username accounts@example.com --company "ABC Traders" --from 2024-04-01
+"""
+import sys
+import logging
+import argparse
+import datetime
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+VOUCHER_WINDOW_DAYS = 31
+# Re-export this many days before the last synced date on incremental runs
+VOUCHER_OVERLAP_DAYS = 7
+
+def financial_year_start(day):
+    """1 April of the Indian financial year containing day."""
+    year = day.year if day.month >= 4 else day.year - 1
+    return datetime.date(year, 4, 1)
+
+def date_windows(from_date, to_date, window_days=VOUCHER_WINDOW_DAYS):
+    """Split from_date..to_date (inclusive) into consecutive windows."""
+    start = from_date
+    while start <= to_date:
+        end = min(to_date, start + datetime.timedelta(days=window_days - 1))
+        yield start, end
+        start = end + datetime.timedelta(days=1)
+
+class VoucherSync:
+    def __init__(self, tally_api, local_db, window_days=VOUCHER_WINDOW_DAYS, overlap_days=VOUCHER_OVERLAP_DAYS):
+        self.tally_api = tally_api
+        self.local_db = local_db
+        self.window_days = window_days
+        self.overlap_days = overlap_days
+
+    def plan(self, company_id, from_date=None, to_date=None):
+        """The (from_date, to_date) range the next sync should export."""
+        to_date = to_date or datetime.date.today()
+        if from_date is None:
+            state = self.local_db.get_voucher_sync_state(company_id)
+            if state:
+                from_date = max(state[0], state[1] - datetime.timedelta(days=self.overlap_days))
+            else:
+                from_date = financial_year_start(to_date)
+        return from_date, to_date
+
+    def sync(self, username, company_name, from_date=None, to_date=None, progress=None):
+        """
+        Export company_name's vouchers into the local store. Without
+        from_date the sync is incremental (see plan). progress(fraction,
+        message) is called per window, matching SyncScheduler jobs.
+        Returns the number of vouchers stored.
+        """
+        company_id = self.local_db.get_or_create_company(username, company_name)
+        self.local_db.add_user_company_mapping(username, company_id, role='admin')
+        from_date, to_date = self.plan(company_id, from_date, to_date)
+        windows = list(date_windows(from_date, to_date, self.window_days))
+        total = 0
+        for i, (start, end) in enumerate(windows):
+            if progress:
+                progress(i / len(windows), f"Vouchers {start:%d-%b-%Y} to {end:%d-%b-%Y}")
+            vouchers = self.tally_api.iter_vouchers(start, end, company=company_name)
+            total += self.local_db.replace_vouchers(company_id, start, end, vouchers)
+            # Recorded per window, so an interrupted sync resumes where it stopped
+            self.local_db.update_voucher_sync_state(company_id, start, end)
+        logging.info("Voucher sync for '%s': %d vouchers from %s to %s in %d windows.",
+                     company_name, total, from_date, to_date, len(windows))
+        return total
+
+def main(argv=None):
+    from tally_api import TallyAPI
+    from local_db_connector import LocalDbConnector
+
+    arg_parser = argparse.ArgumentParser(description="Export Tally vouchers into the local database.")
+    arg_parser.add_argument("--username", required=True)
+    arg_parser.add_argument("--company", help="Company to export (defaults to Tally's active company)")
+    arg_parser.add_argument("--from", dest="from_date", type=datetime.date.fromisoformat,
+                            help="Start date (YYYY-MM-DD); defaults to an incremental sync")
+    arg_parser.add_argument("--to", dest="to_date", type=datetime.date.fromisoformat,
+                            help="End date (YYYY-MM-DD); defaults to today")
+    arg_parser.add_argument("--window-days", type=int, default=VOUCHER_WINDOW_DAYS)
+    arg_parser.add_argument("--tally-url", help="Tally server URL (defaults to TALLY_URL)")
+    args = arg_parser.parse_args(argv)
+
+    tally_api = TallyAPI(server_url=args.tally_url)
+    company = args.company or tally_api.get_active_company(use_cache=False)
+    syncer = VoucherSync(tally_api, LocalDbConnector(), window_days=args.window_days)
+    syncer.sync(args.username, company, from_date=args.from_date, to_date=args.to_date)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
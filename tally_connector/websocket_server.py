@@ -6,14 +6,28 @@ import logging
 import socket
 import datetime
 import os
-
-from local_db_connector import LocalDbConnector
+import time
+import threading
+import itertools
+from decimal import Decimal
+from telemetry import metrics, log_payload
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 active_connections = set()
-local_db = LocalDbConnector()
+local_db = None
+_local_db_lock = threading.Lock()
+
+def get_local_db():
+    """Create the LocalDbConnector on first use instead of at import time."""
+    global local_db
+    if local_db is None:
+        with _local_db_lock:
+            if local_db is None:
+                from local_db_connector import LocalDbConnector
+                local_db = LocalDbConnector()
+    return local_db
 
 def is_port_in_use(port: int) -> bool:
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -46,6 +60,7 @@ async def heartbeat(websocket, client_id):
         active_connections.discard(websocket)
 
 async def handle_websocket(websocket):
+    local_db = get_local_db()
     client_id = id(websocket)
     logger.info(f"New WebSocket connection {client_id}")
     active_connections.add(websocket)
@@ -59,10 +74,14 @@ async def handle_websocket(websocket):
         }))
 
         async for message in websocket:
+            msg_type = None
+            metric_type = None
+            started = time.perf_counter()
             try:
                 msg_data = json.loads(message)
-                logger.info("Received message: %s", msg_data)
+                log_payload(logger, "Received message", message)
                 msg_type = msg_data.get("type")
+                metric_type = msg_type
 
                 if msg_type == "ping":
                     await websocket.send(json.dumps({"type": "pong"}))
@@ -109,7 +128,8 @@ async def handle_websocket(websocket):
                             "type": "store_pdf_response",
                             "status": "success",
                             "table": upload_id,
-                            "fileName": fileName
+                            "fileName": fileName,
+                            "duplicates": local_db.get_duplicate_count(upload_id)
                         }))
                     except Exception as e:
                         logging.error(f"Error storing PDF data: {e}")
@@ -162,33 +182,7 @@ async def handle_websocket(websocket):
                         }))
                     else:
                         try:
-                            with local_db.engine.begin() as connection:
-                                delete_stmt = local_db.temporary_transactions.delete().where(
-                                    local_db.temporary_transactions.c.upload_id == upload_id
-                                )
-                                connection.execute(delete_stmt)
-
-                            with local_db.engine.begin() as connection:
-                                for row in update_data:
-                                    let_date = row.get("transaction_date")
-                                    jsDate = local_db.convert_date(let_date) if let_date else None
-                                    # For transaction type, try both keys.
-                                    txn_type = row.get("transaction_type") or row.get("type") or None
-                                    # For assigned ledger, try both keys.
-                                    assigned_ledger = row.get("assignedLedger") or row.get("assigned_ledger") or ""
-                                    connection.execute(
-                                        local_db.temporary_transactions.insert().values(
-                                            upload_id=upload_id,
-                                            email=row.get("email", ""),  # Ensure you pass the email
-                                            company=row.get("company", ""),  # And the company
-                                            bank_account=row.get("bank_account", ""),
-                                            transaction_date=jsDate,
-                                            transaction_type=txn_type,
-                                            description=row.get("description", ""),
-                                            amount=row.get("amount", 0),
-                                            assigned_ledger=assigned_ledger
-                                        )
-                                    )
+                            local_db.update_temp_excel(upload_id, update_data)
                             logger.info("Update for upload %s completed", upload_id)
                             await websocket.send(json.dumps({
                                 "type": "update_temp_excel_response",
@@ -216,6 +210,113 @@ async def handle_websocket(websocket):
                             "type": "error",
                             "error": "Missing company_id parameter for ledger options."
                         }))
+
+                elif msg_type == "search_ledgers":
+                    company_id = msg_data.get("company_id")
+                    query = msg_data.get("query") or ""
+                    limit = min(int(msg_data.get("limit") or 20), 200)
+                    if company_id:
+                        # The first search after a sync builds the index; keep the event loop free
+                        matches = await asyncio.to_thread(local_db.search_ledgers, company_id, query, limit)
+                        await websocket.send(json.dumps({
+                            "type": "ledger_search_results",
+                            "company_id": company_id,
+                            "query": query,
+                            "matches": matches
+                        }))
+                    else:
+                        await websocket.send(json.dumps({
+                            "type": "error",
+                            "error": "Missing company_id parameter for ledger search."
+                        }))
+
+                elif msg_type == "suggest_ledgers":
+                    # Suggestions for a whole upload (or the given rows) in one round trip
+                    company_id = msg_data.get("company_id")
+                    upload_id = msg_data.get("upload_id")
+                    rows = msg_data.get("rows")
+                    top_k = int(msg_data.get("top_k") or 3)
+                    if not company_id or not (upload_id or rows):
+                        await websocket.send(json.dumps({
+                            "type": "error",
+                            "error": "Missing company_id, or upload_id/rows, for ledger suggestions."
+                        }))
+                    else:
+                        try:
+                            if rows is None:
+                                rows = local_db.get_temp_table_data(upload_id)
+                                if not msg_data.get("include_assigned"):
+                                    rows = [row for row in rows if not row.get("assigned_ledger")]
+                            # Building the index and scoring are CPU bound; keep the event loop free
+                            suggestions = await asyncio.to_thread(
+                                local_db.suggest_ledgers, company_id,
+                                [row.get("description") or "" for row in rows], top_k
+                            )
+                            await websocket.send(json.dumps({
+                                "type": "ledger_suggestions",
+                                "status": "success",
+                                "upload_id": upload_id,
+                                "data": [
+                                    {"id": row.get("id"), "suggestions": ranked}
+                                    for row, ranked in zip(rows, suggestions)
+                                ]
+                            }))
+                        except Exception as e:
+                            logger.exception("Error suggesting ledgers")
+                            await websocket.send(json.dumps({
+                                "type": "ledger_suggestions",
+                                "status": "error",
+                                "upload_id": upload_id,
+                                "error": str(e)
+                            }))
+                elif msg_type == "reconcile_statement":
+                    upload_id = msg_data.get("upload_id")
+                    if not upload_id:
+                        await websocket.send(json.dumps({
+                            "type": "error",
+                            "error": "Missing upload_id for reconciliation."
+                        }))
+                    else:
+                        try:
+                            from reconciliation import BankReconciler
+                            voucher_sync = None
+                            if msg_data.get("refresh"):
+                                from tally_api import TallyAPI
+                                from voucher_sync import VoucherSync
+                                voucher_sync = VoucherSync(TallyAPI(), local_db)
+                            items = BankReconciler(local_db, voucher_sync).run(
+                                upload_id,
+                                date_window_days=int(msg_data.get("date_window_days", 3)),
+                                amount_tolerance=Decimal(str(msg_data.get("amount_tolerance", "0")))
+                            )
+                            summary = {"matched": 0, "missing_in_tally": 0, "missing_in_statement": 0}
+                            # Results go out in batches as the sweep produces them
+                            while True:
+                                batch = await asyncio.to_thread(lambda: list(itertools.islice(items, 500)))
+                                if not batch:
+                                    break
+                                for item in batch:
+                                    summary[item.status] += 1
+                                await websocket.send(json.dumps({
+                                    "type": "reconciliation_results",
+                                    "upload_id": upload_id,
+                                    "data": [item.as_dict() for item in batch]
+                                }))
+                            await websocket.send(json.dumps({
+                                "type": "reconciliation_complete",
+                                "status": "success",
+                                "upload_id": upload_id,
+                                "summary": summary
+                            }))
+                        except Exception as e:
+                            logger.exception("Error reconciling upload %s", upload_id)
+                            await websocket.send(json.dumps({
+                                "type": "reconciliation_complete",
+                                "status": "error",
+                                "upload_id": upload_id,
+                                "error": str(e)
+                            }))
+
                 elif msg_type == "send_to_tally":
                     company = msg_data.get("company")
                     tempTable = msg_data.get("tempTable")
@@ -243,6 +344,9 @@ async def handle_websocket(websocket):
                         
                         # Filter transactions that have an assigned ledger.
                         transactions = [t for t in transactions if t.get("assigned_ledger", "").strip() != ""]
+                        # Rows already uploaded in an earlier statement would be posted twice
+                        duplicates = sum(1 for t in transactions if t.get("status") == "duplicate")
+                        transactions = [t for t in transactions if t.get("status") != "duplicate"]
                         
                         if not transactions:
                             await websocket.send(json.dumps({
@@ -259,7 +363,7 @@ async def handle_websocket(websocket):
                                     "company": properCompanyName,
                                     "data": transactions
                                 }
-                                logger.info("Sending payload to Tally: %s", payload)
+                                log_payload(logger, "Sending payload to Tally", payload)
                                 flask_response = requests.post(
                                     flask_endpoint,
                                     json=payload,  # sending as JSON so the Flask server can call request.get_json()
@@ -277,6 +381,7 @@ async def handle_websocket(websocket):
                                     "status": "success",
                                     "message": "Data sent to Tally successfully",
                                     "transactionsSent": len(transactions),
+                                    "duplicatesSkipped": duplicates,
                                     "tallyResponse": flask_response.json()  # or flask_response.text if preferred
                                 }))
                             except Exception as e:
@@ -289,6 +394,8 @@ async def handle_websocket(websocket):
 
                 else:
                     logger.debug("Unrecognized message type received: %s", msg_type)
+                    # Keep client-supplied names out of the metric labels
+                    metric_type = "unrecognized"
                     await websocket.send(json.dumps({
                         "type": "error",
                         "error": f"Unrecognized message type: {msg_type}"
@@ -300,11 +407,15 @@ async def handle_websocket(websocket):
                     "error": "Invalid JSON format."
                 }))
             except Exception as e:
+                metrics.inc("websocket_handler_errors_total", type=metric_type or "invalid")
                 logger.exception("Error handling message: %s", e)
                 await websocket.send(json.dumps({
                     "type": "error",
                     "error": str(e)
                 }))
+            finally:
+                metrics.observe("websocket_handler_seconds", time.perf_counter() - started,
+                                type=metric_type or "invalid")
 
     except websockets.exceptions.ConnectionClosed:
         logger.info(f"WebSocket connection closed for client {client_id}")
@@ -346,6 +457,8 @@ async def websocket_listener():
             retries -= 1
 
 def start_websocket_server():
+    # Open the local DB before listening, so an open port means ready
+    get_local_db()
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     loop.run_until_complete(websocket_listener())
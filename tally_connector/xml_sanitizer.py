@@ -0,0 +1,131 @@
+# xml_sanitizer.py
+"""
+Single-pass cleanup of Tally XML responses before parsing.
+
+Tally leaves control characters and references to them (&#4;) in exports,
+which ElementTree rejects. sanitize_xml trims the text to the ENVELOPE
+element, deletes characters XML does not allow and drops numeric character
+references to them; valid references are left for the parser to decode.
+XmlByteSanitizer does the same on raw UTF-8 bytes, one chunk at a time.
+"""
+import re
+
+OPEN_TAG = "<ENVELOPE>"
+CLOSE_TAG = "</ENVELOPE>"
+
+# Characters XML 1.0 does not allow, plus C1 controls (which Tally only ever
+# emits as garbage)
+_ASCII_CONTROLS = [*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F]
+_INVALID_CHARS = _ASCII_CONTROLS + [*range(0x80, 0xA0), *range(0xD800, 0xE000), 0xFFFE, 0xFFFF]
+
+# str.translate is fastest on ASCII text; on other text it falls back to a
+# per-character dict lookup, where the regex character class is much quicker.
+_ASCII_DELETE_TABLE = dict.fromkeys(_ASCII_CONTROLS)
+_INVALID_CHARS_RE = re.compile("[%s]" % "".join(re.escape(chr(c)) for c in _INVALID_CHARS))
+
+# Numeric references that would decode to a disallowed character, and the
+# malformed decimal-with-hex-digit form the old cleaner also dropped
+_INVALID_REF = (
+    r"&#(?:"
+    r"0*(?:[0-8]|1[124-9]|2[0-9]|3[01]|12[7-9]|1[3-5][0-9]"
+    r"|5529[6-9]|55[3-9][0-9]{2}|56[0-9]{3}|57[0-2][0-9]{2}|573[0-3][0-9]|5734[0-3]"
+    r"|6553[45]|111411[2-9]|11141[2-9][0-9]|1114[2-9][0-9]{2}|111[5-9][0-9]{3}"
+    r"|11[2-9][0-9]{4}|1[2-9][0-9]{5}|[2-9][0-9]{6}|[1-9][0-9]{7,})"
+    r"|[xX]0*(?:[0-8bBcCeEfF]|1[0-9a-fA-F]|7[fF]|[89][0-9a-fA-F]"
+    r"|[dD][89a-fA-F][0-9a-fA-F]{2}|[fF]{3}[eEfF]"
+    r"|1[1-9a-fA-F][0-9a-fA-F]{4}|[2-9a-fA-F][0-9a-fA-F]{5}|[1-9a-fA-F][0-9a-fA-F]{6,})"
+    r"|[0-9]*[a-fA-F][0-9a-fA-F]*"
+    r");"
+)
+_INVALID_REF_RE = re.compile(_INVALID_REF)
+_INVALID_REF_BYTES_RE = re.compile(_INVALID_REF.encode("ascii"))
+_ASCII_CONTROL_BYTES = bytes(_ASCII_CONTROLS)
+# Longest reference the patterns above can match that is still worth holding
+# back at a chunk boundary
+_MAX_REF_LENGTH = 16
+
+def sanitize_xml(text):
+    """Clean a Tally response (str) for ElementTree; see the module docstring."""
+    start = text.find(OPEN_TAG)
+    if start > 0:
+        text = text[start:]
+    end = text.find(CLOSE_TAG)
+    if end != -1:
+        text = text[:end + len(CLOSE_TAG)]
+
+    if text.isascii():
+        text = text.translate(_ASCII_DELETE_TABLE)
+    else:
+        text = _INVALID_CHARS_RE.sub("", text)
+    if "&#" in text:
+        text = _INVALID_REF_RE.sub("", text)
+    return text.strip()
+
+class XmlByteSanitizer:
+    """
+    Incremental sanitize_xml for UTF-8 bytes, e.g. from a streamed HTTP
+    response. feed() returns the cleaned bytes that are safe to emit so far;
+    a possible character reference split across chunks, or a partial
+    ENVELOPE tag, is held back until the next chunk. Only ASCII control bytes
+    are deleted, since C1 and non-BMP checks need decoded text.
+    """
+    def __init__(self):
+        self.pending = b""
+        self.started = False
+        self.finished = False
+
+    def feed(self, chunk):
+        if self.finished:
+            return b""
+        data = self.pending + chunk.translate(None, _ASCII_CONTROL_BYTES)
+        self.pending = b""
+
+        if not self.started:
+            start = data.find(OPEN_TAG.encode("ascii"))
+            if start == -1:
+                # Keep just enough to recognise a tag split across chunks
+                self.pending = data[-(len(OPEN_TAG) - 1):]
+                return b""
+            data = data[start:]
+            self.started = True
+
+        end = data.find(CLOSE_TAG.encode("ascii"))
+        if end != -1:
+            self.finished = True
+            return self._clean_refs(data[:end + len(CLOSE_TAG)])
+
+        # Hold back an unterminated "&#..." and a possibly partial close tag
+        cut = len(data)
+        amp = data.rfind(b"&", max(0, cut - _MAX_REF_LENGTH))
+        if amp != -1 and b";" not in data[amp:]:
+            cut = amp
+        lt = data.rfind(b"<", max(0, cut - len(CLOSE_TAG)))
+        if lt != -1 and b">" not in data[lt:cut]:
+            cut = lt
+        self.pending = data[cut:]
+        return self._clean_refs(data[:cut])
+
+    def finish(self):
+        """Return whatever is still held back once the input is exhausted."""
+        data, self.pending = self.pending, b""
+        if not self.started or self.finished:
+            return b""
+        self.finished = True
+        return self._clean_refs(data)
+
+    @staticmethod
+    def _clean_refs(data):
+        if b"&#" in data:
+            data = _INVALID_REF_BYTES_RE.sub(b"", data)
+        return data
+
+def sanitize_xml_chunks(chunks):
+    """Sanitize an iterable of byte chunks; yields cleaned chunks."""
+    sanitizer = XmlByteSanitizer()
+    for chunk in chunks:
+        cleaned = sanitizer.feed(chunk)
+        if cleaned:
+            yield cleaned
+    tail = sanitizer.finish()
+    if tail:
+        yield tail